@@ -0,0 +1,237 @@
+"""Auto-responders: answer buyer bids on behalf of producers who configured one.
+
+A background tick loads up to AGENT_BATCH negotiations awaiting a producer
+answer, evaluates all of them at once with NumPy (``decide``) and applies the
+result: counters go out in one executemany UPDATE, accepts go through
+negotiations.accept so they reserve stock and place the order exactly like a
+manual accept. Decisions use the offer's list price and stock, the producer's
+AutoResponder settings and whether the buyer has ordered from them before.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, func, insert, or_
+from sqlmodel import Session, col, select
+
+import negotiations
+import settings
+from auth import CurrentPrincipal
+from database import engine
+from models import AutoResponder, Bid, Negotiation, NegotiationStatus, Offer, Order, UserRole
+from schemas import NegotiationPublic
+
+AGENT_TICK_SECONDS = settings.get_float("AGENT_TICK_SECONDS", 2)
+AGENT_BATCH = settings.get_int("AGENT_BATCH", 1000)
+
+NO_ANSWER, ACCEPT, COUNTER = 0, 1, 2
+
+logger = logging.getLogger(__name__)
+_worker: Optional[asyncio.Task] = None
+_totals = Counter()
+
+
+def decide(bid, quantity, list_price, stock, rounds, reserve_ratio, concession_exponent, max_rounds,
+           volume_threshold, volume_discount, repeat_buyer, repeat_buyer_discount):
+    """Evaluate the strategy for many bids at once; every argument is a 1-D array, one entry per bid.
+
+    ``rounds`` is how many times the producer already countered; ``volume_threshold``
+    is inf where unset. Returns (action, price, quantity) arrays, where price and
+    quantity are the counter terms for COUNTER rows.
+    """
+    discount = np.where(quantity >= volume_threshold, volume_discount, 0.0)
+    discount = 1 - (1 - discount) * (1 - np.where(repeat_buyer, repeat_buyer_discount, 0.0))
+    reserve = np.round(list_price * reserve_ratio * (1 - discount), 2)
+    # Position on the concession curve after this answer: 0 = list price, 1 = reserve.
+    progress = np.minimum((rounds + 1) / max_rounds, 1.0) ** (1 / concession_exponent)
+    ask = np.maximum(np.round(list_price - (list_price - reserve) * progress, 2), reserve)
+
+    available = np.minimum(quantity, stock)
+    in_stock = available == quantity
+    acceptable = (bid >= ask) | ((bid >= reserve) & (rounds + 1 >= max_rounds))
+    action = np.where(available <= 0, NO_ANSWER, np.where(acceptable & in_stock, ACCEPT, COUNTER))
+    # Never counter below what the buyer already offered (happens when only the quantity is cut).
+    price = np.maximum(ask, np.where(acceptable, bid, 0.0))
+    return action, price, available
+
+
+def _pending_stmt(now: datetime, limit: int):
+    rounds = (
+        select(func.count(Bid.id))
+        .where(Bid.negotiation_id == Negotiation.id, Bid.author_role == UserRole.PRODUCER)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            *(getattr(Negotiation, name) for name in negotiations.COLUMNS),
+            Offer.unit_price.label("list_price"),
+            Offer.quantity.label("stock"),
+            rounds.label("rounds"),
+            AutoResponder.reserve_ratio,
+            AutoResponder.concession_exponent,
+            AutoResponder.max_rounds,
+            AutoResponder.volume_threshold,
+            AutoResponder.volume_discount,
+            AutoResponder.repeat_buyer_discount,
+        )
+        .join(Offer, Offer.id == Negotiation.offer_id)
+        .join(AutoResponder, AutoResponder.producer_id == Negotiation.producer_id)
+        .where(
+            col(Negotiation.status).in_(negotiations.OPEN_STATUSES),
+            Negotiation.last_bid_by == UserRole.BUYER,
+            Negotiation.expires_at > now,
+            AutoResponder.enabled == True,
+            # Sold-out offers get no answer; keeping them out stops them from
+            # filling every batch until they expire.
+            Offer.active == True,
+            Offer.quantity > 0,
+        )
+        .order_by(Negotiation.updated_at)
+        .limit(limit)
+    )
+
+
+def _repeat_buyers(session: Session, rows) -> set:
+    buyers = {r.buyer_id for r in rows if r.repeat_buyer_discount}
+    if not buyers:
+        return set()
+    stmt = (
+        select(Order.buyer_id, Offer.producer_id)
+        .join(Offer, Offer.id == Order.offer_id)
+        .where(col(Order.buyer_id).in_(buyers))
+        .distinct()
+    )
+    return set(session.exec(stmt).all())
+
+
+def _apply_counters(session: Session, counters: list, now: datetime) -> list:
+    """Write (counter, seen_updated_at) pairs, each guarded by the updated_at we evaluated.
+
+    Returns the counters that applied.
+    """
+    table = Negotiation.__table__
+    stmt = (
+        table.update()
+        .where(
+            table.c.id == bindparam("b_id"),
+            table.c.updated_at == bindparam("b_seen"),
+            table.c.last_bid_by == UserRole.BUYER,
+            # Not in_(): expanding IN parameters cannot be used with executemany.
+            or_(*(table.c.status == status for status in negotiations.OPEN_STATUSES)),
+        )
+        .values(
+            status=NegotiationStatus.COUNTERED,
+            unit_price=bindparam("b_price"),
+            quantity=bindparam("b_quantity"),
+            last_bid_by=UserRole.PRODUCER,
+            expires_at=bindparam("b_expires"),
+            updated_at=now,
+        )
+    )
+    params = [
+        {"b_id": c.id, "b_seen": seen, "b_price": c.unit_price, "b_quantity": c.quantity, "b_expires": c.expires_at}
+        for c, seen in counters
+    ]
+    conn = session.connection()
+    if conn.execute(stmt, params).rowcount == len(params):
+        applied = [c for c, _ in counters]
+    else:
+        # A buyer or producer acted on some of them meanwhile: redo one by one to learn which.
+        session.rollback()
+        conn = session.connection()
+        applied = [c for (c, _), p in zip(counters, params) if conn.execute(stmt, p).rowcount == 1]
+    if applied:
+        conn.execute(insert(Bid), [{
+            "negotiation_id": c.id, "author_id": c.producer_id, "author_role": UserRole.PRODUCER,
+            "quantity": c.quantity, "unit_price": c.unit_price, "created_at": now,
+        } for c in applied])
+    session.commit()
+    return applied
+
+
+def run_tick(limit: int = AGENT_BATCH, bind=None) -> dict:
+    """Answer one batch of pending bids; returns counts and how long ``decide`` took."""
+    now = datetime.utcnow()
+    with Session(bind or engine) as session:
+        rows = session.exec(_pending_stmt(now, limit)).all()
+        if not rows:
+            return {"evaluated": 0, "accepted": 0, "countered": 0, "decide_ms": 0.0}
+        repeat = _repeat_buyers(session, rows)
+        t0 = time.perf_counter()
+        action, price, quantity = decide(
+            bid=np.fromiter((r.unit_price for r in rows), float, len(rows)),
+            quantity=np.fromiter((r.quantity for r in rows), np.int64, len(rows)),
+            list_price=np.fromiter((r.list_price for r in rows), float, len(rows)),
+            stock=np.fromiter((r.stock for r in rows), np.int64, len(rows)),
+            rounds=np.fromiter((r.rounds for r in rows), np.int64, len(rows)),
+            reserve_ratio=np.fromiter((r.reserve_ratio for r in rows), float, len(rows)),
+            concession_exponent=np.fromiter((r.concession_exponent for r in rows), float, len(rows)),
+            max_rounds=np.fromiter((r.max_rounds for r in rows), np.int64, len(rows)),
+            volume_threshold=np.fromiter((r.volume_threshold or np.inf for r in rows), float, len(rows)),
+            volume_discount=np.fromiter((r.volume_discount for r in rows), float, len(rows)),
+            repeat_buyer=np.fromiter(((r.buyer_id, r.producer_id) in repeat for r in rows), bool, len(rows)),
+            repeat_buyer_discount=np.fromiter((r.repeat_buyer_discount for r in rows), float, len(rows)),
+        )
+        decide_ms = (time.perf_counter() - t0) * 1000
+
+        expires_at = negotiations.expiry(now)
+        counters = [
+            (NegotiationPublic(**{
+                **{name: getattr(r, name) for name in negotiations.COLUMNS},
+                "status": NegotiationStatus.COUNTERED, "unit_price": float(price[i]), "quantity": int(quantity[i]),
+                "last_bid_by": UserRole.PRODUCER, "expires_at": expires_at, "updated_at": now,
+            }), r.updated_at)
+            for i, r in enumerate(rows) if action[i] == COUNTER
+        ]
+        countered = _apply_counters(session, counters, now) if counters else []
+        for counter in countered:
+            negotiations.publish(counter)
+
+        accepted = 0
+        for i, r in enumerate(rows):
+            if action[i] != ACCEPT:
+                continue
+            try:
+                negotiations.accept(session, r.id, CurrentPrincipal(id=r.producer_id, role=UserRole.PRODUCER))
+                accepted += 1
+            except HTTPException:
+                # Answered, expired or sold out since we loaded it.
+                session.rollback()
+
+    result = {"evaluated": len(rows), "accepted": accepted, "countered": len(countered), "decide_ms": decide_ms}
+    _totals.update({k: v for k, v in result.items() if k != "decide_ms"})
+    return result
+
+
+def stats() -> dict:
+    return dict(_totals)
+
+
+async def _respond_forever() -> None:
+    while True:
+        try:
+            result = await run_in_threadpool(run_tick)
+            if result["evaluated"] == AGENT_BATCH:
+                continue  # more pending bids: go again straight away
+        except Exception:
+            logger.exception("auto-responder tick failed")
+        await asyncio.sleep(AGENT_TICK_SECONDS)
+
+
+def start_agents() -> None:
+    global _worker
+    if _worker is None and AGENT_TICK_SECONDS > 0:
+        _worker = asyncio.get_running_loop().create_task(_respond_forever())
+
+
+def stop_agents() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        _worker = None
@@ -1,85 +1,197 @@
-import os
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlalchemy.util import await_only
 from sqlmodel import Session
 
-from database import get_session
+from cache import TTLCache
+import hashing
+import settings
+from database import DB_ASYNC, get_session
 from models import User, UserRole
-from dotenv import load_dotenv
+from schemas import UserPublic
+
+JWT_SECRET = settings.get("JWT_SECRET", "change-me")
+JWT_ALG = settings.get("JWT_ALG", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.get_int("ACCESS_TOKEN_EXPIRE_MINUTES", 120)
+# Lifetime of the single-purpose tokens that open GET /api/events (see create_events_ticket).
+EVENTS_TICKET_SECONDS = settings.get_int("EVENTS_TICKET_SECONDS", 30)
+EVENTS_TICKET = "events"
+USER_CACHE_SIZE = settings.get_int("USER_CACHE_SIZE", 10000)
+USER_CACHE_TTL_SECONDS = settings.get_float("USER_CACHE_TTL_SECONDS", 300)
+# Password hashing runs in a separate process pool so a login burst cannot pin
+# the request workers. 0 workers hashes inline. At most PASSWORD_HASH_QUEUE
+# hashes may be running or waiting; beyond that requests get 503 + Retry-After.
+PASSWORD_HASH_WORKERS = settings.get_int("PASSWORD_HASH_WORKERS", 2)
+PASSWORD_HASH_QUEUE = settings.get_int("PASSWORD_HASH_QUEUE", max(1, PASSWORD_HASH_WORKERS) * 4)
+PASSWORD_HASH_RETRY_AFTER = settings.get("PASSWORD_HASH_RETRY_AFTER", "1")
 
-load_dotenv()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
-JWT_ALG = os.getenv("JWT_ALG", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "120"))
+# User records for endpoints that need more than the token claims (e.g. /me).
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
 
-# Use bcrypt_sha256 to avoid the 72-byte password length limit of raw bcrypt.
-pwd_ctx = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+@dataclass(frozen=True)
+class CurrentPrincipal:
+    """Authenticated caller as described by the token claims; built without a DB query."""
+
+    id: int
+    role: UserRole
 
 
-def hash_password(plain: str) -> str:
-    return pwd_ctx.hash(plain)
+_hash_executor: Optional[ProcessPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE)
 
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_ctx.verify(plain, hashed)
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            # Not fork: forking a threaded server can copy a lock (logging, pool,
+            # caches) mid-acquire and deadlock the child. forkserver children start
+            # from a clean process with only the hashing module preloaded.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["hashing"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _hash_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=context)
+        return _hash_executor
+
+
+def shutdown_hash_executor() -> None:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(cancel_futures=True)
+            _hash_executor = None
+
+
+def _run_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service busy, retry later",
+            headers={"Retry-After": PASSWORD_HASH_RETRY_AFTER},
+        )
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            return fn(*args)
+        future = _get_hash_executor().submit(fn, *args)
+        if DB_ASYNC:
+            # Async-mode handlers run in a greenlet on the event loop: await instead of blocking it.
+            return await_only(asyncio.wrap_future(future))
+        return future.result()
+    finally:
+        _hash_slots.release()
+
+
+def hash_password_offloaded(plain: str) -> str:
+    return _run_hashing(hashing.hash_password, plain)
+
+
+def verify_password_offloaded(plain: str, hashed: str):
+    """Returns (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
+    return _run_hashing(hashing.verify_and_rehash, plain, hashed)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
+    # JWT requires "sub" to be a string.
+    if "sub" in to_encode:
+        to_encode["sub"] = str(to_encode["sub"])
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALG)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session),
-) -> User:
-    cred_exc = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+def create_user_token(user: User) -> str:
+    return create_access_token({"sub": user.id, "role": user.role.value})
+
+
+def create_events_ticket(principal: CurrentPrincipal) -> str:
+    """Short-lived token that only opens the event stream.
+
+    EventSource cannot send headers, so the stream is authenticated from the
+    URL; a ticket there is harmless once expired, unlike an access token.
+    """
+    return create_access_token(
+        {"sub": principal.id, "role": principal.role.value, "typ": EVENTS_TICKET},
+        timedelta(seconds=EVENTS_TICKET_SECONDS),
+    )
+
+
+def decode_principal(token: str, purpose: Optional[str] = None) -> CurrentPrincipal:
+    """Claims of a valid token; ``purpose`` must match its "typ" (None for access tokens)."""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        sub = payload.get("sub")
-        if sub is None:
-            raise cred_exc
-        try:
-            user_id = int(sub)
-        except (TypeError, ValueError):
-            raise cred_exc
-    except JWTError:
-        raise cred_exc
-
-    user = session.get(User, user_id)
+        if payload.get("typ") != purpose:
+            raise ValueError("wrong token type")
+        return CurrentPrincipal(id=int(payload["sub"]), role=UserRole(payload["role"]))
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+def get_current_principal(token: str = Depends(oauth2_scheme)) -> CurrentPrincipal:
+    return decode_principal(token)
+
+
+def get_current_user(
+    principal: CurrentPrincipal = Depends(get_current_principal),
+    session: Session = Depends(get_session),
+) -> UserPublic:
+    cached = user_cache.get(principal.id)
+    if cached is not None:
+        return cached
+    user = session.get(User, principal.id)
     if not user:
-        raise cred_exc
-    return user
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    record = UserPublic(id=user.id, email=user.email, role=user.role, created_at=user.created_at)
+    user_cache.set(user.id, record)
+    return record
+
+
+def invalidate_user(user_id: int) -> None:
+    user_cache.delete(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User) -> None:
+    invalidate_user(target.id)
 
 
 def require_role(role: UserRole):
-    def _dep(user: User = Depends(get_current_user)) -> User:
-        if user.role != role:
+    def _dep(principal: CurrentPrincipal = Depends(get_current_principal)) -> CurrentPrincipal:
+        if principal.role != role:
             raise HTTPException(status_code=403, detail="Forbidden")
-        return user
+        return principal
 
     return _dep
 
 
 def require_offer_owner(
     offer_id: int,
-    user: User = Depends(get_current_user),
+    principal: CurrentPrincipal = Depends(get_current_principal),
     session: Session = Depends(get_session),
-) -> User:
+):
+    """Load the offer and check the caller owns it; returns the offer so routes need not reload it."""
     from models import Offer
 
     offer = session.get(Offer, offer_id)
     if not offer:
         raise HTTPException(status_code=404, detail="Not found")
-    if offer.producer_id != user.id:
+    if offer.producer_id != principal.id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    return user
+    return offer
@@ -0,0 +1,176 @@
+"""Replay synthetic buyer bid streams against the auto-responder and report decisions/s.
+
+Run from the api/ directory:
+
+    python -m bench.agent_sim --offers 20000 --ticks 20 --bids-per-tick 2000
+
+Every tick, buyers open --bids-per-tick new negotiations and re-bid on the
+producer's open counters, then agents.run_tick answers everything pending.
+Also compares the vectorized ``decide`` with a per-bid Python loop.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import bindparam, insert, select
+
+import agents
+import negotiations
+from bench.data import PRODUCER_ID, build_db, buyer_id
+from models import AutoResponder, Bid, Negotiation, NegotiationStatus, Offer, UserRole
+
+BUYERS = 200
+
+
+def decide_scalar(bid, quantity, list_price, stock, rounds, reserve_ratio, concession_exponent, max_rounds,
+                  volume_threshold, volume_discount, repeat_buyer, repeat_buyer_discount):
+    """agents.decide for a single bid, the way a per-bid implementation would do it."""
+    discount = volume_discount if quantity >= volume_threshold else 0.0
+    discount = 1 - (1 - discount) * (1 - (repeat_buyer_discount if repeat_buyer else 0.0))
+    reserve = round(list_price * reserve_ratio * (1 - discount), 2)
+    progress = min((rounds + 1) / max_rounds, 1.0) ** (1 / concession_exponent)
+    ask = max(round(list_price - (list_price - reserve) * progress, 2), reserve)
+    available = min(quantity, stock)
+    acceptable = bid >= ask or (bid >= reserve and rounds + 1 >= max_rounds)
+    if available <= 0:
+        action = agents.NO_ANSWER
+    elif acceptable and available == quantity:
+        action = agents.ACCEPT
+    else:
+        action = agents.COUNTER
+    return action, max(ask, bid if acceptable else 0.0), available
+
+
+def compare_decide(n: int) -> None:
+    rnd = np.random.default_rng(0)
+    list_price = rnd.uniform(1, 2000, n).round(2)
+    args = dict(
+        bid=(list_price * rnd.uniform(0.6, 1.05, n)).round(2),
+        quantity=rnd.integers(1, 200, n),
+        list_price=list_price,
+        stock=rnd.integers(0, 1000, n),
+        rounds=rnd.integers(0, 4, n),
+        reserve_ratio=np.full(n, 0.85),
+        concession_exponent=rnd.choice([0.5, 1.0, 2.0], n),
+        max_rounds=np.full(n, 3),
+        volume_threshold=np.where(rnd.random(n) < 0.5, 100.0, np.inf),
+        volume_discount=np.full(n, 0.05),
+        repeat_buyer=rnd.random(n) < 0.3,
+        repeat_buyer_discount=np.full(n, 0.02),
+    )
+    t0 = time.perf_counter()
+    action, price, quantity = agents.decide(**args)
+    vectorized = time.perf_counter() - t0
+    columns = [a.tolist() for a in args.values()]
+    t0 = time.perf_counter()
+    scalar = [decide_scalar(*row) for row in zip(*columns)]
+    looped = time.perf_counter() - t0
+    assert [a for a, _, _ in scalar] == action.tolist()
+    # np.round and round() may disagree by a cent on halves.
+    assert all(math.isclose(p, q, abs_tol=0.0101) for (_, p, _), q in zip(scalar, price.tolist()))
+    print(f"decide() on {n} bids: vectorized {n / vectorized:,.0f}/s, per-bid loop {n / looped:,.0f}/s "
+          f"({looped / vectorized:.0f}x)")
+
+
+def open_bids(conn, rnd: random.Random, offers: dict, count: int, now: datetime) -> None:
+    table = Negotiation.__table__
+    rows = []
+    for _ in range(count):
+        offer_id = rnd.randint(1, len(offers))
+        rows.append({
+            "offer_id": offer_id, "buyer_id": buyer_id(rnd.randrange(BUYERS)), "producer_id": PRODUCER_ID,
+            "status": NegotiationStatus.PROPOSED, "quantity": rnd.randint(1, 150),
+            "unit_price": round(offers[offer_id] * rnd.uniform(0.6, 1.02), 2), "last_bid_by": UserRole.BUYER,
+            "expires_at": now + timedelta(hours=1), "created_at": now, "updated_at": now,
+        })
+    ids = sorted(conn.execute(insert(table).returning(table.c.id), rows).scalars().all())
+    conn.execute(insert(Bid), [{
+        "negotiation_id": i, "author_id": r["buyer_id"], "author_role": UserRole.BUYER,
+        "quantity": r["quantity"], "unit_price": r["unit_price"], "created_at": now,
+    } for i, r in zip(ids, rows)])
+
+
+def rebid(conn, rnd: random.Random, now: datetime) -> int:
+    """Buyers answer the producer's counters by meeting them halfway."""
+    table = Negotiation.__table__
+    countered = conn.execute(
+        select(table.c.id, table.c.buyer_id, table.c.quantity, table.c.unit_price)
+        .where(table.c.status == NegotiationStatus.COUNTERED, table.c.last_bid_by == UserRole.PRODUCER)
+    ).all()
+    if not countered:
+        return 0
+    last_buyer_bid = dict(conn.execute(
+        select(Bid.negotiation_id, Bid.unit_price)
+        .where(Bid.author_role == UserRole.BUYER, Bid.negotiation_id.in_([r.id for r in countered]))
+        .order_by(Bid.id)
+    ).all())
+    params = [{"b_id": r.id, "b_price": round((r.unit_price + last_buyer_bid[r.id]) / 2 * rnd.uniform(0.97, 1.0), 2)}
+              for r in countered]
+    conn.execute(
+        table.update().where(table.c.id == bindparam("b_id"))
+        .values(unit_price=bindparam("b_price"), last_bid_by=UserRole.BUYER, updated_at=now),
+        params,
+    )
+    conn.execute(insert(Bid), [{
+        "negotiation_id": p["b_id"], "author_id": r.buyer_id, "author_role": UserRole.BUYER,
+        "quantity": r.quantity, "unit_price": p["b_price"], "created_at": now,
+    } for p, r in zip(params, countered)])
+    return len(params)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=20000)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--bids-per-tick", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=agents.AGENT_BATCH)
+    parser.add_argument("--compare", type=int, default=200000, help="bids for the decide() comparison")
+    args = parser.parse_args()
+
+    compare_decide(args.compare)
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_db(os.path.join(tmp, "sim.db"), args.offers, buyers=BUYERS, orders=args.offers)
+        with engine.begin() as conn:
+            conn.execute(insert(AutoResponder).values(
+                producer_id=PRODUCER_ID, reserve_ratio=0.85, concession_exponent=0.7, max_rounds=3,
+                volume_threshold=100, volume_discount=0.05, repeat_buyer_discount=0.02,
+            ))
+            offers = dict(conn.execute(select(Offer.id, Offer.unit_price)).all())
+
+        latencies, decide_ms, totals = [], 0.0, {"evaluated": 0, "accepted": 0, "countered": 0}
+        rebids = 0
+        for _ in range(args.ticks):
+            now = datetime.utcnow()
+            with engine.begin() as conn:
+                open_bids(conn, rnd, offers, args.bids_per_tick, now)
+                rebids += rebid(conn, rnd, now)
+            while True:
+                t0 = time.perf_counter()
+                result = agents.run_tick(limit=args.batch, bind=engine)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                decide_ms += result["decide_ms"]
+                for key in totals:
+                    totals[key] += result[key]
+                if result["evaluated"] < args.batch:
+                    break
+        expired = negotiations.expire_due(bind=engine)
+        engine.dispose()
+
+    latencies.sort()
+    busy = sum(latencies) / 1000
+    print(f"{args.ticks} ticks, {args.ticks * args.bids_per_tick} new bids, {rebids} re-bids, {expired} expired")
+    print(f"decisions: {totals['evaluated']} ({totals['accepted']} accepted, {totals['countered']} countered)")
+    print(f"end to end: {totals['evaluated'] / busy:,.0f} decisions/s, batch p50 {statistics.median(latencies):.1f} ms, "
+          f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.1f} ms; "
+          f"decide() share {decide_ms / 1000 / busy:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Worker cold start: time from spawning uvicorn to its first 200 from /api/health.
+
+Run from the api/ directory:
+
+    python -m bench.cold_start --offers 100000 --runs 7 --target 2.5
+
+Builds a migrated synthetic database once, then starts fresh workers against
+it one after another and reports the median and worst ready time, plus how
+much of it is importing the app and running its startup hooks. Exits non-zero
+when the median misses --target seconds, so it can gate a deploy pipeline.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.data import build_db
+from bench.load_test import API_DIR, free_port
+
+# Run in a child so nothing is imported yet.
+PROFILE = """
+import asyncio, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        print(t1 - t0, time.perf_counter() - t1)
+asyncio.run(startup())
+"""
+
+
+def ready_time(env: dict) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], cwd=API_DIR, env=env,
+    )
+    # One client for all polls: building one per request loads CA certificates and steals CPU from the worker.
+    with httpx.Client() as client:
+        try:
+            while time.perf_counter() - started < 60:
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/api/health").status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            raise RuntimeError("server did not start")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--target", type=float, default=2.5, help="median ready time to meet, in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cold.db")
+        build_db(db_path, args.offers).dispose()
+        env = dict(os.environ, DB_URL=f"sqlite:///{db_path}", AGENT_TICK_SECONDS="0")
+
+        phases = [
+            tuple(map(float, subprocess.run([sys.executable, "-c", PROFILE], cwd=API_DIR, env=env, check=True,
+                                            capture_output=True, text=True).stdout.split()))
+            for _ in range(args.runs)
+        ]
+        ready = [ready_time(env) for _ in range(args.runs)]
+
+    median = statistics.median(ready)
+    print(f"{args.offers} offers, {args.runs} runs")
+    print(f"import app      median {statistics.median(p[0] for p in phases):.3f} s")
+    print(f"startup hooks   median {statistics.median(p[1] for p in phases):.3f} s")
+    print(f"ready (uvicorn) median {median:.2f} s, worst {max(ready):.2f} s, target {args.target:.2f} s")
+    if median > args.target:
+        sys.exit(f"cold start target missed by {median - args.target:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
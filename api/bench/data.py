@@ -0,0 +1,158 @@
+"""Synthetic marketplace used by the benchmarks and by ``python seed.py --offers N``.
+
+Producers, buyers, offers and orders are bulk-inserted after whatever the
+database already holds (no ORM, no per-row index upkeep), then the search,
+geo and facet indexes are brought up to date once. Offers follow CATALOG:
+each product has its own unit and typical price, prices are log-normal around
+it, categories and locations are weighted, a few producers list most of the
+offers and a minority of offers is priced in EUR or USD.
+"""
+import json
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, insert, select
+from sqlmodel import create_engine
+
+import facets
+import geo
+import migrate
+import search
+from models import FxRate, Offer, Order, User, UserRole
+
+# (product, category, unit, typical price in PLN, share of offers)
+CATALOG = [
+    ("Pellet sosnowy A1", "Fuel", "kg", 1.20, 8),
+    ("Brykiet dębowy premium", "Fuel", "kg", 1.45, 4),
+    ("Stal pręt 12mm", "Steel", "pcs", 9.99, 6),
+    ("Blacha trapezowa T18", "Steel", "m2", 32.00, 5),
+    ("Kruszywo granitowe 8-16", "Construction", "t", 115.00, 6),
+    ("Cement portlandzki CEM I 42,5R", "Construction", "kg", 0.68, 6),
+    ("Pszenica konsumpcyjna", "Agricultural", "t", 980.00, 5),
+    ("Granulat PP homo", "Plastics", "kg", 4.90, 4),
+    ("Łożyska kulkowe 6204", "Hardware", "pcs", 6.30, 3),
+    ("Kabel YDYp 3x2,5", "Electrical", "m", 3.20, 4),
+    ("Deska tarasowa modrzew", "Timber", "m2", 74.50, 3),
+    ("Rzepak wysokoolejowy", "Agricultural", "t", 2200.00, 2),
+    ("Olej rzepakowy techniczny", "Chemical", "l", 5.40, 2),
+    ("Palety drewniane EUR", "Logistics", "pcs", 32.00, 3),
+    ("Tkanina bawełniana 160g", "Textile", "m", 12.50, 2),
+    ("Panel fotowoltaiczny 450W", "Electrical", "pcs", 710.00, 2),
+    ("Kartony klapowe 600x400x400", "Packaging", "pcs", 2.10, 3),
+]
+PRODUCTS = [(name, category) for name, category, *_ in CATALOG]
+# Roughly by market size.
+LOCATION_WEIGHTS = {
+    "Warszawa": 24, "Kraków": 13, "Wrocław": 11, "Poznań": 10, "Gdańsk": 10, "Łódź": 10, "Katowice": 12, "Lublin": 10,
+}
+LOCATIONS = list(LOCATION_WEIGHTS)
+CURRENCY_WEIGHTS = {"PLN": 85, "EUR": 10, "USD": 5}
+PRICE_SPREAD = 0.35  # sigma of ln(price / typical price)
+BATCH = 10_000
+
+# Ids in a fresh database: the first producer, then the buyers, then any other producers.
+PRODUCER_ID = 1
+BENCH_EMAIL = "bench@example.com"
+
+
+def buyer_id(n: int) -> int:
+    """Id of the n-th synthetic buyer (0-based) in a database built by build_db."""
+    return PRODUCER_ID + 1 + n
+
+
+def _rates(conn) -> dict:
+    """Stored exchange rates; a fresh database gets the FX_RATES_FILE ones."""
+    stored = dict(conn.execute(select(FxRate.currency, FxRate.rate)).all())
+    if stored:
+        return stored
+    # Imported here: fx pulls in the app's database module.
+    import fx
+    with open(fx.FX_RATES_FILE, encoding="utf-8") as f:
+        rates = {fx.FX_BASE_CURRENCY: 1.0, **json.load(f)["rates"]}
+    conn.execute(insert(FxRate), [{"currency": c, "rate": r, "updated_at": datetime.utcnow()} for c, r in rates.items()])
+    return rates
+
+
+def populate(engine, offers: int, producers: int = 1, buyers: int = 0, orders: int = 0,
+             password_hash: str = "x", seed: Optional[int] = None) -> dict:
+    """Bulk-insert a synthetic marketplace; returns the id ranges it used."""
+    rnd = random.Random(offers if seed is None else seed)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        if conn.execute(select(User.id).where(User.email == BENCH_EMAIL)).first():
+            raise ValueError("synthetic data is already present")
+        first_user = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+        first_offer = (conn.execute(select(func.max(Offer.id))).scalar() or 0) + 1
+        producer_ids = [first_user] + [first_user + buyers + n for n in range(1, producers)]
+        buyer_ids = [first_user + 1 + n for n in range(buyers)]
+
+        users = [{"id": producer_ids[0], "email": BENCH_EMAIL, "role": UserRole.PRODUCER}]
+        users += [{"id": b, "email": f"buyer{n}@example.com", "role": UserRole.BUYER} for n, b in enumerate(buyer_ids)]
+        users += [{"id": p, "email": f"producer{n}@example.com", "role": UserRole.PRODUCER}
+                  for n, p in enumerate(producer_ids[1:], 1)]
+        for base in range(0, len(users), BATCH):
+            conn.execute(insert(User), [{**u, "password_hash": password_hash, "created_at": start}
+                                        for u in users[base:base + BATCH]])
+
+        rates = _rates(conn)
+        currencies = [c for c in CURRENCY_WEIGHTS if c in rates]
+        currency_weights = [CURRENCY_WEIGHTS[c] for c in currencies]
+        # Zipf-like: the n-th producer lists about 1/n as many offers as the first.
+        producer_weights = [1 / (n + 1) for n in range(producers)]
+        product_weights = [weight for *_, weight in CATALOG]
+        location_weights = list(LOCATION_WEIGHTS.values())
+        prices = []
+        for base in range(0, offers, BATCH):
+            rows = []
+            for i in range(base, min(base + BATCH, offers)):
+                name, category, unit, typical, _ = rnd.choices(CATALOG, product_weights)[0]
+                location = rnd.choices(LOCATIONS, location_weights)[0]
+                currency = rnd.choices(currencies, currency_weights)[0]
+                unit_price = round(typical * rnd.lognormvariate(0, PRICE_SPREAD) / rates[currency], 2) or 0.01
+                prices.append(unit_price)
+                created = start + timedelta(seconds=i)
+                rows.append({
+                    "id": first_offer + i, "producer_id": rnd.choices(producer_ids, producer_weights)[0],
+                    "product_name": f"{name} #{i}", "product_category": category,
+                    "sku": f"SKU-{first_offer + i:07d}", "description": f"Partia {i}, dostawa {location}",
+                    "quantity": max(1, int(rnd.lognormvariate(math.log(200), 1.0))), "unit_of_measure": unit,
+                    "unit_price": unit_price, "currency": currency,
+                    "unit_price_base": unit_price * rates[currency],  # same expression as fx.to_base
+                    "location": location, "active": True, "created_at": created, "updated_at": created,
+                })
+            conn.execute(insert(Offer), rows)
+        if buyers and offers:
+            for base in range(0, orders, BATCH):
+                rows = []
+                for i in range(base, min(base + BATCH, orders)):
+                    n = rnd.randrange(offers)
+                    rows.append({
+                        "buyer_id": rnd.choice(buyer_ids), "offer_id": first_offer + n,
+                        "quantity": rnd.randint(1, 10), "unit_price_snapshot": prices[n],
+                        "created_at": start + timedelta(seconds=i),
+                    })
+                conn.execute(insert(Order), rows)
+
+    # A fresh index is backfilled whole; an existing one only needs the new offers.
+    search.ensure_index(engine)
+    if first_offer > 1:
+        with engine.begin() as conn:
+            search.rebuild_index(conn, first_offer - 1)
+    geo.ensure_index(engine)
+    facets.ensure_index(engine)
+    return {
+        "producers": producer_ids, "buyers": (buyer_ids[0], buyer_ids[-1]) if buyer_ids else None,
+        "offers": (first_offer, first_offer + offers - 1) if offers else None,
+    }
+
+
+def build_db(path: str, size: int, buyers: int = 0, orders: int = 0, producers: int = 1):
+    """Fresh SQLite database at ``path`` holding a synthetic marketplace of ``size`` offers."""
+    engine = create_engine(f"sqlite:///{path}")
+    # Tables first; the shadow indexes are then backfilled in bulk rather than by triggers row by row.
+    migrate.upgrade(engine, 3)
+    populate(engine, size, producers=producers, buyers=buyers, orders=orders)
+    migrate.upgrade(engine)
+    return engine
@@ -0,0 +1,109 @@
+"""Facet latency: GET /api/offers/facets over a large catalog, summary table vs grouping the offers.
+
+Run from the api/ directory:
+
+    python -m bench.facets --offers 1000000 --queries 50
+
+Times the facet counts in-process for common filter sets, read from the
+offer_facet summary and, for comparison, grouped live over the offer table.
+Then times bulk price updates with and without the triggers that keep the
+summary current, to show what they cost writers.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import bindparam, case, text
+from sqlmodel import Session
+
+import facets
+import routes_offers
+from bench.data import build_db
+from bench.load_test import percentile
+from models import Offer
+
+FILTERS = [
+    ("no filters", {}),
+    ("category", {"category": "Steel"}),
+    ("category + location", {"category": "Steel", "location": "Kraków"}),
+    ("price on bucket edges", {"min_price": 100, "max_price": 500}),
+    ("price off the edges", {"min_price": 120, "max_price": 480}),
+    ("inactive", {"active": False}),
+    ("search q", {"q": "pellet"}),
+]
+
+
+def query(session: Session, live: bool, **kw) -> dict:
+    args = dict(q=None, category=None, min_price=None, max_price=None, location=None, near=None, radius_km=None,
+                active=True, currency=None)
+    args.update(kw)
+    if not live:
+        return routes_offers._count_facets(session, **args)
+    min_base, max_base = args["min_price"], args["max_price"]
+    rows = facets.from_offers(session, args["active"], min_base, max_base)
+    return facets.fold(rows, args["category"], args["location"])
+
+
+def reprice(engine, rows: int, rnd: random.Random) -> float:
+    table = Offer.__table__
+    stmt = table.update().where(table.c.id == bindparam("b_id")).values(unit_price_base=bindparam("b_price"))
+    params = [{"b_id": rnd.randint(1, rows), "b_price": round(rnd.uniform(0.5, 2000), 2)} for _ in range(100_000)]
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(stmt, params)
+    return len(params) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_db(os.path.join(tmp, "facets.db"), args.offers)
+        with engine.begin() as conn:
+            table = Offer.__table__
+            conn.execute(table.update().values(
+                currency=case((table.c.id % 3 == 1, "EUR"), (table.c.id % 3 == 2, "USD"), else_="PLN"),
+                active=table.c.id % 10 != 0,
+            ))
+            facets.rebuild(conn)
+            conn.execute(text("ANALYZE"))
+            summary_rows = conn.execute(text("SELECT count(*) FROM offer_facet")).scalar_one()
+        print(f"{args.offers} offers, {summary_rows} summary rows")
+
+        print(f"{'filters':<24} {'summary p50':>12} {'p99 ms':>8} {'live p50':>10} {'p99 ms':>8}")
+        with Session(engine) as session:
+            for label, kw in FILTERS:
+                timings = {}
+                # A search has no summary: the endpoint itself groups the matching offers.
+                for live in ((False,) if "q" in kw else (False, True)):
+                    runs = args.queries if not live else max(3, args.queries // 10)
+                    latencies = []
+                    for _ in range(runs):
+                        t0 = time.perf_counter()
+                        query(session, live, **kw)
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                    latencies.sort()
+                    timings[live] = latencies
+                if "q" not in kw:
+                    assert query(session, False, **kw)["total"] == query(session, True, **kw)["total"]
+                live = timings.get(True)
+                print(f"{label:<24} {percentile(timings[False], 0.50):>12.2f} {percentile(timings[False], 0.99):>8.2f} "
+                      + (f"{percentile(live, 0.50):>10.2f} {percentile(live, 0.99):>8.2f}" if live else f"{'-':>10} {'-':>8}"))
+
+        with_triggers = reprice(engine, args.offers, rnd)
+        with engine.begin() as conn:
+            for name in ("offer_facet_insert", "offer_facet_update", "offer_facet_delete"):
+                conn.execute(text(f"DROP TRIGGER {name}"))
+        without = reprice(engine, args.offers, rnd)
+        print(f"price updates: {with_triggers:,.0f} rows/s with facet triggers, {without:,.0f} rows/s without")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
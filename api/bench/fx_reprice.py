@@ -0,0 +1,73 @@
+"""Bulk re-pricing speed: offers/s when an exchange rate changes.
+
+Run from the api/ directory:
+
+    python -m bench.fx_reprice --offers 1000000
+
+The catalog is split evenly across PLN, EUR and USD. Times the first load of
+the rates (prices every offer), a change of the EUR rate (one set-based UPDATE
+over a third of the catalog) and, for contrast, the same EUR repricing done as
+a Python loop of per-row UPDATEs.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import bindparam, case, select, text
+
+import fx
+from bench.data import build_db
+from models import Offer
+
+RATES = {"PLN": 1.0, "EUR": 4.27, "USD": 3.94}
+
+
+def write_rates(path: str, **overrides: float) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"base": fx.FX_BASE_CURRENCY, "rates": {**RATES, **overrides}}, f)
+    return path
+
+
+def python_loop(engine, rate: float) -> tuple:
+    table = Offer.__table__
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        rows = conn.execute(select(table.c.id, table.c.unit_price).where(table.c.currency == "EUR")).all()
+        stmt = table.update().where(table.c.id == bindparam("b_id")).values(unit_price_base=bindparam("b_base"))
+        for offer_id, price in rows:
+            conn.execute(stmt, {"b_id": offer_id, "b_base": price * rate})
+    return len(rows), len(rows) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_db(os.path.join(tmp, "fx.db"), args.offers)
+        with engine.begin() as conn:
+            table = Offer.__table__
+            conn.execute(table.update().values(currency=case(
+                (table.c.id % 3 == 1, "EUR"), (table.c.id % 3 == 2, "USD"), else_="PLN",
+            )))
+            conn.execute(text("ANALYZE"))
+
+        for label, path in (
+            ("initial load", write_rates(os.path.join(tmp, "initial.json"))),
+            ("EUR rate change", write_rates(os.path.join(tmp, "eur.json"), EUR=4.31)),
+        ):
+            t0 = time.perf_counter()
+            result = fx.load_rates(path, bind=engine)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<18} {result['repriced']:>9} offers in {elapsed:6.2f} s  "
+                  f"{result['repriced'] / elapsed:>12,.0f} offers/s  (one UPDATE)")
+        count, rate = python_loop(engine, 4.35)
+        print(f"{'EUR, Python loop':<18} {count:>9} offers {'':>12}{rate:>12,.0f} offers/s")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
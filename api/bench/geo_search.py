@@ -0,0 +1,113 @@
+"""Radius search latency: GET /api/offers?near=...&radius_km=... over a large catalog.
+
+Run from the api/ directory:
+
+    python -m bench.geo_search --offers 1000000 --queries 200
+
+Offers are scattered around the gazetteer's towns (about 15 km spread), then
+the listing query runs in-process for several radii: sorted by distance (page
+picked from the R-tree alone), by newest and with a category filter (both read
+every offer in the radius). A few queries without the spatial index (distance
+computed for every offer) are timed for comparison.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import bindparam, text
+from sqlmodel import Session, col, select
+
+import geo
+import routes_offers
+from bench.data import BATCH, build_db
+from bench.load_test import percentile
+from models import Offer
+
+SPREAD_DEGREES = 0.14  # about 15 km
+
+
+def scatter(engine, size: int, rnd: random.Random) -> None:
+    towns = sorted(set(geo.gazetteer().values()))
+    table = Offer.__table__
+    stmt = table.update().where(table.c.id == bindparam("b_id")).values(
+        latitude=bindparam("b_lat"), longitude=bindparam("b_lon"),
+    )
+    with engine.begin() as conn:
+        for base in range(1, size + 1, BATCH):
+            params = []
+            for offer_id in range(base, min(base + BATCH, size + 1)):
+                lat, lon = rnd.choice(towns)
+                params.append({"b_id": offer_id, "b_lat": rnd.gauss(lat, SPREAD_DEGREES),
+                               "b_lon": rnd.gauss(lon, SPREAD_DEGREES)})
+            conn.execute(stmt, params)
+        conn.execute(text("DELETE FROM offer_geo"))
+        conn.execute(text(
+            "INSERT INTO offer_geo SELECT id, latitude, latitude, longitude, longitude, active FROM offer"
+        ))
+        conn.execute(text("ANALYZE"))
+
+
+def listing(session: Session, near: str, radius_km: float, sort: str, category=None) -> dict:
+    return routes_offers._query_offers(
+        session, q=None, category=category, min_price=None, max_price=None, location=None, near=near,
+        radius_km=radius_km, active=True, sort=sort, currency=None, limit=50, cursor=None, fields=None,
+    )
+
+
+def full_scan(session: Session, lat: float, lon: float, radius_km: float) -> int:
+    dy = (col(Offer.latitude) - lat) * geo.KM_PER_DEGREE
+    dx = (col(Offer.longitude) - lon) * (geo.KM_PER_DEGREE * math.cos(math.radians(lat)))
+    distance2 = dx * dx + dy * dy
+    stmt = (
+        select(Offer.id, distance2.label("d2"))
+        .where(Offer.active == True, distance2 <= radius_km * radius_km)
+        .order_by(distance2, col(Offer.id))
+        .limit(50)
+    )
+    return len(session.exec(stmt).all())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radii", default="10,50,100,300")
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    towns = sorted(geo.gazetteer().values())
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_db(os.path.join(tmp, "geo.db"), args.offers)
+        scatter(engine, args.offers, rnd)
+        print(f"{'radius km':>9} {'sort':<12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'avg hits':>9}")
+        with Session(engine) as session:
+            for radius in (float(r) for r in args.radii.split(",")):
+                for sort, category in (("distance", None), ("newest", None), ("distance", "Steel")):
+                    latencies, hits = [], []
+                    for _ in range(args.queries):
+                        lat, lon = rnd.choice(towns)
+                        t0 = time.perf_counter()
+                        page = listing(session, f"{lat},{lon}", radius, sort, category)
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                        hits.append(len(page["items"]))
+                    latencies.sort()
+                    label = f"{sort}+cat" if category else sort
+                    print(f"{radius:>9.0f} {label:<12} {percentile(latencies, 0.50):>8.2f} "
+                          f"{percentile(latencies, 0.95):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+                          f"{statistics.mean(hits):>9.1f}")
+            scans = []
+            for _ in range(5):
+                lat, lon = rnd.choice(towns)
+                t0 = time.perf_counter()
+                full_scan(session, lat, lon, 100.0)
+                scans.append((time.perf_counter() - t0) * 1000)
+            print(f"no spatial index, 100 km: {statistics.median(scans):.1f} ms per query")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Load-test /api/offers and /api/orders/mine with the app in sync and async DB mode.
+
+Run from the api/ directory (needs httpx, see bench/requirements.txt):
+
+    python -m bench.load_test --offers 100000 --concurrency 64 --duration 15
+
+Each mode gets a fresh uvicorn process on a throw-away copy of a synthetic database.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from auth import create_access_token
+from bench.data import build_db, buyer_id
+from models import UserRole
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUYERS = 50
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path: str, port: int, **settings: str) -> subprocess.Popen:
+    # Load comes from one IP and measures capacity: rate limiting and load shedding stay off unless asked for.
+    env = {"RATE_LIMIT_PER_SECOND": "0", "ADMISSION_MAX_CONCURRENT": "0", **os.environ, "DB_URL": f"sqlite:///{db_path}", **settings}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR, env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/health").status_code == 200:
+                return proc
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def percentile(samples, pct: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * pct))] if samples else 0.0
+
+
+async def run_scenario(
+    base_url: str, path: str, tokens, concurrency: int, duration: float, method: str = "GET", bodies=None,
+) -> dict:
+    """Hit ``path`` from ``concurrency`` workers for ``duration`` seconds.
+
+    ``tokens`` / ``bodies`` are optional per-worker bearer tokens and JSON bodies (used round-robin).
+    """
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        headers = {"Authorization": f"Bearer {tokens[n % len(tokens)]}"} if tokens else {}
+        body = bodies[n % len(bodies)] if bodies else None
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(method, path, headers=headers, json=body)
+                code = resp.status_code
+            except httpx.HTTPError:
+                code = "error"
+            statuses[code] += 1
+            if code == 200:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "errors": sum(count for code, count in statuses.items() if code != 200),
+        "statuses": dict(statuses),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    tokens = [create_access_token({"sub": buyer_id(n), "role": UserRole.BUYER.value}) for n in range(BUYERS)]
+    scenarios = [("/api/offers?limit=50", None), ("/api/orders/mine", tokens)]
+
+    print(f"{'mode':>6} {'endpoint':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_db(template, args.offers, buyers=BUYERS, orders=args.orders).dispose()
+        for mode in args.modes.split(","):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(template, db_path)
+            port = free_port()
+            proc = start_server(db_path, port, DB_ASYNC="1" if mode == "async" else "0")
+            try:
+                for path, auth in scenarios:
+                    r = asyncio.run(run_scenario(f"http://127.0.0.1:{port}", path, auth, args.concurrency, args.duration))
+                    print(f"{mode:>6} {path.split('?')[0]:<22} {r['rps']:>8.0f} {r['p50']:>8.1f} "
+                          f"{r['p95']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Login throughput and /api/offers latency during a concurrent login storm.
+
+Compares hashing inline in the request workers (PASSWORD_HASH_WORKERS=0)
+with the bounded process pool. Run from the api/ directory:
+
+    python -m bench.login_storm --logins 64 --readers 16 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import update
+
+from bench.data import build_db
+from bench.load_test import free_port, run_scenario, start_server
+from hashing import hash_password
+from models import User, UserRole
+
+PASSWORD = "Passw0rd!"
+BUYERS = 20
+
+
+async def storm(base_url: str, args) -> tuple:
+    bodies = [{"email": f"buyer{n}@example.com", "password": PASSWORD} for n in range(BUYERS)]
+    return await asyncio.gather(
+        run_scenario(base_url, "/api/auth/login", None, args.logins, args.duration, method="POST", bodies=bodies),
+        run_scenario(base_url, "/api/offers?limit=50", None, args.readers, args.duration),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=20000)
+    parser.add_argument("--logins", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=16, help="concurrent /api/offers clients")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", default="2", help="PASSWORD_HASH_WORKERS for the pooled run")
+    args = parser.parse_args()
+
+    print(f"{'hashing':>8} {'logins/s':>9} {'503s':>6} {'offers req/s':>13} {'offers p50':>11} {'offers p99':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        engine = build_db(template, args.offers, buyers=BUYERS)
+        with engine.begin() as conn:
+            conn.execute(update(User).where(User.role == UserRole.BUYER).values(password_hash=hash_password(PASSWORD)))
+        engine.dispose()
+        for label, workers in (("inline", "0"), ("pool", args.workers)):
+            db_path = os.path.join(tmp, f"{label}.db")
+            shutil.copy(template, db_path)
+            port = free_port()
+            proc = start_server(db_path, port, PASSWORD_HASH_WORKERS=workers)
+            try:
+                logins, offers = asyncio.run(storm(f"http://127.0.0.1:{port}", args))
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(f"{label:>8} {logins['rps']:>9.1f} {logins['statuses'].get(503, 0):>6} {offers['rps']:>13.0f} "
+                  f"{offers['p50']:>11.1f} {offers['p99']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
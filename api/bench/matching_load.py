@@ -0,0 +1,120 @@
+"""Matching engine throughput: demands/s filled across offers, in-process and over HTTP.
+
+Run from the api/ directory (needs httpx, see bench/requirements.txt):
+
+    python -m bench.matching_load --offers 20000 --demands 20000 --concurrency 16 --duration 10
+
+In-process, the same demand stream is matched one transaction per demand and
+in batches of --batch, plus the in-memory planning cost alone. Over HTTP,
+POST /api/orders/match is compared with single-offer POST /api/orders against
+a fresh uvicorn process per mode.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sqlmodel import Session, create_engine
+
+import matching
+from auth import create_access_token
+from bench.data import LOCATIONS, PRODUCTS, build_db, buyer_id
+from bench.load_test import free_port, run_scenario, start_server
+from models import UserRole
+from schemas import MatchCreate
+
+BUYERS = 50
+
+
+def demands(count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    categories = sorted({category for _, category in PRODUCTS})
+    out = []
+    for _ in range(count):
+        name, category = PRODUCTS[rnd.randrange(len(PRODUCTS))]
+        body = {"product_category": rnd.choice(categories), "quantity": rnd.randint(1, 50), "max_price": 1500.0}
+        if rnd.random() < 0.3:
+            body.update(product_category=category, product_name=name)
+        if rnd.random() < 0.2:
+            body["location"] = rnd.choice(LOCATIONS)
+        out.append(body)
+    return out
+
+
+def in_process(db_path: str, stream: list, batch: int) -> float:
+    engine = create_engine(f"sqlite:///{db_path}")
+    matching.book.clear()
+    pairs = [(buyer_id(n % BUYERS), MatchCreate(**body)) for n, body in enumerate(stream)]
+    filled = 0
+    t0 = time.perf_counter()
+    for start in range(0, len(pairs), batch):
+        filled += sum(r.filled > 0 for r in matching.match_batch(pairs[start:start + batch], bind=engine))
+    elapsed = time.perf_counter() - t0
+    engine.dispose()
+    assert filled, "nothing matched"
+    return len(pairs) / elapsed
+
+
+def plan_only(db_path: str, stream: list) -> float:
+    engine = create_engine(f"sqlite:///{db_path}")
+    matching.book.clear()
+    with Session(engine) as session:
+        matching.book.sync(session, force=True)
+    engine.dispose()
+    parsed = [MatchCreate(**body) for body in stream]
+    t0 = time.perf_counter()
+    for demand in parsed:
+        matching.book.plan(demand)
+    return len(parsed) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=20000)
+    parser.add_argument("--demands", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=matching.MATCH_BATCH)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    stream = demands(args.demands)
+    tokens = [create_access_token({"sub": buyer_id(n), "role": UserRole.BUYER.value}) for n in range(BUYERS)]
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_db(template, args.offers, buyers=BUYERS).dispose()
+
+        print(f"plan only (in memory): {plan_only(template, stream):>10,.0f} demands/s")
+        for batch in (1, args.batch):
+            db_path = os.path.join(tmp, f"batch{batch}.db")
+            shutil.copy(template, db_path)
+            rate = in_process(db_path, stream, batch)
+            print(f"in-process, batch {batch:>4}: {rate:>10,.0f} demands/s")
+
+        print(f"{'mode':>6} {'endpoint':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        scenarios = [
+            ("/api/orders/match", stream[:1000]),
+            ("/api/orders", [{"offer_id": 1 + n % args.offers, "quantity": 1} for n in range(1000)]),
+        ]
+        for mode in args.modes.split(","):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(template, db_path)
+            port = free_port()
+            proc = start_server(db_path, port, DB_ASYNC="1" if mode == "async" else "0",
+                                AGENT_TICK_SECONDS="0", EXPIRY_SWEEP_INTERVAL_SECONDS="0")
+            try:
+                for path, bodies in scenarios:
+                    r = asyncio.run(run_scenario(f"http://127.0.0.1:{port}", path, tokens, args.concurrency,
+                                                 args.duration, method="POST", bodies=bodies))
+                    print(f"{mode:>6} {path:<20} {r['rps']:>8.0f} {r['p50']:>8.1f} "
+                          f"{r['p95']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
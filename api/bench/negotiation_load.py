@@ -0,0 +1,125 @@
+"""Negotiation throughput: bids/s through propose -> counter -> accept, and expiry sweep speed.
+
+Run from the api/ directory (needs httpx, see bench/requirements.txt):
+
+    python -m bench.negotiation_load --concurrency 32 --duration 15 --expired 100000
+
+Each worker repeatedly opens a negotiation as a buyer, counters it as the
+producer and accepts as the buyer, against a fresh uvicorn process per mode.
+The sweep benchmark expires --expired overdue negotiations in-process.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import insert
+
+import negotiations
+from auth import create_access_token
+from bench.data import PRODUCER_ID, BATCH, build_db, buyer_id
+from bench.load_test import free_port, percentile, start_server
+from models import Negotiation, NegotiationStatus, UserRole
+
+BUYERS = 50
+
+
+async def haggle(base_url: str, offers: int, concurrency: int, duration: float) -> dict:
+    buyer_headers = [{"Authorization": f"Bearer {create_access_token({'sub': buyer_id(n), 'role': UserRole.BUYER.value})}"}
+                     for n in range(BUYERS)]
+    producer_headers = {"Authorization": f"Bearer {create_access_token({'sub': PRODUCER_ID, 'role': UserRole.PRODUCER.value})}"}
+    statuses, latencies, rounds = Counter(), [], 0
+    deadline = time.perf_counter() + duration
+
+    async def call(path: str, headers: dict, body=None):
+        t0 = time.perf_counter()
+        resp = await client.post(path, headers=headers, json=body)
+        statuses[resp.status_code] += 1
+        if resp.status_code == 200:
+            latencies.append((time.perf_counter() - t0) * 1000)
+            return resp.json()
+        return None
+
+    async def worker(n: int):
+        nonlocal rounds
+        rnd = random.Random(n)
+        buyer = buyer_headers[n % BUYERS]
+        while time.perf_counter() < deadline:
+            opened = await call("/api/negotiations", buyer,
+                                {"offer_id": rnd.randint(1, offers), "quantity": 1, "unit_price": 1.0})
+            if not opened:
+                continue
+            path = f"/api/negotiations/{opened['id']}"
+            if await call(f"{path}/counter", producer_headers, {"unit_price": 1.5}) and await call(f"{path}/accept", buyer):
+                rounds += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "rounds": rounds / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "errors": sum(count for code, count in statuses.items() if code != 200),
+    }
+
+
+def sweep(db_path: str, expired: int, batch: int) -> float:
+    engine = build_db(db_path, 1000, buyers=BUYERS)
+    past = datetime.utcnow() - timedelta(hours=1)
+    with engine.begin() as conn:
+        for base in range(0, expired, BATCH):
+            conn.execute(insert(Negotiation), [{
+                "offer_id": 1 + i % 1000, "buyer_id": buyer_id(i % BUYERS), "producer_id": PRODUCER_ID,
+                "status": NegotiationStatus.PROPOSED, "quantity": 1, "unit_price": 1.0,
+                "last_bid_by": UserRole.BUYER, "expires_at": past, "created_at": past, "updated_at": past,
+            } for i in range(base, min(base + BATCH, expired))])
+    t0 = time.perf_counter()
+    done = negotiations.expire_due(batch_size=batch, bind=engine)
+    elapsed = time.perf_counter() - t0
+    engine.dispose()
+    assert done == expired, (done, expired)
+    return done / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--expired", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=negotiations.EXPIRY_SWEEP_BATCH)
+    args = parser.parse_args()
+
+    print(f"{'mode':>6} {'req/s':>8} {'rounds/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_db(template, args.offers, buyers=BUYERS).dispose()
+        for mode in args.modes.split(","):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(template, db_path)
+            port = free_port()
+            proc = start_server(db_path, port, DB_ASYNC="1" if mode == "async" else "0")
+            try:
+                r = asyncio.run(haggle(f"http://127.0.0.1:{port}", args.offers, args.concurrency, args.duration))
+                print(f"{mode:>6} {r['rps']:>8.0f} {r['rounds']:>9.0f} {r['p50']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+        rate = sweep(os.path.join(tmp, "sweep.db"), args.expired, args.batch)
+        print(f"sweep: {args.expired} expired negotiations at {rate:.0f}/s (batch {args.batch})")
+
+
+if __name__ == "__main__":
+    main()
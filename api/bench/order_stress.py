@@ -0,0 +1,93 @@
+"""Fire many concurrent orders at one offer and check that stock is never oversold.
+
+Run from the api/ directory:
+
+    python -m bench.order_stress --orders 5000 --stock 1000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import create_engine, func, select, update
+
+from auth import create_access_token
+from bench.data import build_db, buyer_id
+from bench.load_test import free_port, start_server
+from models import Offer, Order, UserRole
+
+BUYERS = 50
+OFFER_ID = 1
+
+
+async def fire(base_url: str, total: int, concurrency: int) -> tuple:
+    tokens = [create_access_token({"sub": buyer_id(n), "role": UserRole.BUYER.value}) for n in range(BUYERS)]
+    queue = iter(range(total))
+    statuses, accepted = Counter(), 0
+
+    async def worker():
+        nonlocal accepted
+        for n in queue:
+            quantity = 1 + n % 3
+            resp = await client.post(
+                "/api/orders",
+                json={"offer_id": OFFER_ID, "quantity": quantity},
+                headers={"Authorization": f"Bearer {tokens[n % BUYERS]}"},
+            )
+            statuses[resp.status_code] += 1
+            if resp.status_code == 200:
+                accepted += quantity
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return statuses, accepted, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=3000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        engine = build_db(template, 10, buyers=BUYERS)
+        with engine.begin() as conn:
+            conn.execute(update(Offer).where(Offer.id == OFFER_ID).values(quantity=args.stock))
+        engine.dispose()
+        for mode in args.modes.split(","):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(template, db_path)
+            port = free_port()
+            proc = start_server(db_path, port, DB_ASYNC="1" if mode == "async" else "0")
+            try:
+                statuses, accepted, elapsed = asyncio.run(fire(f"http://127.0.0.1:{port}", args.orders, args.concurrency))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+            check = create_engine(f"sqlite:///{db_path}")
+            with check.connect() as conn:
+                remaining = conn.execute(select(Offer.quantity).where(Offer.id == OFFER_ID)).scalar_one()
+                ordered = conn.execute(
+                    select(func.coalesce(func.sum(Order.quantity), 0)).where(Order.offer_id == OFFER_ID)
+                ).scalar_one()
+            check.dispose()
+            print(f"[{mode}] {sum(statuses.values())} requests in {elapsed:.2f}s "
+                  f"({statuses[200] / elapsed:.0f} orders/s), statuses {dict(statuses)}")
+            print(f"[{mode}] stock {args.stock} -> {remaining}, ordered {ordered}, acknowledged {accepted}")
+            assert remaining >= 0, "oversold"
+            assert ordered == accepted == args.stock - remaining, "stock and orders disagree"
+
+
+if __name__ == "__main__":
+    main()
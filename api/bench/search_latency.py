@@ -0,0 +1,78 @@
+"""Compare offer search latency: full-text index vs. the old ILIKE scan.
+
+Run from the api/ directory:
+
+    python -m bench.search_latency --sizes 10000,100000,1000000
+
+Each size gets its own throw-away SQLite database, so app.db is never touched.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlmodel import Session, col, select
+
+import search
+from bench.data import build_db
+from models import Offer
+
+# Mix of broad category-like terms and selective lookups (SKU, lot number).
+QUERIES = ["pret", "Pręt", "pellet", "granulat pp", "lozyska", "cement", "kab", "0004242", "partia 777"]
+
+
+def ilike_page(session: Session, q: str):
+    like = f"%{q}%"
+    stmt = (
+        select(Offer)
+        .where(Offer.active == True)
+        .where((col(Offer.product_name).ilike(like)) | (col(Offer.description).ilike(like)))
+        .order_by(col(Offer.created_at).desc(), col(Offer.id).desc())
+        .limit(50)
+    )
+    return session.exec(stmt).all()
+
+
+def fts_page(session: Session, q: str):
+    hits = search.match(session, q)
+    stmt = (
+        select(Offer)
+        .join(hits, hits.c.offer_id == Offer.id)
+        .where(Offer.active == True)
+        .order_by(hits.c.rank, col(Offer.id))
+        .limit(50)
+    )
+    return session.exec(stmt).all()
+
+
+def measure(engine, fn, rounds: int):
+    samples = []
+    with Session(engine) as session:
+        for _ in range(rounds):
+            for q in QUERIES:
+                t0 = time.perf_counter()
+                fn(session, q)
+                samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated catalog sizes")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'offers':>10} {'path':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_db(os.path.join(tmp, "bench.db"), size)
+            for label, fn in (("ilike", ilike_page), ("fts", fts_page)):
+                p50, p99 = measure(engine, fn, args.rounds)
+                print(f"{size:>10} {label:>6} {p50:>9.2f} {p99:>9.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Rows/s serialized for offer lists: ORM + response_model vs. column tuples + json/orjson.
+
+Run from the api/ directory:
+
+    python -m bench.serialization --offers 20000 --pages 50,200,20000
+
+Timings include the query, so they reflect what a list endpoint pays per page.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session, col, select
+
+from bench.data import build_db
+from models import Offer
+from schemas import OfferPublic
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COLUMNS = list(OfferPublic.model_fields)
+
+
+def _page(stmt, size: int):
+    # Same shape as the default /api/offers listing, served by ix_offer_active_created.
+    return stmt.where(Offer.active == True).order_by(col(Offer.created_at).desc(), col(Offer.id).desc()).limit(size)
+
+
+def orm_response_model(session: Session, size: int) -> bytes:
+    # What FastAPI did before: hydrate entities, validate into the response model, encode.
+    offers = session.exec(_page(select(Offer), size)).all()
+    items = [OfferPublic.model_validate(o) for o in offers]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def columns_json(session: Session, size: int) -> bytes:
+    rows = session.exec(_page(select(*(getattr(Offer, c) for c in COLUMNS)), size)).all()
+    items = [dict(zip(COLUMNS, row)) for row in rows]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def columns_orjson(session: Session, size: int) -> bytes:
+    rows = session.exec(_page(select(*(getattr(Offer, c) for c in COLUMNS)), size)).all()
+    return orjson.dumps([dict(zip(COLUMNS, row)) for row in rows])
+
+
+def rows_per_second(engine, fn, size: int, min_rows: int) -> float:
+    done, elapsed = 0, 0.0
+    with Session(engine) as session:
+        fn(session, size)  # warm the page cache and statement cache
+        while done < min_rows:
+            t0 = time.perf_counter()
+            fn(session, size)
+            elapsed += time.perf_counter() - t0
+            done += size
+    return done / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=20000)
+    parser.add_argument("--pages", default="50,200,20000", help="comma-separated page sizes")
+    parser.add_argument("--rows", type=int, default=200000, help="rows serialized per measurement")
+    args = parser.parse_args()
+
+    paths = [("orm+model", orm_response_model), ("cols+json", columns_json)]
+    if orjson is not None:
+        paths.append(("cols+orjson", columns_orjson))
+
+    print(f"{'page':>7} {'path':>12} {'rows/s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_db(os.path.join(tmp, "bench.db"), args.offers)
+        for size in (min(int(s), args.offers) for s in args.pages.split(",")):
+            baseline = None
+            for label, fn in paths:
+                rate = rows_per_second(engine, fn, size, args.rows)
+                baseline = baseline or rate
+                print(f"{size:>7} {label:>12} {rate:>10.0f} {rate / baseline:>7.1f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
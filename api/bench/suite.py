@@ -0,0 +1,286 @@
+"""Benchmark suite: scenario throughput and p50/p95/p99 per endpoint, saved as JSON.
+
+Run from the api/ directory (needs httpx, see bench/requirements.txt):
+
+    python -m bench.suite --offers 100000 --duration 10
+    python -m bench.suite --compare bench/results/<earlier run>.json
+
+Every scenario runs against the ASGI app in-process (httpx.ASGITransport, in
+a child process pointed at a throw-away database, so app.db is never touched)
+and over HTTP against a uvicorn process, each on its own copy of one synthetic
+database (bench/data.py):
+
+- browse: listings by category, location, price and currency, single offers, facets
+- search: full-text queries, radius searches and facets of a search
+- login_storm: password logins of many buyers at once
+- order_rush: buyers ordering a handful of hot offers
+
+The report, written to bench/results/<commit>-<time>.json unless --out is
+given, records the commit, the settings and one entry per scenario,
+transport and endpoint; --compare prints the change against an earlier report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import httpx
+from sqlalchemy import create_engine, update
+
+from auth import create_access_token
+from bench.data import CATALOG, LOCATIONS, build_db, buyer_id
+from bench.load_test import API_DIR, free_port, percentile, start_server
+from hashing import hash_password
+from models import Offer, UserRole
+
+SCENARIOS = ("browse", "search", "login_storm", "order_rush")
+TRANSPORTS = ("inprocess", "http")
+RESULTS_DIR = os.path.join(API_DIR, "bench", "results")
+PASSWORD = "Passw0rd!"
+HOT_OFFERS = 20
+REQUESTS_PER_SCENARIO = 2000
+SEARCH_TERMS = ["pellet", "pret", "cement", "granulat pp", "kabel", "palety", "partia 42", "lozyska"]
+# Background workers would compete with the measured requests.
+# Every scenario client shares one IP, so the per-client rate limit is off.
+SERVER_SETTINGS = {
+    "AGENT_TICK_SECONDS": "0", "EXPIRY_SWEEP_INTERVAL_SECONDS": "0", "RATE_LIMIT_PER_SECOND": "0", "ADMISSION_MAX_CONCURRENT": "0",
+}
+
+
+def requests_for(scenario: str, offers: int, buyers: int, seed: int = 0) -> list:
+    """(endpoint label, method, path, bearer token, JSON body) tuples, replayed round-robin by the workers."""
+    rnd = random.Random(seed)
+    categories = sorted({category for _, category, *_ in CATALOG})
+    tokens = [create_access_token({"sub": buyer_id(n), "role": UserRole.BUYER.value}) for n in range(buyers)]
+    out = []
+    for n in range(REQUESTS_PER_SCENARIO):
+        if scenario == "browse":
+            pick = rnd.random()
+            if pick < 0.4:
+                params = rnd.choice([
+                    f"category={rnd.choice(categories)}", f"location={rnd.choice(LOCATIONS)}",
+                    f"max_price={rnd.choice([10, 50, 100, 500])}&sort=price_asc", "currency=EUR", "",
+                ])
+                out.append(("GET /api/offers", "GET", f"/api/offers?limit=50&{params}", None, None))
+            elif pick < 0.8:
+                out.append(("GET /api/offers/{id}", "GET", f"/api/offers/{rnd.randint(1, offers)}", None, None))
+            else:
+                out.append(("GET /api/offers/facets", "GET",
+                            f"/api/offers/facets?category={rnd.choice(categories)}", None, None))
+        elif scenario == "search":
+            term = rnd.choice(SEARCH_TERMS)
+            pick = rnd.random()
+            if pick < 0.6:
+                out.append(("GET /api/offers?q=", "GET", f"/api/offers?limit=50&q={term}", None, None))
+            elif pick < 0.9:
+                out.append(("GET /api/offers?near=", "GET",
+                            f"/api/offers?limit=50&near={rnd.choice(LOCATIONS)}&radius_km={rnd.choice([10, 50, 150])}",
+                            None, None))
+            else:
+                out.append(("GET /api/offers/facets?q=", "GET", f"/api/offers/facets?q={term}", None, None))
+        elif scenario == "login_storm":
+            body = {"email": f"buyer{n % buyers}@example.com", "password": PASSWORD}
+            out.append(("POST /api/auth/login", "POST", "/api/auth/login", None, body))
+        elif scenario == "order_rush":
+            body = {"offer_id": 1 + n % HOT_OFFERS, "quantity": rnd.randint(1, 5)}
+            out.append(("POST /api/orders", "POST", "/api/orders", tokens[n % buyers], body))
+        else:
+            raise ValueError(f"unknown scenario {scenario}")
+    return out
+
+
+async def drive(client: httpx.AsyncClient, plan: list, concurrency: int, duration: float) -> list:
+    """Replay ``plan`` from ``concurrency`` workers for ``duration`` seconds; one result per endpoint."""
+    latencies, statuses = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        i = n
+        while time.perf_counter() < deadline:
+            label, method, path, token, body = plan[i % len(plan)]
+            i += concurrency
+            headers = {"Authorization": f"Bearer {token}"} if token else {}
+            t0 = time.perf_counter()
+            try:
+                code = (await client.request(method, path, headers=headers, json=body)).status_code
+            except httpx.HTTPError:
+                code = "error"
+            statuses[label][str(code)] += 1
+            if code == 200:
+                latencies[label].append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    results = []
+    for label in sorted(statuses):
+        samples = sorted(latencies[label])
+        results.append({
+            "endpoint": label,
+            "requests": sum(statuses[label].values()),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50": round(percentile(samples, 0.50), 2),
+            "p95": round(percentile(samples, 0.95), 2),
+            "p99": round(percentile(samples, 0.99), 2),
+            "errors": sum(count for code, count in statuses[label].items() if code != "200"),
+            "statuses": dict(statuses[label]),
+        })
+    return results
+
+
+async def _over_http(base_url: str, scenarios, offers: int, buyers: int, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    out = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        for scenario in scenarios:
+            out[scenario] = await drive(client, requests_for(scenario, offers, buyers), concurrency, duration)
+    return out
+
+
+async def _in_process(scenarios, offers: int, buyers: int, concurrency: int, duration: float) -> dict:
+    from main import app  # reads DB_URL at import time
+
+    out = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            for scenario in scenarios:
+                out[scenario] = await drive(client, requests_for(scenario, offers, buyers), concurrency, duration)
+    return out
+
+
+def in_process_child(scenarios, offers: int, buyers: int, concurrency: int, duration: float) -> dict:
+    """Runs in a spawned child whose environment (DB_URL, ...) was set by the parent before it started."""
+    return asyncio.run(_in_process(scenarios, offers, buyers, concurrency, duration))
+
+
+def prepare(template: str, path: str) -> None:
+    shutil.copy(template, path)
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        # Hot offers get enough stock that the order rush never runs out.
+        conn.execute(update(Offer).where(Offer.id <= HOT_OFFERS).values(quantity=10**9, active=True))
+    engine.dispose()
+
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=API_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(report: dict, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["scenario"], r["transport"], r["endpoint"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline['commit'] or '?'} ({baseline['started_at']})")
+    print(f"{'scenario':<12} {'transport':<10} {'endpoint':<26} {'req/s':>14} {'p95 ms':>16}")
+    for r in report["results"]:
+        old = before.get((r["scenario"], r["transport"], r["endpoint"]))
+        if old is None:
+            continue
+
+        def delta(new, was):
+            return f"{(new - was) / was * 100:+6.1f}%" if was else "    n/a"
+
+        print(f"{r['scenario']:<12} {r['transport']:<10} {r['endpoint']:<26} "
+              f"{r['rps']:>7.0f} {delta(r['rps'], old['rps'])} {r['p95']:>8.1f} {delta(r['p95'], old['p95'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=100_000)
+    parser.add_argument("--producers", type=int, default=20)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--transports", default=",".join(TRANSPORTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--db-async", action="store_true", help="serve with DB_ASYNC=1")
+    parser.add_argument("--out", help="report path (default: bench/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario}")
+    started = datetime.now()
+    report = {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "started_at": started.isoformat(timespec="seconds"),
+        "settings": vars(args),
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                        "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": [],
+    }
+    settings = dict(SERVER_SETTINGS, DB_ASYNC="1" if args.db_async else "0")
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        t0 = time.perf_counter()
+        build_db(template, args.offers, buyers=args.buyers, orders=args.orders, producers=args.producers).dispose()
+        # One hash for every buyer: only logins should pay for hashing.
+        conn = sqlite3.connect(template)
+        conn.execute("UPDATE user SET password_hash = ?", (hash_password(PASSWORD),))
+        conn.commit()
+        conn.close()
+        report["data_seconds"] = round(time.perf_counter() - t0, 1)
+        print(f"synthetic data: {args.offers} offers, {args.orders} orders in {report['data_seconds']} s")
+
+        for transport in args.transports.split(","):
+            db_path = os.path.join(tmp, f"{transport}.db")
+            prepare(template, db_path)
+            if transport == "inprocess":
+                # The app reads its settings at import time, so a fresh process imports it.
+                os.environ.update(settings, DB_URL=f"sqlite:///{db_path}")
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    results = pool.submit(in_process_child, scenarios, args.offers, args.buyers,
+                                          args.concurrency, args.duration).result()
+            elif transport == "http":
+                port = free_port()
+                proc = start_server(db_path, port, **settings)
+                try:
+                    results = asyncio.run(_over_http(f"http://127.0.0.1:{port}", scenarios, args.offers,
+                                                     args.buyers, args.concurrency, args.duration))
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            else:
+                parser.error(f"unknown transport {transport}")
+            for scenario in scenarios:
+                for r in results[scenario]:
+                    report["results"].append({"scenario": scenario, "transport": transport, **r})
+
+    print(f"{'scenario':<12} {'transport':<10} {'endpoint':<26} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in report["results"]:
+        print(f"{r['scenario']:<12} {r['transport']:<10} {r['endpoint']:<26} {r['rps']:>8.0f} {r['p50']:>8.1f} "
+              f"{r['p95']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}")
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{report['commit'] or 'nogit'}-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"report: {out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
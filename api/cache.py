@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._counters: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def incr(self, key: Hashable) -> int:
+        """Bump an integer counter; counters live apart from the entries and never expire."""
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key: Hashable) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """Same interface as TTLCache, stored in Redis (or any server speaking its protocol).
+
+    Shared by all worker processes, so invalidation reaches every one of them.
+    Values must be JSON-serializable; tuples come back as lists. Needs the
+    ``redis`` package, which is not a hard dependency.
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = "cache:"):
+        import redis
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        raw = self._client.get(self.prefix + str(key))
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._client.set(self.prefix + str(key), json.dumps(value), px=int(self.ttl * 1000))
+
+    def delete(self, key: Hashable) -> None:
+        self._client.delete(self.prefix + str(key))
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def incr(self, key: Hashable) -> int:
+        return self._client.incr(self.prefix + "counter:" + str(key))
+
+    def get_counter(self, key: Hashable) -> int:
+        return int(self._client.get(self.prefix + "counter:" + str(key)) or 0)
+
+    def __len__(self) -> int:
+        counters = (self.prefix + "counter:").encode()
+        return sum(1 for key in self._client.scan_iter(match=self.prefix + "*") if not key.startswith(counters))
+
+
+def make_cache(url: Optional[str], maxsize: int, ttl: float, prefix: str = "cache:"):
+    """``memory`` (or empty) for a per-process TTLCache, ``redis://...`` for a shared RedisCache."""
+    if not url or url == "memory":
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, ttl=ttl, prefix=prefix)
+    raise ValueError(f"Unsupported cache backend: {url}")
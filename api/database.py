@@ -1,18 +1,308 @@
-from sqlmodel import SQLModel, create_engine, Session
+import functools
+import hashlib
+import inspect
+import itertools
 import os
-from dotenv import load_dotenv
+import time
+from typing import List, Optional
 
-load_dotenv()
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import greenlet_spawn
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import cache
+import settings
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 default_sqlite_path = os.path.join(BASE_DIR, "app.db")
-DB_URL = os.getenv("DB_URL", f"sqlite:///{default_sqlite_path}")
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, echo=False, connect_args=connect_args)
+DB_URL = settings.get("DB_URL", f"sqlite:///{default_sqlite_path}")
+# DB_ASYNC=1 serves every route as a coroutine over an async driver
+# (aiosqlite / asyncpg) instead of sync handlers on the threadpool.
+DB_ASYNC = settings.get_bool("DB_ASYNC", False)
+IS_SQLITE = DB_URL.startswith("sqlite")
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+
+# Pool sizing; per worker process, so the database sees workers * (size + overflow).
+# In sync mode size + overflow should cover the 40-thread worker pool: a sync
+# route holds its connection until the response is serialized, which needs a
+# worker thread of its own, so a smaller pool can deadlock until pool_timeout.
+pool_args = {
+    "pool_size": settings.get_int("DB_POOL_SIZE", 10),
+    "max_overflow": settings.get_int("DB_MAX_OVERFLOW", 30),
+    "pool_timeout": settings.get_float("DB_POOL_TIMEOUT", 30),
+    "pool_recycle": settings.get_int("DB_POOL_RECYCLE", 1800),
+    "pool_pre_ping": settings.get_bool("DB_POOL_PRE_PING", True),
+}
+if IS_SQLITE and ":memory:" in DB_URL:
+    # In-memory SQLite lives in a single connection; keep SQLAlchemy's default pool.
+    pool_args = {}
+
+# Applied to every new SQLite connection. WAL lets readers run alongside a writer
+# and busy_timeout makes concurrent writers wait instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": settings.get_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    "cache_size": -settings.get_int("SQLITE_CACHE_SIZE_KB", 65536),
+    "mmap_size": settings.get_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "temp_store": "MEMORY",
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+# Read replicas: GET endpoints that take get_read_session run on one of these,
+# the rest of the app on DB_URL. Replication itself is the database's job.
+DB_REPLICA_URLS = [u.strip() for u in settings.get("DB_REPLICA_URLS", "").split(",") if u.strip()]
+# round_robin, or least_loaded (fewest connections checked out of the replica's pool).
+DB_REPLICA_POLICY = settings.get("DB_REPLICA_POLICY", "round_robin")
+# After a client writes, its reads go to the primary for this long, so it never
+# reads a replica that has not caught up with its own write. 0 disables.
+DB_READ_YOUR_WRITES_SECONDS = settings.get_float("DB_READ_YOUR_WRITES_SECONDS", 5)
+# "memory" (per worker) or redis://... so a write seen by one worker pins reads on all of them.
+DB_STICKY_URL = settings.get("DB_STICKY_URL", "memory")
+# A replica that failed to connect is skipped for this long; its reads go elsewhere.
+DB_REPLICA_RETRY_SECONDS = settings.get_float("DB_REPLICA_RETRY_SECONDS", 30)
+if DB_REPLICA_POLICY not in ("round_robin", "least_loaded"):
+    raise ValueError(f"Unsupported replica policy: {DB_REPLICA_POLICY}")
+
+
+def _make_engine(url: str):
+    sqlite = url.startswith("sqlite")
+    target = create_engine(url, echo=False, connect_args=connect_args if sqlite else {}, **pool_args)
+    if sqlite:
+        event.listen(target, "connect", _apply_sqlite_pragmas)
+    return target
+
+
+engine = _make_engine(DB_URL)
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+def _make_async_engine(url: str):
+    sqlite = url.startswith("sqlite")
+    async_pool_args = dict(pool_args)
+    if sqlite and pool_args:
+        # aiosqlite defaults to NullPool for file databases; pool them like the sync engine.
+        async_pool_args["poolclass"] = AsyncAdaptedQueuePool
+    target = create_async_engine(async_url(url), connect_args=connect_args if sqlite else {}, **async_pool_args)
+    if sqlite:
+        event.listen(target.sync_engine, "connect", _apply_sqlite_pragmas)
+    return target
+
+
+async_engine = _make_async_engine(DB_URL) if DB_ASYNC else None
+
+
+def read_only_url(url: str) -> str:
+    """SQLite URLs opened read-only, so a missing replica file fails to connect instead of being created empty."""
+    if not url.startswith("sqlite") or ":///" not in url or ":memory:" in url or "mode=" in url:
+        return url
+    scheme, _, path = url.partition(":///")
+    if not path.startswith("file:"):
+        path = "file:" + path
+    return f"{scheme}:///{path}{'&' if '?' in path else '?'}mode=ro&uri=true"
+
+
+class Replica:
+    def __init__(self, url: str):
+        url = read_only_url(url)
+        self.engine = _make_engine(url)
+        self.async_engine = _make_async_engine(url) if DB_ASYNC else None
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.down_until = 0.0
+        self.failures = 0
+
+    def checked_out(self) -> int:
+        return (self.async_engine.sync_engine if self.async_engine is not None else self.engine).pool.checkedout()
+
+    def mark_down(self) -> None:
+        self.failures += 1
+        self.down_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+
+
+replicas: List[Replica] = [Replica(url) for url in DB_REPLICA_URLS]
+_next_replica = itertools.count()
+_sticky = cache.make_cache(DB_STICKY_URL, maxsize=100000, ttl=DB_READ_YOUR_WRITES_SECONDS, prefix="sticky:")
+_routing = {"replica": 0, "primary_sticky": 0, "primary_fallback": 0}
+
+
+def pool_stats(target) -> dict:
+    pool = target.pool
+    stats = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+def replica_stats() -> dict:
+    now = time.monotonic()
+    return {
+        **_routing, "policy": DB_REPLICA_POLICY,
+        "replicas": [
+            {"url": r.name, "up": r.down_until <= now, "failures": r.failures,
+             "pool": pool_stats(r.async_engine if r.async_engine is not None else r.engine)}
+            for r in replicas
+        ],
+    }
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
 
-def get_session():
+def _client_key(request: Request) -> str:
+    """The bearer token's digest, else the client IP; no JWT decoding here (auth imports this module)."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha1(authorization.encode()).hexdigest()
+    return request.client.host if request.client else "unknown"
+
+
+def note_write(request: Request) -> None:
+    """Pin the client's reads to the primary for DB_READ_YOUR_WRITES_SECONDS."""
+    if replicas and DB_READ_YOUR_WRITES_SECONDS > 0:
+        _sticky.set(_client_key(request), 1)
+
+
+def _read_candidates(request: Request) -> Optional[List[Replica]]:
+    """Replicas to try in order; None when the read belongs on the primary anyway."""
+    if not replicas:
+        return None
+    if DB_READ_YOUR_WRITES_SECONDS > 0 and _sticky.get(_client_key(request)) is not None:
+        _routing["primary_sticky"] += 1
+        return None
+    now = time.monotonic()
+    live = [r for r in replicas if r.down_until <= now]
+    start = next(_next_replica)
+    ordered = [live[(start + i) % len(live)] for i in range(len(live))]
+    if DB_REPLICA_POLICY == "least_loaded":
+        # Stable sort of the rotated list, so ties still take turns.
+        ordered.sort(key=Replica.checked_out)
+    return ordered
+
+
+def _is_write(request: Request) -> bool:
+    return request.method not in ("GET", "HEAD", "OPTIONS")
+
+
+def get_session(request: Request):
+    """Session on the primary, for writes and for reads that must see them."""
     with Session(engine) as session:
         yield session
+    if _is_write(request):
+        note_write(request)
+
+
+def get_read_session(request: Request):
+    """Session on a replica when one is configured, up and the client has not just written; else the primary.
+
+    The connection is opened here, so a replica that is down costs one failed
+    connect and the request falls back to the next replica or the primary.
+    """
+    candidates = _read_candidates(request)
+    for replica in candidates or ():
+        session = Session(replica.engine)
+        try:
+            session.connection()
+        except DBAPIError:
+            session.close()
+            replica.mark_down()
+            continue
+        _routing["replica"] += 1
+        with session:
+            yield session
+        return
+    if candidates is not None:
+        _routing["primary_fallback"] += 1
+    with Session(engine) as session:
+        yield session
+
+
+async def get_async_session(request: Request):
+    # Handlers keep using the sync Session API; its I/O is awaited on the
+    # async driver because DBRoute runs them inside a greenlet.
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session.sync_session
+    if _is_write(request):
+        note_write(request)
+
+
+async def get_async_read_session(request: Request):
+    candidates = _read_candidates(request)
+    for replica in candidates or ():
+        session = AsyncSession(replica.async_engine, expire_on_commit=False)
+        try:
+            await session.connection()
+        except DBAPIError:
+            await session.close()
+            replica.mark_down()
+            continue
+        _routing["replica"] += 1
+        async with session:
+            yield session.sync_session
+        return
+    if candidates is not None:
+        _routing["primary_fallback"] += 1
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session.sync_session
+
+
+def _in_greenlet(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await greenlet_spawn(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def _is_plain_function(call) -> bool:
+    return inspect.isfunction(call) and not (
+        inspect.iscoroutinefunction(call) or inspect.isgeneratorfunction(call) or inspect.isasyncgenfunction(call)
+    )
+
+
+def _bridge_dependencies(dependant) -> None:
+    for dep in dependant.dependencies:
+        if dep.call is get_session:
+            dep.call = get_async_session
+        elif dep.call is get_read_session:
+            dep.call = get_async_read_session
+        elif _is_plain_function(dep.call):
+            dep.call = _in_greenlet(dep.call)
+        _bridge_dependencies(dep)
+
+
+class DBRoute(APIRoute):
+    """Route class used by every router.
+
+    In sync mode it is a plain APIRoute. With DB_ASYNC the endpoint and its sync
+    dependencies become coroutines running on the event loop, and get_session /
+    get_read_session are swapped for their async twins, so the same handler
+    code serves both modes.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if DB_ASYNC and _is_plain_function(endpoint):
+            endpoint = _in_greenlet(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        if DB_ASYNC:
+            _bridge_dependencies(self.dependant)
@@ -0,0 +1,116 @@
+"""In-process pub/sub of offer and order changes, streamed to clients by GET /api/events.
+
+Handlers publish after committing; publish never blocks and is safe from the
+threadpool (sync mode) as well as from the event loop (async mode). Every
+subscriber has a bounded queue: a client that falls EVENTS_QUEUE_SIZE events
+behind is dropped with a final ``overflow`` event and is expected to reload
+and reconnect. Events only reach subscribers of the same worker process.
+"""
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Set
+
+import settings
+
+EVENTS_QUEUE_SIZE = settings.get_int("EVENTS_QUEUE_SIZE", 256)
+EVENTS_HEARTBEAT_SECONDS = settings.get_float("EVENTS_HEARTBEAT_SECONDS", 15)
+
+OFFER_CREATED = "offer.created"
+OFFER_UPDATED = "offer.updated"
+OFFER_STOCK = "offer.stock"
+OFFERS_IMPORTED = "offers.imported"
+ORDER_PLACED = "order.placed"
+NEGOTIATION_UPDATED = "negotiation.updated"
+# Delivered only to the offer's producer and the buyer involved.
+PRIVATE_TYPES = {ORDER_PLACED, NEGOTIATION_UPDATED}
+
+
+@dataclass
+class Event:
+    type: str
+    data: Any
+    producer_id: Optional[int] = None
+    category: Optional[str] = None
+    buyer_id: Optional[int] = None
+    id: int = 0
+
+
+@dataclass(eq=False)
+class Subscription:
+    queue: asyncio.Queue
+    user_id: Optional[int] = None
+    producer_id: Optional[int] = None
+    category: Optional[str] = None
+    types: Optional[Set[str]] = None
+    dropped: bool = False
+
+    def wants(self, event: Event) -> bool:
+        if event.type in PRIVATE_TYPES and self.user_id not in (event.producer_id, event.buyer_id):
+            return False
+        if self.types is not None and event.type not in self.types:
+            return False
+        if self.producer_id is not None and event.producer_id != self.producer_id:
+            return False
+        if self.category is not None and event.category is not None and event.category != self.category:
+            return False
+        return True
+
+
+class EventBus:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, **filters) -> Subscription:
+        """Must be called on the event loop that will serve the subscription."""
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(queue=asyncio.Queue(maxsize=self.queue_size), **filters)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    def publish(self, type: str, data: Any, **routing) -> None:
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        with self._ids_lock:
+            event = Event(type=type, data=data, id=next(self._ids), **routing)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(event)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event: Event) -> None:
+        self.published += 1
+        for sub in list(self._subscribers):
+            if not sub.wants(event):
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: make room for one final event telling it to resync.
+                self._subscribers.discard(sub)
+                self.dropped += 1
+                sub.dropped = True
+                sub.queue.get_nowait()
+                sub.queue.put_nowait(Event(type="overflow", data=None, id=event.id))
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+
+bus = EventBus(EVENTS_QUEUE_SIZE)
+publish = bus.publish
@@ -0,0 +1,218 @@
+"""Facet counts for the offers page sidebar (GET /api/offers/facets).
+
+A summary table, offer_facet, holds the number of offers per (active,
+category, location, currency, price bucket). Triggers on ``offer`` keep it
+current on every insert, update and delete, whichever code path writes, so
+facets for the plain filters (category, location, price, active) are read
+from a few hundred summary rows in one grouped query. Price bounds that do not
+fall on bucket edges add a grouped range scan of the price index for the
+partly covered buckets. Searches (q) and radius filters (near) have no summary;
+their facets are grouped live over the matching offers.
+
+Facets are disjunctive: each facet is counted with every filter but its own,
+so the sidebar still offers the other categories when one is selected.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, literal, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, col, select
+
+from models import Offer
+
+# Lower edges of the price buckets, in FX_BASE_CURRENCY; the last one is open-ended.
+PRICE_EDGES = (0, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+NO_PRICE = -1  # bucket of offers in a currency without a rate
+MAX_FACET_VALUES = 100
+
+DIMENSIONS = ("active", "product_category", "location", "currency", "price_bucket")
+
+# (category, location, currency, bucket, in price range, offers, counts toward the price facet)
+Row = Tuple[str, str, str, int, bool, int, bool]
+
+
+def _bucket_sql(price: str) -> str:
+    whens = " ".join(f"WHEN {price} < {hi} THEN {i}" for i, hi in enumerate(PRICE_EDGES[1:]))
+    return f"CASE WHEN {price} IS NULL THEN {NO_PRICE} {whens} ELSE {len(PRICE_EDGES) - 1} END"
+
+
+def _key_sql(row: str) -> str:
+    return f"{row}.active, {row}.product_category, {row}.location, {row}.currency, {_bucket_sql(row + '.unit_price_base')}"
+
+
+def _match_sql(row: str) -> str:
+    return " AND ".join(
+        f"{d} = {row}.{d}" for d in DIMENSIONS[:-1]
+    ) + f" AND price_bucket = {_bucket_sql(row + '.unit_price_base')}"
+
+
+def _increment_sql(row: str) -> str:
+    return (
+        f"INSERT INTO offer_facet VALUES ({_key_sql(row)}, 1) "
+        f"ON CONFLICT ({', '.join(DIMENSIONS)}) DO UPDATE SET offers = offer_facet.offers + 1"
+    )
+
+
+def _decrement_sql(row: str) -> str:
+    return f"UPDATE offer_facet SET offers = offers - 1 WHERE {_match_sql(row)}"
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def ensure_index(engine: Engine) -> None:
+    """Create the summary table and its triggers, and backfill the table when it is empty."""
+    watched = "active, product_category, location, currency, unit_price_base"
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS offer_facet ("
+            " active BOOLEAN NOT NULL, product_category VARCHAR NOT NULL, location VARCHAR NOT NULL,"
+            " currency VARCHAR NOT NULL, price_bucket INTEGER NOT NULL, offers INTEGER NOT NULL,"
+            f" PRIMARY KEY ({', '.join(DIMENSIONS)}))"
+        )
+        if _dialect(conn) == "postgresql":
+            conn.exec_driver_sql(
+                "CREATE OR REPLACE FUNCTION offer_facet_count() RETURNS trigger AS $$ BEGIN"
+                " IF TG_OP = 'UPDATE' AND"
+                f" ({_key_sql('OLD')}) IS NOT DISTINCT FROM ({_key_sql('NEW')}) THEN RETURN NULL; END IF;"
+                f" IF TG_OP IN ('UPDATE', 'DELETE') THEN {_decrement_sql('OLD')}; END IF;"
+                f" IF TG_OP IN ('UPDATE', 'INSERT') THEN {_increment_sql('NEW')}; END IF;"
+                " RETURN NULL; END $$ LANGUAGE plpgsql"
+            )
+            conn.exec_driver_sql("DROP TRIGGER IF EXISTS offer_facet_count ON offer")
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER offer_facet_count AFTER INSERT OR DELETE OR UPDATE OF {watched} ON offer"
+                " FOR EACH ROW EXECUTE FUNCTION offer_facet_count()"
+            )
+        else:
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS offer_facet_insert AFTER INSERT ON offer BEGIN {_increment_sql('NEW')}; END"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS offer_facet_delete AFTER DELETE ON offer BEGIN {_decrement_sql('OLD')}; END"
+            )
+            changed = " OR ".join(
+                [f"OLD.{c} IS NOT NEW.{c}" for c in DIMENSIONS[:-1]]
+                + [f"{_bucket_sql('OLD.unit_price_base')} IS NOT {_bucket_sql('NEW.unit_price_base')}"]
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS offer_facet_update AFTER UPDATE OF {watched} ON offer WHEN {changed}"
+                f" BEGIN {_decrement_sql('OLD')}; {_increment_sql('NEW')}; END"
+            )
+        if not conn.exec_driver_sql("SELECT count(*) FROM offer_facet").scalar_one():
+            rebuild(conn)
+
+
+def rebuild(conn: Connection) -> None:
+    """Recount the summary table from the offer table."""
+    conn.exec_driver_sql("DELETE FROM offer_facet")
+    conn.exec_driver_sql(
+        f"INSERT INTO offer_facet SELECT {_key_sql('offer')}, count(*) FROM offer GROUP BY 1, 2, 3, 4, 5"
+    )
+
+
+def _bucket(price):
+    whens = [(price.is_(None), NO_PRICE)] + [(price < hi, i) for i, hi in enumerate(PRICE_EDGES[1:])]
+    return case(*whens, else_=len(PRICE_EDGES) - 1)
+
+
+def _price_range(min_base: Optional[float], max_base: Optional[float]) -> list:
+    clauses = []
+    if min_base is not None:
+        clauses.append(col(Offer.unit_price_base) >= min_base)
+    if max_base is not None:
+        clauses.append(col(Offer.unit_price_base) <= max_base)
+    return clauses
+
+
+def from_offers(session: Session, active: Optional[bool], min_base: Optional[float], max_base: Optional[float],
+                joins: Iterable = ()) -> List[Row]:
+    """Facet rows grouped live from the offer table, joined to (offer_id, ...) subqueries such as search hits."""
+    price = _price_range(min_base, max_base)
+    in_price = case((and_(*price), True), else_=False) if price else literal(True)
+    bucket = _bucket(col(Offer.unit_price_base))
+    stmt = select(Offer.product_category, Offer.location, Offer.currency, bucket, in_price, func.count())
+    for hits in joins:
+        stmt = stmt.join(hits, hits.c.offer_id == Offer.id)
+    if active is not None:
+        stmt = stmt.where(Offer.active == active)
+    stmt = stmt.group_by(Offer.product_category, Offer.location, Offer.currency, bucket, in_price)
+    return [(*row[:4], bool(row[4]), row[5], True) for row in session.exec(stmt).all()]
+
+
+def from_summary(session: Session, active: Optional[bool], min_base: Optional[float],
+                 max_base: Optional[float]) -> List[Row]:
+    """Facet rows from offer_facet, plus the offers of partly covered price buckets read from the price index."""
+    where = "WHERE active = :active" if active is not None else ""
+    summary = session.exec(
+        text(
+            "SELECT product_category, location, currency, price_bucket, SUM(offers) FROM offer_facet "
+            f"{where} GROUP BY product_category, location, currency, price_bucket HAVING SUM(offers) > 0"
+        ).bindparams(**({"active": active} if active is not None else {}))
+    ).all()
+
+    filtered = min_base is not None or max_base is not None
+    lo = float("-inf") if min_base is None else min_base
+    hi = float("inf") if max_base is None else max_base
+    edges = PRICE_EDGES + (float("inf"),)
+    # Buckets [edges[i], edges[i + 1]) lying wholly inside [lo, hi].
+    full = [i for i in range(len(PRICE_EDGES)) if lo <= edges[i] and edges[i + 1] <= hi]
+    rows = [
+        (cat, loc, cur, bucket, (bucket in full) if filtered else True, n, True)
+        for cat, loc, cur, bucket, n in summary
+    ]
+    if not filtered:
+        return rows
+
+    if full:
+        first, last = edges[full[0]], edges[full[-1] + 1]
+        gaps = [(min_base, first, False)] if lo < first else []
+        if last < hi:
+            gaps.append((last, max_base, True))
+    else:
+        gaps = [(min_base, max_base, True)]
+    for gap_lo, gap_hi, inclusive in gaps:
+        # Grouped like the summary, over one range of the (active, unit_price_base) index.
+        price = col(Offer.unit_price_base)
+        stmt = select(Offer.product_category, Offer.location, Offer.currency, func.count())
+        if active is not None:
+            stmt = stmt.where(Offer.active == active)
+        if gap_lo is not None:
+            stmt = stmt.where(price >= gap_lo)
+        stmt = stmt.where(price <= gap_hi if inclusive else price < gap_hi) if gap_hi is not None else stmt.where(price.is_not(None))
+        stmt = stmt.group_by(Offer.product_category, Offer.location, Offer.currency)
+        rows.extend((cat, loc, cur, NO_PRICE, True, n, False) for cat, loc, cur, n in session.exec(stmt).all())
+    return rows
+
+
+def _top(counts: Counter) -> List[dict]:
+    ranked = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:MAX_FACET_VALUES]
+    return [{"value": value, "count": n} for value, n in ranked]
+
+
+def fold(rows: Iterable[Row], category: Optional[str], location: Optional[str]) -> dict:
+    """Disjunctive facet counts from facet rows: each facet ignores its own filter."""
+    categories, locations, currencies, buckets = Counter(), Counter(), Counter(), Counter()
+    total = 0
+    for cat, loc, cur, bucket, in_price, n, price_facet in rows:
+        cat_ok = category is None or cat == category
+        loc_ok = location is None or loc == location
+        if in_price:
+            if loc_ok:
+                categories[cat] += n
+            if cat_ok:
+                locations[loc] += n
+            if cat_ok and loc_ok:
+                currencies[cur] += n
+                total += n
+        if price_facet and cat_ok and loc_ok and bucket != NO_PRICE:
+            buckets[bucket] += n
+    return {
+        "total": total,
+        "categories": _top(categories),
+        "locations": _top(locations),
+        "currencies": _top(currencies),
+        "price_buckets": [buckets[i] for i in range(len(PRICE_EDGES))],
+    }
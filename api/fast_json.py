@@ -0,0 +1,40 @@
+"""JSON encoding for list endpoints.
+
+List handlers select plain columns and hand the row dicts to ``respond``,
+skipping ORM hydration and response_model validation (their declared
+response_model still documents the shape). With FAST_JSON=1 and orjson
+installed, bodies are encoded by orjson and it also becomes the app's
+default response class; otherwise the stdlib encoder is used.
+"""
+import json
+from typing import Any, Iterable, List, Sequence
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+import settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+FAST_JSON = settings.get_bool("FAST_JSON", False) and orjson is not None
+
+response_class = ORJSONResponse if FAST_JSON else JSONResponse
+
+
+def dumps(payload: Any) -> bytes:
+    if FAST_JSON:
+        # Handles datetime, Enum and dataclasses natively, in the same format jsonable_encoder produces.
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def row_dicts(rows: Iterable, names: Sequence[str]) -> List[dict]:
+    """Turn column tuples into dicts with the given keys (in select order)."""
+    return [dict(zip(names, row)) for row in rows]
+
+
+def respond(payload: Any) -> Response:
+    return Response(content=dumps(payload), media_type="application/json")
@@ -0,0 +1,150 @@
+"""Exchange rates and base-currency offer prices.
+
+Offers keep the producer's own unit_price and currency; unit_price_base holds
+the same price in FX_BASE_CURRENCY, so listings filter and sort across
+currencies on one indexed column. Rates live in the fxrate table and are loaded
+from FX_RATES_FILE by ``python migrate.py upgrade`` or ``python fx.py [file]``; when a rate
+changes, every offer in that currency is repriced by one set-based UPDATE.
+
+Single-offer reads cached by read_cache may show the previous base price for
+up to READ_CACHE_TTL_SECONDS after a rate change; listings are invalidated.
+
+Display conversions use rates cached per process for FX_RATES_TTL_SECONDS, but
+stored prices never do: writes read the rate from the table, and after
+committing check their offers against it (``repair``), since a rate load
+committed alongside the write can miss it. load_rates runs a last repair pass
+after its own commit for the same reason, so no offer keeps an old base price.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, or_, update
+from sqlmodel import Session, col, select
+
+import read_cache
+import settings
+from database import BASE_DIR, engine
+from models import FxRate, Offer
+
+FX_BASE_CURRENCY = settings.get("FX_BASE_CURRENCY", "PLN")
+FX_RATES_FILE = settings.get("FX_RATES_FILE", os.path.join(BASE_DIR, "fx_rates.json"))
+FX_RATES_TTL_SECONDS = settings.get_float("FX_RATES_TTL_SECONDS", 60)
+
+_rates: Dict[str, float] = {}
+_loaded_at = float("-inf")
+_lock = threading.Lock()
+
+
+def rates(session: Session, fresh: bool = False) -> Dict[str, float]:
+    """Currency -> units of base currency, reread from the table every FX_RATES_TTL_SECONDS.
+
+    Pass ``fresh`` when the result is stored (unit_price_base), not just displayed.
+    """
+    global _rates, _loaded_at
+    if fresh or time.monotonic() - _loaded_at >= FX_RATES_TTL_SECONDS:
+        fresh = dict(session.exec(select(FxRate.currency, FxRate.rate)).all())
+        with _lock:
+            _rates, _loaded_at = fresh, time.monotonic()
+    return _rates
+
+
+def rate(session: Session, currency: str, fresh: bool = False) -> float:
+    found = rates(session, fresh).get(currency)
+    if found is None:
+        raise HTTPException(status_code=400, detail=f"Validation error: unsupported currency {currency}")
+    return found
+
+
+def to_base(session: Session, price: float, currency: str) -> float:
+    # Same expression as reprice(), so Python and SQL agree to the last bit.
+    return price * rate(session, currency, fresh=True)
+
+
+def from_base(price_base: Optional[float], currency_rate: float) -> Optional[float]:
+    return None if price_base is None else round(price_base / currency_rate, 2)
+
+
+def _current_base():
+    current = select(FxRate.rate).where(FxRate.currency == Offer.currency).scalar_subquery()
+    return Offer.unit_price * current
+
+
+def reprice(conn, currencies: Iterable[str]) -> int:
+    """Recompute unit_price_base for offers in ``currencies`` and any not priced yet, in one UPDATE."""
+    stmt = (
+        update(Offer)
+        .where(or_(col(Offer.currency).in_(list(currencies)), col(Offer.unit_price_base).is_(None)))
+        .values(unit_price_base=_current_base())
+        .execution_options(synchronize_session=False)
+    )
+    return conn.execute(stmt).rowcount
+
+
+def repair(conn, offer_ids: Optional[Iterable[int]] = None, currencies: Optional[Iterable[str]] = None) -> List[int]:
+    """Reprice the given offers whose unit_price_base no longer matches the stored rate; returns their ids.
+
+    A read first, so the usual case (nothing stale) takes no write lock.
+    """
+    stale = col(Offer.unit_price_base).is_distinct_from(_current_base())
+    if offer_ids is not None:
+        stale = stale & col(Offer.id).in_(list(offer_ids))
+    if currencies is not None:
+        stale = stale & col(Offer.currency).in_(list(currencies))
+    ids = conn.execute(select(Offer.id).where(stale)).scalars().all()
+    if ids:
+        conn.execute(
+            update(Offer).where(col(Offer.id).in_(ids)).values(unit_price_base=_current_base())
+            .execution_options(synchronize_session=False)
+        )
+    return ids
+
+
+def repair_offers(session: Session, offer_ids: Iterable[int]) -> List[int]:
+    """After a committed offer write: fix any base price computed from a rate replaced meanwhile."""
+    repaired = repair(session.connection(), offer_ids)
+    session.commit()
+    if repaired:
+        read_cache.invalidate_offers(repaired)
+    return repaired
+
+
+def load_rates(path: str = FX_RATES_FILE, bind=None) -> dict:
+    """Store the rates in ``path`` and reprice the offers whose rate changed.
+
+    The file is ``{"base": "PLN", "rates": {"EUR": 4.27, ...}}``; currencies
+    missing from it keep their stored rate.
+    """
+    global _loaded_at
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("base", FX_BASE_CURRENCY) != FX_BASE_CURRENCY:
+        raise ValueError(f"{path}: rates are not in FX_BASE_CURRENCY {FX_BASE_CURRENCY}")
+    new = {FX_BASE_CURRENCY: 1.0, **{c.upper(): float(r) for c, r in data["rates"].items()}}
+
+    now = datetime.utcnow()
+    with (bind or engine).begin() as conn:
+        stored = dict(conn.execute(select(FxRate.currency, FxRate.rate)).all())
+        changed = sorted(c for c, r in new.items() if stored.get(c) != r)
+        if changed:
+            conn.execute(delete(FxRate).where(col(FxRate.currency).in_(changed)))
+            conn.execute(insert(FxRate), [{"currency": c, "rate": new[c], "updated_at": now} for c in changed])
+        repriced = reprice(conn, changed)
+    if changed:
+        # Offers written with the old rates that committed after the UPDATE above began.
+        with (bind or engine).begin() as conn:
+            repriced += len(repair(conn, currencies=changed))
+    with _lock:
+        _loaded_at = float("-inf")
+    if repriced:
+        read_cache.invalidate_offers()
+    return {"changed": changed, "repriced": repriced}
+
+
+if __name__ == "__main__":
+    print(load_rates(*sys.argv[1:2]))
@@ -0,0 +1,220 @@
+"""Offer coordinates and radius search.
+
+Offer locations are free text; they are geocoded against a bundled offline
+gazetteer of Polish and EU towns (GAZETTEER_FILE) into offer.latitude /
+offer.longitude. Locations the gazetteer does not know stay without
+coordinates and never match a radius filter.
+
+A spatial shadow index keyed by offer id narrows radius queries to a bounding
+box: an R-tree virtual table on SQLite (carrying ``active`` as an auxiliary
+column, so the common listing never reads offer rows it will not return), the
+(latitude, longitude) B-tree index on Postgres. Distances use the
+equirectangular approximation, which is within 0.5% of the great-circle
+distance at the few-hundred-kilometre radii buyers ask for and needs nothing
+but arithmetic in SQL.
+"""
+import csv
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Float, Integer, func, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, col, select
+
+import settings
+from models import Offer
+from pagination import keyset_after
+from search import fold
+
+GAZETTEER_FILE = settings.get("GAZETTEER_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+MAX_RADIUS_KM = 2000.0
+KM_PER_DEGREE = 111.195  # along a meridian, mean Earth radius 6371 km
+PAGE_RADIUS_START_KM = 2.0
+# From this many offers in the radius on, listings not sorted by distance walk
+# their sort index and test each row's distance instead of joining the hits.
+DENSE_HITS = settings.get_int("GEO_DENSE_HITS", 5000)
+
+# Location text is tried whole, then by comma/slash separated parts, then by word runs.
+_PART_RE = re.compile(r"[,;/()]+")
+_WORD_RE = re.compile(r"[\w-]+")
+_gazetteer: Optional[Dict[str, Tuple[float, float]]] = None
+
+
+def gazetteer() -> Dict[str, Tuple[float, float]]:
+    """Folded town name (and alias) -> (latitude, longitude)."""
+    global _gazetteer
+    if _gazetteer is None:
+        places = {}
+        with open(GAZETTEER_FILE, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["latitude"]), float(row["longitude"]))
+                for name in [row["name"], *(row["aliases"] or "").split("|")]:
+                    if name.strip():
+                        places.setdefault(fold(name.strip()), point)
+        _gazetteer = places
+    return _gazetteer
+
+
+def geocode(location: Optional[str]) -> Optional[Tuple[float, float]]:
+    places = gazetteer()
+    folded = fold(location).strip()
+    if not folded:
+        return None
+    if folded in places:
+        return places[folded]
+    for part in _PART_RE.split(folded):
+        words = _WORD_RE.findall(part)
+        # Longest run of words first, so "Nowy Sącz" wins over a town called "Nowy".
+        for size in range(len(words), 0, -1):
+            for start in range(len(words) - size + 1):
+                point = places.get(" ".join(words[start:start + size]))
+                if point is not None:
+                    return point
+    return None
+
+
+def parse_near(near: str) -> Tuple[float, float]:
+    """``near`` is "lat,lon" or a town name from the gazetteer."""
+    try:
+        lat, lon = (float(v) for v in near.split(","))
+    except ValueError:
+        point = geocode(near)
+        if point is None:
+            raise HTTPException(status_code=400, detail=f"Validation error: unknown place {near}")
+        return point
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Validation error: near must be lat,lon in degrees")
+    return lat, lon
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def ensure_index(engine: Engine) -> None:
+    """Geocode offers that have no coordinates yet and create / backfill the spatial index."""
+    with engine.begin() as conn:
+        locations = conn.execute(
+            select(Offer.location).where(col(Offer.latitude).is_(None)).distinct()
+        ).scalars().all()
+        located = [(loc, geocode(loc)) for loc in locations]
+        params = [{"b_loc": loc, "b_lat": p[0], "b_lon": p[1]} for loc, p in located if p is not None]
+        if params:
+            # One UPDATE per distinct location rather than per offer.
+            conn.execute(
+                text("UPDATE offer SET latitude = :b_lat, longitude = :b_lon WHERE location = :b_loc AND latitude IS NULL"),
+                params,
+            )
+        if _dialect(conn) == "postgresql":
+            return
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS offer_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon, +active)"
+        ))
+        if params or not conn.execute(text("SELECT count(*) FROM offer_geo")).scalar_one():
+            conn.execute(text(
+                "INSERT OR REPLACE INTO offer_geo "
+                "SELECT id, latitude, latitude, longitude, longitude, active FROM offer WHERE latitude IS NOT NULL"
+            ))
+
+
+def locate(offer: Offer) -> None:
+    """Set the offer's coordinates from its location text."""
+    offer.latitude, offer.longitude = geocode(offer.location) or (None, None)
+
+
+def index_offer(session: Session, offer: Offer) -> None:
+    """Geocode one offer and upsert it into the spatial index; call before the session commits."""
+    locate(offer)
+    if offer.id is None:
+        session.flush()
+    index_rows(session.connection(), [
+        {"id": offer.id, "latitude": offer.latitude, "longitude": offer.longitude, "active": offer.active}
+    ])
+
+
+def index_rows(conn: Connection, rows: List[dict]) -> None:
+    """Upsert (or drop, when not located) index entries for raw offer rows (id, latitude, longitude, active)."""
+    if not rows or _dialect(conn) == "postgresql":
+        return
+    located = [r for r in rows if r["latitude"] is not None]
+    if located:
+        conn.execute(
+            text("INSERT OR REPLACE INTO offer_geo VALUES (:id, :latitude, :latitude, :longitude, :longitude, :active)"),
+            located,
+        )
+    missing = [{"id": r["id"]} for r in rows if r["latitude"] is None]
+    if missing:
+        conn.execute(text("DELETE FROM offer_geo WHERE id = :id"), missing)
+
+
+def distance2(lat: float, lon: float):
+    """Squared distance in km² from (lat, lon) to an offer, on the offer's own columns."""
+    dy = (col(Offer.latitude) - lat) * KM_PER_DEGREE
+    dx = (col(Offer.longitude) - lon) * (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    return dx * dx + dy * dy
+
+
+def within(session: Session, lat: float, lon: float, radius_km: float, active: Optional[bool] = None):
+    """Subquery of (offer_id, distance2) for offers within ``radius_km``; distance2 is in km².
+
+    Answered from the spatial index alone (bounding box, then exact distance),
+    so callers can pick a page of ids before touching the offer table. The
+    R-tree stores 32-bit coordinates: distances are good to about a metre.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    params = {
+        "lat": lat, "lon": lon, "ky": KM_PER_DEGREE, "kx": KM_PER_DEGREE * math.cos(math.radians(lat)),
+        "r2": radius_km * radius_km,
+        "lat_lo": lat - dlat, "lat_hi": lat + dlat, "lon_lo": lon - dlon, "lon_hi": lon + dlon,
+    }
+    if _dialect(session.get_bind()) == "postgresql":
+        source, lat_col, lon_col = "offer", "latitude", "longitude"
+        box = "latitude BETWEEN :lat_lo AND :lat_hi AND longitude BETWEEN :lon_lo AND :lon_hi"
+    else:
+        source, lat_col, lon_col = "offer_geo", "min_lat", "min_lon"
+        box = "min_lat >= :lat_lo AND max_lat <= :lat_hi AND min_lon >= :lon_lo AND max_lon <= :lon_hi"
+    distance2 = (
+        f"(({lat_col} - :lat) * :ky) * (({lat_col} - :lat) * :ky)"
+        f" + (({lon_col} - :lon) * :kx) * (({lon_col} - :lon) * :kx)"
+    )
+    where = f"{box} AND {distance2} <= :r2"
+    if active is not None:
+        where += " AND active = :active"
+        params["active"] = active
+    stmt = text(f"SELECT id AS offer_id, {distance2} AS distance2 FROM {source} WHERE {where}")
+    return stmt.bindparams(**params).columns(offer_id=Integer, distance2=Float).subquery("geo_hits")
+
+
+def dense(session: Session, lat: float, lon: float, radius_km: float, active: Optional[bool]) -> bool:
+    """Whether at least DENSE_HITS offers lie within ``radius_km``; counting stops there."""
+    hits = within(session, lat, lon, radius_km, active)
+    probe = select(hits.c.offer_id).limit(DENSE_HITS).subquery()
+    return session.exec(select(func.count()).select_from(probe)).one() >= DENSE_HITS
+
+
+def page_radius(session: Session, lat: float, lon: float, radius_km: float, active: Optional[bool],
+                cursor: Optional[str], limit: int, filters: List = ()) -> float:
+    """Smallest radius, growing 4x from a few km up to ``radius_km``, that holds the next distance-sorted page.
+
+    Any offer inside it is nearer than every offer outside, so the page read
+    within it is exact; each probe stops at limit + 1 hits, so a dense area
+    never scans its whole radius. ``filters`` are further WHERE clauses on offer.
+    """
+    r = min(PAGE_RADIUS_START_KM, radius_km)
+    while r < radius_km:
+        hits = within(session, lat, lon, r, active)
+        probe = select(hits.c.offer_id)
+        if filters:
+            probe = probe.join(Offer, Offer.id == hits.c.offer_id).where(*filters)
+        after = keyset_after(hits.c.distance2, hits.c.offer_id, cursor, key_type=float, descending=False)
+        if after is not None:
+            probe = probe.where(after)
+        found = session.exec(select(func.count()).select_from(probe.limit(limit + 1).subquery())).one()
+        if found > limit:
+            return r
+        r *= 4
+    return radius_km
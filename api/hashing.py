@@ -0,0 +1,33 @@
+"""Password hashing primitives.
+
+Kept free of app imports so process-pool workers can load it cheaply.
+"""
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+import settings
+
+# Raising the cost only affects new hashes; existing ones are upgraded on the
+# next successful login (see verify_and_rehash).
+BCRYPT_ROUNDS = settings.get_int("BCRYPT_ROUNDS", 12)
+
+# Use bcrypt_sha256 to avoid the 72-byte password length limit of raw bcrypt.
+pwd_ctx = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto", bcrypt_sha256__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password(plain: str) -> str:
+    return pwd_ctx.hash(plain)
+
+
+def verify_password(plain: str, hashed: str) -> bool:
+    return pwd_ctx.verify(plain, hashed)
+
+
+def verify_and_rehash(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; on success also return a fresh hash if the stored one uses outdated settings."""
+    if not pwd_ctx.verify(plain, hashed):
+        return False, None
+    if pwd_ctx.needs_update(hashed):
+        return True, pwd_ctx.hash(plain)
+    return True, None
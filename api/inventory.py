@@ -0,0 +1,97 @@
+"""Offer stock: atomic reservations for orders and optimistic offer updates."""
+from datetime import datetime
+from typing import Dict
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlmodel import Session
+
+import geo
+import search
+from models import Offer
+
+MAX_UPDATE_ATTEMPTS = 3
+
+
+def sku_conflict(sku: str) -> HTTPException:
+    """409 for a SKU the producer already uses on another offer (ux_offer_producer_sku)."""
+    return HTTPException(status_code=409, detail=f"Conflict: you already have an offer with SKU {sku!r}")
+
+
+def reserve(session: Session, offer_id: int, quantity: int):
+    """Take ``quantity`` units of an active offer.
+
+    Returns the offer's unit_price (to snapshot), remaining quantity, producer_id
+    and product_category.
+
+    A single conditional UPDATE checks and decrements stock, so concurrent buyers
+    can never oversell. It runs in the caller's transaction and is undone if that
+    transaction rolls back.
+    """
+    stmt = (
+        update(Offer)
+        .where(Offer.id == offer_id, Offer.active == True, Offer.quantity >= quantity)
+        .values(quantity=Offer.quantity - quantity, version=Offer.version + 1, updated_at=datetime.utcnow())
+        .returning(Offer.unit_price, Offer.quantity, Offer.producer_id, Offer.product_category)
+        .execution_options(synchronize_session=False)
+    )
+    reserved = session.exec(stmt).one_or_none()
+    if reserved is not None:
+        return reserved
+    offer = session.get(Offer, offer_id)
+    if not offer or not offer.active:
+        raise HTTPException(status_code=404, detail="Not found")
+    raise HTTPException(status_code=400, detail="Validation error: quantity exceeds available offer quantity")
+
+
+def reserve_many(session: Session, wanted: Dict[int, int], offers: Dict[int, Offer]) -> bool:
+    """Reserve stock for several offers with one executemany round trip.
+
+    ``wanted`` maps offer id to quantity; ``offers`` are the rows the caller
+    validated it against. A row only changes if it still has the version that was
+    loaded, so those checks (and the prices read from it) still hold. Returns False
+    if any offer changed in the meantime; the caller must then roll back.
+    """
+    table = Offer.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("b_id"), table.c.version == bindparam("b_version"))
+        .values(
+            quantity=table.c.quantity - bindparam("b_quantity"),
+            version=table.c.version + 1,
+            updated_at=bindparam("b_updated_at"),
+        )
+    )
+    now = datetime.utcnow()
+    params = [
+        {"b_id": offer_id, "b_version": offers[offer_id].version, "b_quantity": quantity, "b_updated_at": now}
+        for offer_id, quantity in wanted.items()
+    ]
+    return session.connection().execute(stmt, params).rowcount == len(params)
+
+
+def commit_offer_update(session: Session, offer: Offer, changes: dict) -> Offer:
+    """Apply ``changes`` and commit, re-applying them on a fresh copy if the row changed meanwhile."""
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        for k, v in changes.items():
+            setattr(offer, k, v)
+        offer.updated_at = datetime.utcnow()
+        session.add(offer)
+        try:
+            geo.index_offer(session, offer)
+            search.index_offer(session, offer)
+            session.commit()
+        except StaleDataError:
+            session.rollback()
+            session.refresh(offer)
+            continue
+        except IntegrityError:
+            session.rollback()
+            if changes.get("sku") is None:
+                raise
+            raise sku_conflict(changes["sku"])
+        session.refresh(offer)
+        return offer
+    raise HTTPException(status_code=409, detail="Conflict: offer was modified concurrently, retry")
@@ -1,13 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from database import create_db_and_tables
+import agents
+import events
+import fast_json
+import matching
+import metrics
+import migrate
+import negotiations
+import rate_limit
+import read_cache
+from auth import shutdown_hash_executor
+from database import async_engine, engine, pool_stats, replica_stats, replicas
 from routes_auth import router as auth_router
+from routes_events import router as events_router
+from routes_negotiations import router as negotiations_router
 from routes_offers import router as offers_router
 from routes_orders import router as orders_router
 from routes_stats import router as stats_router
 
-app = FastAPI(title="Producer-Buyer POC", version="0.1.0")
+app = FastAPI(title="Producer-Buyer POC", version="0.1.0", default_response_class=fast_json.response_class)
+
+# Inside CORS, so 429/503 responses still carry the CORS headers browsers need to read them.
+if rate_limit.ENABLED:
+    app.add_middleware(rate_limit.RateLimitMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,15 +34,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so request timings include the other middleware.
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument(engine)
+    if async_engine is not None:
+        metrics.instrument(async_engine.sync_engine)
+    for replica in replicas:
+        metrics.instrument(replica.engine)
+        if replica.async_engine is not None:
+            metrics.instrument(replica.async_engine.sync_engine)
+
 app.include_router(auth_router)
 app.include_router(offers_router)
 app.include_router(orders_router)
 app.include_router(stats_router)
+app.include_router(events_router)
+app.include_router(negotiations_router)
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
+    # Schema changes and the FX fixture are applied by `python migrate.py upgrade`, once per deploy.
+    migrate.check(engine)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    negotiations.start_sweeper()
+    agents.start_agents()
+    matching.start_matcher()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    negotiations.stop_sweeper()
+    agents.stop_agents()
+    matching.stop_matcher()
+    shutdown_hash_executor()
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in replicas:
+        replica.engine.dispose()
+        if replica.async_engine is not None:
+            await replica.async_engine.dispose()
 
 @app.get("/api/health")
 def health():
-    return {"status": "ok"}
+    pools = {"sync": pool_stats(engine)}
+    if async_engine is not None:
+        pools["async"] = pool_stats(async_engine)
+    if replicas:
+        pools["read"] = replica_stats()
+    return {"status": "ok", "pools": pools, "read_cache": read_cache.metrics(), "events": events.bus.stats(), "agents": agents.stats(), "matching": matching.stats(), "rate_limit": rate_limit.stats()}
+
+if metrics.METRICS_ENABLED:
+    @app.get("/api/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        pool = pool_stats(engine)
+        cache = read_cache.metrics()
+        gauges = {
+            "app_db_pool_checked_out": pool.get("checkedout"),
+            "app_db_pool_size": pool.get("size"),
+            "app_read_cache_entries": cache["entries"],
+            "app_admission_active": rate_limit.stats()["active"],
+            "app_admission_waiting": rate_limit.stats()["waiting"],
+        }
+        if replicas:
+            read = replica_stats()
+            gauges["app_db_replicas_up"] = sum(r["up"] for r in read["replicas"])
+            for route in ("replica", "primary_sticky", "primary_fallback"):
+                gauges[f"app_db_reads_{route}"] = read[route]
+        return PlainTextResponse(metrics.render(gauges), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,350 @@
+"""Order-book matching: fill a buyer's demand across fungible offers by price-time priority.
+
+Resting offers live in memory per commodity (category, currency) as
+ascending price levels, each level oldest first (created_at, id). A demand
+names a category, optionally a product name prefix and a location, a quantity
+and a max price; it takes the cheapest, then oldest, matching offers until
+filled.
+
+Demands are queued and matched by one worker in batches of up to MATCH_BATCH:
+a batch is planned against the book in memory and written in one transaction
+(one executemany stock UPDATE, one multi-row order INSERT). The UPDATE only
+applies while an offer is active, unchanged in price and still has the stock;
+if any row fails that, the batch rolls back, the offers involved are reloaded
+and its demands are replayed one transaction each, so nothing is oversold.
+
+The book follows the offer table by reloading rows whose updated_at moved
+(every offer write bumps it) at most every MATCH_SYNC_SECONDS, so offers
+created or repriced by any worker are matched within that window.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, insert
+from sqlmodel import Session, col, select
+
+import events
+import read_cache
+import settings
+from database import engine
+from models import Offer, Order, OrderStatus
+from schemas import MatchCreate, MatchResult, OrderPublic
+
+MATCH_BATCH = settings.get_int("MATCH_BATCH", 256)
+MATCH_SYNC_SECONDS = settings.get_float("MATCH_SYNC_SECONDS", 1)
+MAX_REPLAY_ATTEMPTS = 3
+# Re-read a little before the last seen updated_at: rows can commit out of order.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Resting:
+    id: int
+    producer_id: int
+    book: Tuple[str, str]  # (category, currency)
+    product_name: str
+    location: str
+    unit_price: float
+    created_at: datetime
+    quantity: int
+
+
+class PriceLevels:
+    """The resting offers of one commodity: ascending prices, each level oldest first."""
+
+    def __init__(self):
+        self.prices: List[float] = []
+        self.levels: Dict[float, list] = {}
+
+    def add(self, offer: Resting) -> None:
+        level = self.levels.get(offer.unit_price)
+        if level is None:
+            bisect.insort(self.prices, offer.unit_price)
+            level = self.levels[offer.unit_price] = []
+        bisect.insort(level, (offer.created_at, offer.id))
+
+    def remove(self, offer: Resting) -> None:
+        level = self.levels[offer.unit_price]
+        del level[bisect.bisect_left(level, (offer.created_at, offer.id))]
+        if not level:
+            del self.levels[offer.unit_price]
+            del self.prices[bisect.bisect_left(self.prices, offer.unit_price)]
+
+    def __bool__(self) -> bool:
+        return bool(self.prices)
+
+    def __iter__(self):
+        for price in self.prices:
+            for created_at, offer_id in self.levels[price]:
+                yield price, created_at, offer_id
+
+
+# Columns the book needs from the offer table.
+BOOK_COLUMNS = (
+    Offer.id, Offer.producer_id, Offer.product_category, Offer.product_name, Offer.currency,
+    Offer.location, Offer.unit_price, Offer.created_at, Offer.quantity, Offer.active, Offer.updated_at,
+)
+
+
+class OrderBook:
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget everything; the next sync reloads the whole book."""
+        self.offers: Dict[int, Resting] = {}
+        self.books: Dict[Tuple[str, str], PriceLevels] = {}
+        self.watermark: Optional[datetime] = None
+        self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.offers)
+
+    def discard(self, offer_id: int) -> None:
+        offer = self.offers.pop(offer_id, None)
+        if offer is None:
+            return
+        levels = self.books[offer.book]
+        levels.remove(offer)
+        if not levels:
+            del self.books[offer.book]
+
+    def upsert(self, row) -> None:
+        self.discard(row.id)
+        if not row.active or row.quantity <= 0:
+            return
+        offer = Resting(
+            id=row.id, producer_id=row.producer_id, book=(row.product_category, row.currency),
+            product_name=row.product_name.casefold(), location=row.location,
+            unit_price=row.unit_price, created_at=row.created_at, quantity=row.quantity,
+        )
+        self.offers[offer.id] = offer
+        levels = self.books.get(offer.book)
+        if levels is None:
+            levels = self.books[offer.book] = PriceLevels()
+        levels.add(offer)
+
+    def take(self, offer: Resting, quantity: int) -> None:
+        offer.quantity -= quantity
+        if offer.quantity <= 0:
+            self.discard(offer.id)
+
+    def sync(self, session: Session, force: bool = False) -> int:
+        """Load offers changed since the last sync (everything the first time). Returns how many rows."""
+        if not force and time.monotonic() - self.synced_at < MATCH_SYNC_SECONDS:
+            return 0
+        stmt = select(*BOOK_COLUMNS)
+        if self.watermark is None:
+            stmt = stmt.where(Offer.active == True, Offer.quantity > 0)
+        else:
+            stmt = stmt.where(Offer.updated_at >= self.watermark - SYNC_OVERLAP)
+        self.synced_at = time.monotonic()
+        rows = session.exec(stmt).all()
+        for row in rows:
+            self.upsert(row)
+            if self.watermark is None or row.updated_at > self.watermark:
+                self.watermark = row.updated_at
+        if self.watermark is None:
+            self.watermark = datetime.utcnow()
+        return len(rows)
+
+    def reload(self, session: Session, offer_ids: Iterable[int]) -> None:
+        offer_ids = set(offer_ids)
+        rows = session.exec(select(*BOOK_COLUMNS).where(col(Offer.id).in_(offer_ids))).all()
+        for row in rows:
+            self.upsert(row)
+        for offer_id in offer_ids - {row.id for row in rows}:
+            self.discard(offer_id)
+
+    def plan(self, demand: MatchCreate) -> List[Tuple[Resting, int]]:
+        """The (offer, quantity) fills for ``demand``, best price first; the book is not changed."""
+        product = demand.product_name.casefold() if demand.product_name else None
+        remaining, fills = demand.quantity, []
+        for price, _, offer_id in self.books.get((demand.product_category, demand.currency), ()):
+            if price > demand.max_price or remaining == 0:
+                break
+            offer = self.offers[offer_id]
+            if product is not None and not offer.product_name.startswith(product):
+                continue
+            if demand.location is not None and offer.location != demand.location:
+                continue
+            quantity = min(remaining, offer.quantity)
+            fills.append((offer, quantity))
+            remaining -= quantity
+        if remaining and demand.mode == "fill_or_kill":
+            return []
+        return fills
+
+
+book = OrderBook()
+
+
+def _reserve_stmt():
+    table = Offer.__table__
+    return (
+        table.update()
+        .where(
+            table.c.id == bindparam("b_id"),
+            table.c.active == True,
+            table.c.unit_price == bindparam("b_price"),
+            table.c.quantity >= bindparam("b_quantity"),
+        )
+        .values(
+            quantity=table.c.quantity - bindparam("b_quantity"),
+            version=table.c.version + 1,
+            updated_at=bindparam("b_now"),
+        )
+    )
+
+
+def _write(session: Session, plans: List[Tuple[int, list]]) -> Optional[List[List[OrderPublic]]]:
+    """Persist (buyer_id, fills) plans in the session's transaction and commit.
+
+    Returns the orders of each plan, or None (rolled back) if an offer no longer
+    has the price or stock the plan was made against.
+    """
+    now = datetime.utcnow()
+    wanted: Dict[int, list] = {}
+    for _, fills in plans:
+        for offer, quantity in fills:
+            wanted.setdefault(offer.id, [offer.unit_price, 0])[1] += quantity
+    if not wanted:
+        return [[] for _ in plans]
+    params = [
+        {"b_id": offer_id, "b_price": price, "b_quantity": quantity, "b_now": now}
+        for offer_id, (price, quantity) in wanted.items()
+    ]
+    conn = session.connection()
+    if conn.execute(_reserve_stmt(), params).rowcount != len(params):
+        session.rollback()
+        return None
+    rows = [
+        {
+            "buyer_id": buyer_id, "offer_id": offer.id, "quantity": quantity,
+            "unit_price_snapshot": offer.unit_price, "status": OrderStatus.PLACED, "created_at": now,
+        }
+        for buyer_id, fills in plans
+        for offer, quantity in fills
+    ]
+    table = Order.__table__
+    # Ids come back in parameter order (see place_orders_batch).
+    ids = iter(conn.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all())
+    session.commit()
+    rows = iter(rows)
+    return [[OrderPublic(id=next(ids), **next(rows)) for _ in fills] for _, fills in plans]
+
+
+def _result(demand: MatchCreate, orders: List[OrderPublic]) -> MatchResult:
+    filled = sum(o.quantity for o in orders)
+    average = round(sum(o.quantity * o.unit_price_snapshot for o in orders) / filled, 4) if filled else None
+    return MatchResult(filled=filled, remaining=demand.quantity - filled, average_price=average, orders=orders)
+
+
+def _publish(plans: List[Tuple[int, list]], orders: List[List[OrderPublic]]) -> None:
+    touched = {}
+    for (_, fills), placed in zip(plans, orders):
+        for (offer, _), order in zip(fills, placed):
+            touched[offer.id] = offer
+            events.publish(events.ORDER_PLACED, order.model_dump(mode="json"),
+                           producer_id=offer.producer_id, buyer_id=order.buyer_id)
+    if not touched:
+        return
+    read_cache.invalidate_offers(touched)
+    for offer in touched.values():
+        events.publish(events.OFFER_STOCK, {"id": offer.id, "quantity": offer.quantity},
+                       producer_id=offer.producer_id, category=offer.book[0])
+
+
+def _plan_and_take(demand: MatchCreate) -> list:
+    fills = book.plan(demand)
+    for offer, quantity in fills:
+        book.take(offer, quantity)
+    return fills
+
+
+def match_batch(demands: List[Tuple[int, MatchCreate]], bind=None) -> List[MatchResult]:
+    """Match (buyer_id, demand) pairs in order against the book and place their orders."""
+    with Session(bind or engine) as session:
+        book.sync(session)
+        plans = [(buyer_id, _plan_and_take(demand)) for buyer_id, demand in demands]
+        orders = _write(session, plans)
+        if orders is not None:
+            _publish(plans, orders)
+            return [_result(demand, placed) for (_, demand), placed in zip(demands, orders)]
+
+        # Someone else changed an offer we planned against: resync it and
+        # replay the demands one by one.
+        book.reload(session, {offer.id for _, fills in plans for offer, _ in fills})
+        session.commit()
+        results = []
+        for buyer_id, demand in demands:
+            placed = []
+            for _ in range(MAX_REPLAY_ATTEMPTS):
+                plan = [(buyer_id, _plan_and_take(demand))]
+                written = _write(session, plan)
+                if written is not None:
+                    _publish(plan, written)
+                    placed = written[0]
+                    break
+                book.reload(session, {offer.id for offer, _ in plan[0][1]})
+                session.commit()
+            results.append(_result(demand, placed))
+        return results
+
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+
+
+async def _match_forever() -> None:
+    while True:
+        batch = [await _queue.get()]
+        while len(batch) < MATCH_BATCH and not _queue.empty():
+            batch.append(_queue.get_nowait())
+        try:
+            results = await run_in_threadpool(match_batch, [(buyer_id, demand) for buyer_id, demand, _ in batch])
+        except Exception as exc:
+            logger.exception("matching batch failed")
+            # The book may hold fills that were never written.
+            book.clear()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            continue
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def submit(buyer_id: int, demand: MatchCreate) -> MatchResult:
+    """Queue a demand for the matcher of this worker and wait for its result."""
+    start_matcher()
+    future = asyncio.get_running_loop().create_future()
+    await _queue.put((buyer_id, demand, future))
+    return await future
+
+
+def start_matcher() -> None:
+    global _queue, _worker
+    if _worker is None:
+        _queue = asyncio.Queue()
+        _worker = asyncio.get_running_loop().create_task(_match_forever())
+
+
+def stop_matcher() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        _worker = None
+
+
+def stats() -> dict:
+    return {"offers": len(book), "books": len(book.books), "queued": _queue.qsize() if _queue else 0}
@@ -0,0 +1,207 @@
+"""Request and database instrumentation, rendered for Prometheus at GET /api/metrics.
+
+MetricsMiddleware times every request into a per-route latency histogram.
+SQLAlchemy cursor hooks count the queries and database time of the request
+being served; both go back to the client in a Server-Timing header
+(``db;dur=3.1;desc="4 queries", app;dur=5.2``) and into per-route counters.
+Statements slower than SLOW_QUERY_MS are logged with their fingerprint
+(placeholders, literals and IN / VALUES lists collapsed) and counted per
+fingerprint.
+
+With METRICS_ENABLED=0 neither the middleware nor the hooks are installed, so
+requests and queries run exactly as before.
+"""
+import functools
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+import settings
+
+METRICS_ENABLED = settings.get_bool("METRICS_ENABLED", True)
+SLOW_QUERY_MS = settings.get_float("SLOW_QUERY_MS", 200)
+MAX_FINGERPRINTS = 500
+# Upper bounds in seconds, as Prometheus "le" labels; a final +Inf bucket is implied.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("slow_query")
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+# Set for the duration of a request; the cursor hooks add to it from whichever
+# thread or greenlet runs the handler, since they all share the request's context.
+_current: ContextVar[Optional[_RequestStats]] = ContextVar("metrics_request", default=None)
+
+# Request metrics are only touched on the event loop thread (middleware and the
+# async /api/metrics endpoint); query metrics come from worker threads.
+_requests: Dict[Tuple[str, str, str], _Histogram] = {}
+_route_db: Dict[str, list] = {}  # route -> [queries, seconds]
+_lock = threading.Lock()
+_background = [0, 0.0]  # queries and seconds outside any request (sweepers, workers)
+_slow: Dict[str, list] = {}  # fingerprint -> [count, seconds, max seconds]
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses (SSE) pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                app_ms = (time.perf_counter() - start) * 1000
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", app;dur={app_ms:.1f}'
+                )
+                message["headers"] = [*message.get("headers", ()), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # FastAPI stores the matched route in the scope; unmatched paths share one label.
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            key = (scope["method"], route, str(status))
+            histogram = _requests.get(key)
+            if histogram is None:
+                histogram = _requests[key] = _Histogram()
+            histogram.observe(time.perf_counter() - start)
+            if stats.queries:
+                db = _route_db.setdefault(route, [0, 0.0])
+                db[0] += stats.queries
+                db[1] += stats.db_seconds
+
+
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|\$\d+|(?<![:\w]):\w+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """Statement shape: parameters and literals as ?, any list of them as (...)."""
+    shape = _PLACEHOLDER_RE.sub("?", statement)
+    shape = _ROWS_RE.sub("(...)", _LIST_RE.sub("(...)", shape))
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    else:
+        with _lock:
+            _background[0] += 1
+            _background[1] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        shape = fingerprint(statement)
+        logger.warning("slow query %.1f ms: %s", elapsed * 1000, shape)
+        with _lock:
+            entry = _slow.get(shape)
+            if entry is None and len(_slow) < MAX_FINGERPRINTS:
+                entry = _slow[shape] = [0, 0.0, 0.0]
+            if entry is not None:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+
+def instrument(engine) -> None:
+    """Attach the query hooks to a (sync) Engine; for an AsyncEngine pass its sync_engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _labels(**labels: str) -> str:
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def render(gauges: Optional[Dict[str, float]] = None) -> str:
+    """All metrics in the Prometheus text exposition format; ``gauges`` adds plain name -> value samples."""
+    lines = [
+        "# HELP app_http_request_duration_seconds Request latency by route.",
+        "# TYPE app_http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), h in sorted(_requests.items()):
+        cumulative = 0
+        for bound, n in zip((*LATENCY_BUCKETS, "+Inf"), h.counts):
+            cumulative += n
+            le = bound if isinstance(bound, str) else repr(bound)
+            lines.append(f"app_http_request_duration_seconds_bucket"
+                         f"{_labels(method=method, route=route, status=status, le=le)} {cumulative}")
+        labels = _labels(method=method, route=route, status=status)
+        lines.append(f"app_http_request_duration_seconds_sum{labels} {h.total:.6f}")
+        lines.append(f"app_http_request_duration_seconds_count{labels} {h.count}")
+
+    with _lock:
+        background = list(_background)
+        slow = {shape: list(entry) for shape, entry in _slow.items()}
+    routes = sorted(_route_db.items()) + [("<background>", background)]
+    lines += ["# HELP app_db_queries_total Statements executed, by route.", "# TYPE app_db_queries_total counter"]
+    lines += [f"app_db_queries_total{_labels(route=route)} {db[0]}" for route, db in routes]
+    lines += ["# HELP app_db_query_seconds_total Time spent in statements, by route.",
+              "# TYPE app_db_query_seconds_total counter"]
+    lines += [f"app_db_query_seconds_total{_labels(route=route)} {db[1]:.6f}" for route, db in routes]
+
+    lines += [f"# HELP app_db_slow_queries_total Statements slower than {SLOW_QUERY_MS:g} ms, by fingerprint.",
+              "# TYPE app_db_slow_queries_total counter"]
+    lines += [f"app_db_slow_queries_total{_labels(fingerprint=shape)} {entry[0]}" for shape, entry in slow.items()]
+    lines += ["# TYPE app_db_slow_query_seconds_total counter"]
+    lines += [f"app_db_slow_query_seconds_total{_labels(fingerprint=shape)} {entry[1]:.6f}"
+              for shape, entry in slow.items()]
+    lines += ["# TYPE app_db_slow_query_max_seconds gauge"]
+    lines += [f"app_db_slow_query_max_seconds{_labels(fingerprint=shape)} {entry[2]:.6f}"
+              for shape, entry in slow.items()]
+
+    for name, value in (gauges or {}).items():
+        if value is not None:
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
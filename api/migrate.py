@@ -0,0 +1,205 @@
+"""Versioned schema migrations, run once per deploy instead of at every worker start.
+
+    python migrate.py upgrade [VERSION]    apply pending migrations (default: all)
+    python migrate.py downgrade VERSION    revert down to VERSION (0 reverts everything)
+    python migrate.py current              applied version and the latest one
+    python migrate.py history              every migration, applied or not
+
+Migrations are the files migrations/NNNN_name.py, applied in version order.
+Each defines ``upgrade(conn)`` and ``downgrade(conn)`` and runs in its own
+transaction, recorded in schema_migrations with it. A migration that sets
+``TRANSACTIONAL = False`` gets an autocommit connection instead, which online
+index builds need: create_index uses CREATE INDEX CONCURRENTLY on PostgreSQL,
+so the table stays writable while the index is built.
+
+Migrations spell out their DDL instead of deriving it from models.py, so a
+fresh database goes through the same steps as an old one. Databases made by
+create_all before migrations existed may already have some of a migration's
+schema, so migrations stay idempotent (IF NOT EXISTS, add_missing_columns).
+
+After upgrading, the FX_RATES_FILE rates are loaded (python fx.py), which
+used to happen at every startup. The app itself only checks the version
+(``check``) and refuses to start against an out-of-date schema.
+"""
+import argparse
+import importlib.util
+import os
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from types import ModuleType
+from typing import List, Optional, Sequence
+
+from sqlalchemy import inspect as sa_inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+VERSION_TABLE = "schema_migrations"
+_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "TRANSACTIONAL", True)
+
+
+def discover() -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILE_RE.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(f"migrations.m{match[1]}", os.path.join(MIGRATIONS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append(Migration(int(match[1]), match[2], module))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def head() -> int:
+    """Latest version, from the file names alone (nothing is imported)."""
+    versions = [int(m[1]) for m in map(_FILE_RE.match, os.listdir(MIGRATIONS_DIR)) if m]
+    return max(versions, default=0)
+
+
+def current(engine: Engine) -> int:
+    with engine.connect() as conn:
+        if not sa_inspect(conn).has_table(VERSION_TABLE):
+            return 0
+        return conn.execute(text(f"SELECT max(version) FROM {VERSION_TABLE}")).scalar() or 0
+
+
+def check(engine: Engine) -> None:
+    """Raise unless the database is at the latest version; one query, no DDL."""
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(text(f"SELECT max(version) FROM {VERSION_TABLE}")).scalar() or 0
+    except DBAPIError:  # the version table itself is missing
+        version = 0
+    if version != head():
+        raise RuntimeError(
+            f"Database schema is at version {version}, the code expects {head()}: run `python migrate.py upgrade`"
+        )
+
+
+def _ensure_version_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            " version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def _run(engine: Engine, migration: Migration, step: str) -> None:
+    if step == "upgrade":
+        record = text(f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)").bindparams(
+            v=migration.version, n=migration.name, t=datetime.utcnow()
+        )
+    else:
+        record = text(f"DELETE FROM {VERSION_TABLE} WHERE version = :v").bindparams(v=migration.version)
+    if migration.transactional:
+        with engine.begin() as conn:
+            getattr(migration.module, step)(conn)
+            conn.execute(record)
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        getattr(migration.module, step)(conn)
+    with engine.begin() as conn:
+        conn.execute(record)
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    """Apply the pending migrations up to ``target``; returns those applied."""
+    _ensure_version_table(engine)
+    applied = current(engine)
+    pending = [m for m in discover() if applied < m.version <= (target if target is not None else head())]
+    for migration in pending:
+        _run(engine, migration, "upgrade")
+    return pending
+
+
+def downgrade(engine: Engine, target: int) -> List[Migration]:
+    """Revert the applied migrations above ``target``, newest first; returns those reverted."""
+    applied = current(engine)
+    reverted = [m for m in reversed(discover()) if target < m.version <= applied]
+    for migration in reverted:
+        _run(engine, migration, "downgrade")
+    return reverted
+
+
+# Helpers for migration scripts.
+
+def create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False) -> None:
+    """CREATE INDEX IF NOT EXISTS; CONCURRENTLY on PostgreSQL (needs a TRANSACTIONAL = False migration)."""
+    quote = conn.dialect.identifier_preparer.quote
+    online = " CONCURRENTLY" if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX{online} IF NOT EXISTS {quote(name)}"
+        f" ON {quote(table)} ({', '.join(quote(c) for c in columns)})"
+    ))
+
+
+def drop_index(conn: Connection, name: str) -> None:
+    online = " CONCURRENTLY" if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(f"DROP INDEX{online} IF EXISTS {conn.dialect.identifier_preparer.quote(name)}"))
+
+
+def add_missing_columns(conn: Connection, tables) -> None:
+    """ALTER TABLE ADD COLUMN for every column of ``tables`` the database lacks (they need a server default)."""
+    inspector = sa_inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    up = commands.add_parser("upgrade")
+    up.add_argument("version", type=int, nargs="?")
+    down = commands.add_parser("downgrade")
+    down.add_argument("version", type=int)
+    commands.add_parser("current")
+    commands.add_parser("history")
+    args = parser.parse_args(argv)
+
+    from database import engine
+
+    if args.command == "upgrade":
+        for migration in upgrade(engine, args.version):
+            print(f"applied {migration.version:04d}_{migration.name}")
+        if current(engine) == head():
+            import fx
+
+            if fx.FX_RATES_FILE:
+                print(f"fx rates: {fx.load_rates()}")
+    elif args.command == "downgrade":
+        for migration in downgrade(engine, args.version):
+            print(f"reverted {migration.version:04d}_{migration.name}")
+    elif args.command == "current":
+        print(f"{current(engine)} (latest {head()})")
+    else:
+        applied = current(engine)
+        for migration in discover():
+            print(f"{'*' if migration.version <= applied else ' '} {migration.version:04d}_{migration.name}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,56 @@
+"""Baseline: the user, offer and order tables as they were before migrations existed.
+
+The tables are spelled out here rather than taken from models.py, so the
+baseline stays what it was when the models change; every later change to the
+schema belongs to the migration that makes it. Databases made by create_all
+at startup already have these tables, and CREATE TABLE is skipped for them.
+"""
+from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "user", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("email", String, nullable=False, index=True, unique=True),
+    Column("password_hash", String, nullable=False),
+    Column("role", Enum("PRODUCER", "BUYER", name="userrole"), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+Table(
+    "offer", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("producer_id", Integer, ForeignKey("user.id"), nullable=False, index=True),
+    Column("product_name", String, nullable=False),
+    Column("product_category", String, nullable=False),
+    Column("sku", String),
+    Column("description", String),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_of_measure", String, nullable=False),
+    Column("unit_price", Float, nullable=False),
+    Column("currency", String, nullable=False),
+    Column("location", String, nullable=False),
+    Column("active", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+Table(
+    "order", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("buyer_id", Integer, ForeignKey("user.id"), nullable=False, index=True),
+    Column("offer_id", Integer, ForeignKey("offer.id"), nullable=False, index=True),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_price_snapshot", Float, nullable=False),
+    Column("status", Enum("PLACED", "CONFIRMED", name="orderstatus"), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn)
+
+
+def downgrade(conn):
+    metadata.drop_all(conn)
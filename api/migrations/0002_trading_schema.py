@@ -0,0 +1,88 @@
+"""Negotiations, bids, auto-responders and FX rates, and the offer columns they rely on.
+
+offer gains unit_price_base (price in FX_BASE_CURRENCY, for sorting across
+currencies), latitude/longitude (geo search) and version (optimistic locking
+of stock updates). Like the baseline, the DDL is frozen here; databases whose
+startup create_all already made some of it only get what they lack.
+"""
+from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, MetaData, String, Table, text
+
+from migrate import add_missing_columns
+
+metadata = MetaData()
+
+# Only the added columns: add_missing_columns compares them against the live table.
+offer_columns = Table(
+    "offer", MetaData(),
+    Column("unit_price_base", Float),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("version", Integer, nullable=False, server_default="1"),
+)
+
+# Referenced by the foreign keys below; created by the baseline, never by this migration.
+Table("user", metadata, Column("id", Integer, primary_key=True))
+Table("offer", metadata, Column("id", Integer, primary_key=True))
+Table("order", metadata, Column("id", Integer, primary_key=True))
+
+user_role = Enum("PRODUCER", "BUYER", name="userrole")
+
+negotiation = Table(
+    "negotiation", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("offer_id", Integer, ForeignKey("offer.id"), nullable=False),
+    Column("buyer_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("producer_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("status", Enum("PROPOSED", "COUNTERED", "ACCEPTED", "EXPIRED", name="negotiationstatus"), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_price", Float, nullable=False),
+    Column("last_bid_by", user_role, nullable=False),
+    Column("order_id", Integer, ForeignKey("order.id")),
+    Column("expires_at", DateTime, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+bid = Table(
+    "bid", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("negotiation_id", Integer, ForeignKey("negotiation.id"), nullable=False, index=True),
+    Column("author_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("author_role", user_role, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_price", Float, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+autoresponder = Table(
+    "autoresponder", metadata,
+    Column("producer_id", Integer, ForeignKey("user.id"), primary_key=True, autoincrement=False),
+    Column("enabled", Boolean, nullable=False),
+    Column("reserve_ratio", Float, nullable=False),
+    Column("concession_exponent", Float, nullable=False),
+    Column("max_rounds", Integer, nullable=False),
+    Column("volume_threshold", Integer),
+    Column("volume_discount", Float, nullable=False),
+    Column("repeat_buyer_discount", Float, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+fxrate = Table(
+    "fxrate", metadata,
+    Column("currency", String, primary_key=True),
+    Column("rate", Float, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+NEW_TABLES = [negotiation, bid, autoresponder, fxrate]
+
+
+def upgrade(conn):
+    add_missing_columns(conn, [offer_columns])
+    metadata.create_all(conn, tables=NEW_TABLES)
+
+
+def downgrade(conn):
+    metadata.drop_all(conn, tables=NEW_TABLES)
+    for column in offer_columns.columns:
+        conn.execute(text(f'ALTER TABLE offer DROP COLUMN "{column.name}"'))
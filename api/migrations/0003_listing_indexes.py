@@ -0,0 +1,60 @@
+"""Composite indexes behind the keyset-paginated listings, built online on existing tables.
+
+create_all only indexes the tables it creates, so databases older than these
+indexes never got them.
+"""
+from sqlalchemy import text
+
+from migrate import create_index, drop_index
+
+TRANSACTIONAL = False
+
+# (name, table, columns, unique)
+INDEXES = [
+    ("ix_offer_active_created", "offer", ("active", "created_at", "id"), False),
+    ("ix_offer_active_category_created", "offer", ("active", "product_category", "created_at", "id"), False),
+    ("ix_offer_active_location_created", "offer", ("active", "location", "created_at", "id"), False),
+    ("ix_offer_active_price_base", "offer", ("active", "unit_price_base", "id"), False),
+    ("ix_offer_lat_lon", "offer", ("latitude", "longitude"), False),
+    ("ix_offer_producer_created", "offer", ("producer_id", "created_at", "id"), False),
+    ("ix_offer_updated", "offer", ("updated_at",), False),
+    ("ux_offer_producer_sku", "offer", ("producer_id", "sku"), True),
+    ("ix_order_buyer_created", "order", ("buyer_id", "created_at", "id"), False),
+    ("ix_negotiation_offer_status", "negotiation", ("offer_id", "status"), False),
+    ("ix_negotiation_buyer_updated", "negotiation", ("buyer_id", "updated_at", "id"), False),
+    ("ix_negotiation_producer_updated", "negotiation", ("producer_id", "updated_at", "id"), False),
+    ("ix_negotiation_status_expires", "negotiation", ("status", "expires_at"), False),
+    ("ix_negotiation_pending", "negotiation", ("status", "last_bid_by", "updated_at"), False),
+]
+
+
+def _check_unique_skus(conn) -> None:
+    """Fail with the offending rows instead of a bare constraint error from the unique index."""
+    rows = conn.execute(text(
+        "SELECT o.producer_id, o.sku, o.id FROM offer o JOIN ("
+        " SELECT producer_id, sku FROM offer WHERE sku IS NOT NULL GROUP BY producer_id, sku HAVING count(*) > 1"
+        ") d ON d.producer_id = o.producer_id AND d.sku = o.sku ORDER BY o.producer_id, o.sku, o.id"
+    )).all()
+    if not rows:
+        return
+    groups = {}
+    for producer_id, sku, offer_id in rows:
+        groups.setdefault((producer_id, sku), []).append(offer_id)
+    listed = "; ".join(
+        f"producer {producer_id} SKU {sku!r}: offers {', '.join(map(str, ids))}" for (producer_id, sku), ids in groups.items()
+    )
+    raise RuntimeError(
+        f"Cannot create ux_offer_producer_sku, {len(groups)} SKU(s) are used by several offers of one producer"
+        f" ({listed}). Give those offers distinct SKUs (or clear them) and run the upgrade again."
+    )
+
+
+def upgrade(conn):
+    _check_unique_skus(conn)
+    for name, table, columns, unique in INDEXES:
+        create_index(conn, name, table, columns, unique)
+
+
+def downgrade(conn):
+    for name, *_ in reversed(INDEXES):
+        drop_index(conn, name)
@@ -0,0 +1,38 @@
+"""Search, geo and facet indexes kept beside the offer table, backfilled from it.
+
+Each module's ensure_index creates its tables (and triggers) and fills them
+in its own transactions, so this migration runs outside one.
+"""
+from sqlalchemy import text
+
+import facets
+import geo
+import search
+
+TRANSACTIONAL = False
+
+
+def upgrade(conn):
+    for module in (search, geo, facets):
+        module.ensure_index(conn.engine)
+
+
+def downgrade(conn):
+    if conn.dialect.name == "postgresql":
+        statements = [
+            "DROP TRIGGER IF EXISTS offer_facet_count ON offer",
+            "DROP FUNCTION IF EXISTS offer_facet_count()",
+            "DROP TABLE IF EXISTS offer_facet",
+            "DROP TABLE IF EXISTS offer_search",
+        ]
+    else:
+        statements = [
+            "DROP TRIGGER IF EXISTS offer_facet_insert",
+            "DROP TRIGGER IF EXISTS offer_facet_update",
+            "DROP TRIGGER IF EXISTS offer_facet_delete",
+            "DROP TABLE IF EXISTS offer_facet",
+            "DROP TABLE IF EXISTS offer_geo",
+            "DROP TABLE IF EXISTS offer_fts",
+        ]
+    for statement in statements:
+        conn.execute(text(statement))
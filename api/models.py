@@ -2,6 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
+from sqlalchemy import Column, Index, Integer
 from sqlmodel import SQLModel, Field, Relationship
 
 class UserRole(str, Enum):
@@ -10,7 +11,13 @@ class UserRole(str, Enum):
 
 class OrderStatus(str, Enum):
     PLACED = "PLACED"
-    CONFIRMED = "CONFIRMED"  # not used in POC but defined
+    CONFIRMED = "CONFIRMED"  # placed from an accepted negotiation
+
+class NegotiationStatus(str, Enum):
+    PROPOSED = "PROPOSED"  # buyer's opening bid
+    COUNTERED = "COUNTERED"
+    ACCEPTED = "ACCEPTED"  # turned into a CONFIRMED order
+    EXPIRED = "EXPIRED"
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -22,7 +29,30 @@ class User(SQLModel, table=True):
     offers: list["Offer"] = Relationship(back_populates="producer")
     orders: list["Order"] = Relationship(back_populates="buyer")
 
+# Optimistic-locking counter: ORM updates of an offer only apply if the row still
+# has the version that was loaded (StaleDataError otherwise), and every stock
+# reservation bumps it.
+offer_version_col = Column("version", Integer, nullable=False, default=1, server_default="1")
+
 class Offer(SQLModel, table=True):
+    # Composite indexes backing the keyset-paginated listing: every listing is
+    # ordered by (created_at, id) after equality filters on active/category/location.
+    __table_args__ = (
+        Index("ix_offer_active_created", "active", "created_at", "id"),
+        Index("ix_offer_active_category_created", "active", "product_category", "created_at", "id"),
+        Index("ix_offer_active_location_created", "active", "location", "created_at", "id"),
+        # Price filters and price sorting use the base-currency price (see fx.py).
+        Index("ix_offer_active_price_base", "active", "unit_price_base", "id"),
+        # Radius filters on Postgres (SQLite uses the offer_geo R-tree, see geo.py).
+        Index("ix_offer_lat_lon", "latitude", "longitude"),
+        Index("ix_offer_producer_created", "producer_id", "created_at", "id"),
+        # The matching engine's order book polls for offers changed since its last sync.
+        Index("ix_offer_updated", "updated_at"),
+        # Bulk imports upsert on (producer_id, sku); offers without a SKU are not constrained.
+        Index("ux_offer_producer_sku", "producer_id", "sku", unique=True),
+    )
+    __mapper_args__ = {"version_id_col": offer_version_col}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     producer_id: int = Field(foreign_key="user.id", index=True)
 
@@ -35,9 +65,14 @@ class Offer(SQLModel, table=True):
     unit_of_measure: str  # "kg", "t", "pcs"
     unit_price: float
     currency: str  # "PLN", "EUR", "USD"
+    unit_price_base: Optional[float] = None  # unit_price in FX_BASE_CURRENCY, maintained by fx.py
 
     location: str
+    # Geocoded from location by geo.py; None when the gazetteer does not know it.
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     active: bool = True
+    version: int = Field(default=1, sa_column=offer_version_col)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -46,6 +81,9 @@ class Offer(SQLModel, table=True):
     orders: list["Order"] = Relationship(back_populates="offer")
 
 class Order(SQLModel, table=True):
+    # Order history is listed per buyer, newest first.
+    __table_args__ = (Index("ix_order_buyer_created", "buyer_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     buyer_id: int = Field(foreign_key="user.id", index=True)
     offer_id: int = Field(foreign_key="offer.id", index=True)
@@ -57,3 +95,62 @@ class Order(SQLModel, table=True):
 
     buyer: Optional[User] = Relationship(back_populates="orders")
     offer: Optional[Offer] = Relationship(back_populates="orders")
+
+class Negotiation(SQLModel, table=True):
+    # Open negotiations are listed per offer and per party, newest activity first;
+    # the expiry sweeper walks (status, expires_at).
+    __table_args__ = (
+        Index("ix_negotiation_offer_status", "offer_id", "status"),
+        Index("ix_negotiation_buyer_updated", "buyer_id", "updated_at", "id"),
+        Index("ix_negotiation_producer_updated", "producer_id", "updated_at", "id"),
+        Index("ix_negotiation_status_expires", "status", "expires_at"),
+        # Bids awaiting a producer answer, oldest first (auto-responder ticks).
+        Index("ix_negotiation_pending", "status", "last_bid_by", "updated_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    offer_id: int = Field(foreign_key="offer.id")
+    buyer_id: int = Field(foreign_key="user.id")
+    producer_id: int = Field(foreign_key="user.id")  # copied from the offer for indexed lookups
+
+    status: NegotiationStatus = Field(default=NegotiationStatus.PROPOSED)
+    # Terms of the latest bid; the other party may counter or accept them.
+    quantity: int
+    unit_price: float
+    last_bid_by: UserRole
+    order_id: Optional[int] = Field(default=None, foreign_key="order.id")
+
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Bid(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    negotiation_id: int = Field(foreign_key="negotiation.id", index=True)
+    author_id: int = Field(foreign_key="user.id")
+    author_role: UserRole
+    quantity: int
+    unit_price: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AutoResponder(SQLModel, table=True):
+    """A producer's automatic answers to buyer bids; see agents.py for how the fields are used."""
+    producer_id: int = Field(foreign_key="user.id", primary_key=True)
+    enabled: bool = True
+    # Lowest acceptable price as a fraction of the offer's list price.
+    reserve_ratio: float = 0.9
+    # Concession curve: counters move from list price to the reserve over max_rounds;
+    # below 1 holds out until late (boulware), above 1 concedes early (conceder).
+    concession_exponent: float = 1.0
+    max_rounds: int = 3
+    # Reserve is lowered by volume_discount for bids of at least volume_threshold units,
+    # and by repeat_buyer_discount for buyers who already ordered from this producer.
+    volume_threshold: Optional[int] = None
+    volume_discount: float = 0.0
+    repeat_buyer_discount: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class FxRate(SQLModel, table=True):
+    currency: str = Field(primary_key=True)
+    rate: float  # units of FX_BASE_CURRENCY per unit of currency
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
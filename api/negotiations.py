@@ -0,0 +1,220 @@
+"""Negotiations: the bid / counter / accept state machine and the batched expiry sweeper.
+
+A buyer opens a negotiation with a bid on an offer (PROPOSED). After that the
+party who did not place the latest bid may counter (COUNTERED) or accept it;
+accepting reserves stock and places a CONFIRMED order at the negotiated price
+(ACCEPTED). A negotiation nobody answers within NEGOTIATION_TTL_HOURS becomes
+EXPIRED.
+
+Every transition is one conditional UPDATE (open, not expired, caller's turn),
+so two parties acting at once cannot both win. Expiry is applied by a
+background sweeper in batches; the UPDATE guards already keep expired
+negotiations from being answered before the sweeper gets to them.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlmodel import Session, col, select
+
+import events
+import read_cache
+import settings
+from auth import CurrentPrincipal
+from database import engine
+from inventory import reserve
+from models import Bid, Negotiation, NegotiationStatus, Offer, Order, OrderStatus, UserRole
+from schemas import BidCreate, NegotiationCreate, NegotiationPublic, OrderPublic
+
+NEGOTIATION_TTL_HOURS = settings.get_float("NEGOTIATION_TTL_HOURS", 48)
+EXPIRY_SWEEP_INTERVAL_SECONDS = settings.get_float("EXPIRY_SWEEP_INTERVAL_SECONDS", 30)
+EXPIRY_SWEEP_BATCH = settings.get_int("EXPIRY_SWEEP_BATCH", 500)
+
+OPEN_STATUSES = (NegotiationStatus.PROPOSED, NegotiationStatus.COUNTERED)
+COLUMNS = list(NegotiationPublic.model_fields)
+
+logger = logging.getLogger(__name__)
+_sweeper: Optional[asyncio.Task] = None
+
+
+def expiry(now: datetime) -> datetime:
+    return now + timedelta(hours=NEGOTIATION_TTL_HOURS)
+
+
+def publish(negotiation: NegotiationPublic) -> None:
+    events.publish(
+        events.NEGOTIATION_UPDATED,
+        negotiation.model_dump(mode="json"),
+        producer_id=negotiation.producer_id,
+        buyer_id=negotiation.buyer_id,
+    )
+
+
+def open_negotiation(session: Session, buyer_id: int, body: NegotiationCreate) -> NegotiationPublic:
+    offer = session.get(Offer, body.offer_id)
+    if not offer or not offer.active:
+        raise HTTPException(status_code=404, detail="Not found")
+    if body.quantity > offer.quantity:
+        raise HTTPException(status_code=400, detail="Validation error: quantity exceeds available offer quantity")
+    now = datetime.utcnow()
+    negotiation = Negotiation(
+        offer_id=offer.id,
+        buyer_id=buyer_id,
+        producer_id=offer.producer_id,
+        status=NegotiationStatus.PROPOSED,
+        quantity=body.quantity,
+        unit_price=body.unit_price,
+        last_bid_by=UserRole.BUYER,
+        expires_at=expiry(now),
+        created_at=now,
+        updated_at=now,
+    )
+    session.add(negotiation)
+    session.flush()
+    session.add(Bid(
+        negotiation_id=negotiation.id, author_id=buyer_id, author_role=UserRole.BUYER,
+        quantity=body.quantity, unit_price=body.unit_price, created_at=now,
+    ))
+    result = NegotiationPublic.model_validate(negotiation)
+    session.commit()
+    publish(result)
+    return result
+
+
+def _take_turn(session: Session, negotiation_id: int, principal: CurrentPrincipal, now: datetime, **values) -> NegotiationPublic:
+    party = Negotiation.producer_id if principal.role == UserRole.PRODUCER else Negotiation.buyer_id
+    stmt = (
+        update(Negotiation)
+        .where(
+            Negotiation.id == negotiation_id,
+            party == principal.id,
+            col(Negotiation.status).in_(OPEN_STATUSES),
+            Negotiation.last_bid_by != principal.role,
+            Negotiation.expires_at > now,
+        )
+        .values(updated_at=now, **values)
+        .returning(*(getattr(Negotiation, name) for name in COLUMNS))
+        .execution_options(synchronize_session=False)
+    )
+    row = session.exec(stmt).one_or_none()
+    if row is not None:
+        return NegotiationPublic(**row._mapping)
+
+    negotiation = session.get(Negotiation, negotiation_id)
+    if not negotiation or principal.id not in (negotiation.buyer_id, negotiation.producer_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    if negotiation.status in OPEN_STATUSES and negotiation.expires_at <= now:
+        raise HTTPException(status_code=409, detail="Conflict: negotiation has expired")
+    if negotiation.status not in OPEN_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Conflict: negotiation is {negotiation.status.value.lower()}")
+    raise HTTPException(status_code=409, detail="Conflict: waiting for the other party")
+
+
+def counter(session: Session, negotiation_id: int, principal: CurrentPrincipal, body: BidCreate) -> NegotiationPublic:
+    now = datetime.utcnow()
+    result = _take_turn(
+        session, negotiation_id, principal, now,
+        status=NegotiationStatus.COUNTERED,
+        unit_price=body.unit_price,
+        quantity=body.quantity if body.quantity is not None else Negotiation.quantity,
+        last_bid_by=principal.role,
+        expires_at=expiry(now),
+    )
+    session.add(Bid(
+        negotiation_id=negotiation_id, author_id=principal.id, author_role=principal.role,
+        quantity=result.quantity, unit_price=result.unit_price, created_at=now,
+    ))
+    session.commit()
+    publish(result)
+    return result
+
+
+def accept(session: Session, negotiation_id: int, principal: CurrentPrincipal) -> NegotiationPublic:
+    """Accept the latest bid and place its order; nothing changes if the stock is no longer there."""
+    now = datetime.utcnow()
+    result = _take_turn(session, negotiation_id, principal, now, status=NegotiationStatus.ACCEPTED)
+    reserved = reserve(session, result.offer_id, result.quantity)
+    order = Order(
+        buyer_id=result.buyer_id,
+        offer_id=result.offer_id,
+        quantity=result.quantity,
+        unit_price_snapshot=result.unit_price,
+        status=OrderStatus.CONFIRMED,
+        created_at=now,
+    )
+    session.add(order)
+    session.flush()
+    session.exec(
+        update(Negotiation).where(Negotiation.id == negotiation_id).values(order_id=order.id)
+        .execution_options(synchronize_session=False)
+    )
+    order_public = OrderPublic.model_validate(order)
+    session.commit()
+
+    result.order_id = order_public.id
+    read_cache.invalidate_offers([result.offer_id])
+    publish(result)
+    events.publish(events.ORDER_PLACED, order_public.model_dump(mode="json"),
+                   producer_id=result.producer_id, buyer_id=result.buyer_id)
+    events.publish(events.OFFER_STOCK, {"id": result.offer_id, "quantity": reserved.quantity},
+                   producer_id=result.producer_id, category=reserved.product_category)
+    return result
+
+
+def expire_due(batch_size: int = EXPIRY_SWEEP_BATCH, bind=None) -> int:
+    """Expire overdue open negotiations, one short transaction per batch. Returns how many."""
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        due = (
+            select(Negotiation.id)
+            .where(col(Negotiation.status).in_(OPEN_STATUSES), Negotiation.expires_at <= now)
+            .limit(batch_size)
+        )
+        with Session(bind or engine) as session:
+            expired = session.exec(
+                update(Negotiation)
+                .where(col(Negotiation.id).in_(due.scalar_subquery()), col(Negotiation.status).in_(OPEN_STATUSES))
+                .values(status=NegotiationStatus.EXPIRED, updated_at=now)
+                .returning(*(getattr(Negotiation, name) for name in COLUMNS))
+                .execution_options(synchronize_session=False)
+            ).all()
+            session.commit()
+        for row in expired:
+            publish(NegotiationPublic(**row._mapping))
+        total += len(expired)
+        if len(expired) < batch_size:
+            return total
+
+
+async def _sweep_forever() -> None:
+    while True:
+        try:
+            expired = await run_in_threadpool(expire_due)
+            if expired:
+                logger.info("expired %d negotiations", expired)
+        except Exception:
+            logger.exception("negotiation expiry sweep failed")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+
+def start_sweeper() -> None:
+    """Run the sweeper on the current event loop. Each worker runs one; the UPDATE is idempotent."""
+    global _sweeper
+    if _sweeper is None and EXPIRY_SWEEP_INTERVAL_SECONDS > 0:
+        _sweeper = asyncio.get_running_loop().create_task(_sweep_forever())
+
+
+def stop_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        _sweeper = None
+
+
+def bids_for(session: Session, negotiation_id: int) -> List[Bid]:
+    return session.exec(select(Bid).where(Bid.negotiation_id == negotiation_id).order_by(Bid.id)).all()
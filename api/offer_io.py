@@ -0,0 +1,186 @@
+"""Bulk offer import (CSV / NDJSON upsert by producer and SKU) and streaming export."""
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session
+
+import events
+import fx
+import geo
+import read_cache
+import search
+from database import DB_ASYNC, async_engine, engine
+from models import Offer
+from schemas import OfferCreate, OfferImportError, OfferImportResult
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_COLUMNS = ["id"] + list(OfferCreate.model_fields) + ["created_at", "updated_at"]
+# Computed on import rather than read from the file.
+DERIVED_COLUMNS = ("unit_price_base", "latitude", "longitude")
+
+
+def _csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, object]]:
+    reader = csv.DictReader(codecs.getreader("utf-8-sig")(stream))
+    for row in reader:
+        # Empty cells count as missing, so optional columns fall back to their defaults.
+        yield reader.line_num, {k: v for k, v in row.items() if k and v not in ("", None)}
+
+
+def _ndjson_rows(stream: BinaryIO) -> Iterator[Tuple[int, object]]:
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as exc:
+            yield line_no, exc
+
+
+def _error_message(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        err = exc.errors()[0]
+        field = ".".join(str(p) for p in err["loc"])
+        return f"{field}: {err['msg']}" if field else err["msg"]
+    return str(exc)
+
+
+def _upsert(session: Session, rows: List[dict]) -> List[int]:
+    conn = session.connection()
+    table = Offer.__table__
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(table)
+    updated = {c: stmt.excluded[c] for c in [*OfferCreate.model_fields, *DERIVED_COLUMNS] if c != "sku"}
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.producer_id, table.c.sku],
+        set_={**updated, "version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    ).returning(
+        table.c.id, table.c.latitude, table.c.longitude, table.c.active, *(table.c[c] for c in search.SEARCH_COLUMNS)
+    )
+    written = [dict(r._mapping) for r in conn.execute(stmt, rows)]
+    search.index_rows(conn, written)
+    geo.index_rows(conn, written)
+    return [row["id"] for row in written]
+
+
+def import_offers(session: Session, producer_id: int, stream: BinaryIO, fmt: str) -> OfferImportResult:
+    """Validate rows in chunks and upsert each chunk in its own transaction.
+
+    Rows with a SKU replace the producer's existing offer with that SKU; when a
+    SKU repeats within a chunk the last occurrence wins and the earlier ones are
+    rejected as superseded. Rows without one are always inserted.
+    """
+    rows = _csv_rows(stream) if fmt == "csv" else _ndjson_rows(stream)
+    result = OfferImportResult(processed=0, imported=0, rejected=0, errors=[])
+    rates = fx.rates(session, fresh=True)
+    while True:
+        chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            if result.imported:
+                # One summary event rather than one per row, which would overflow every subscriber.
+                events.publish(events.OFFERS_IMPORTED, {"producer_id": producer_id, "imported": result.imported},
+                               producer_id=producer_id)
+            return result
+        now = datetime.utcnow()
+        by_sku, without_sku = {}, []
+        for line_no, raw in chunk:
+            result.processed += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                offer = OfferCreate.model_validate(raw)
+                if offer.currency not in rates:
+                    raise ValueError(f"currency: unsupported currency {offer.currency}")
+            except (ValidationError, ValueError, TypeError) as exc:
+                result.rejected += 1
+                if len(result.errors) < MAX_REPORTED_ERRORS:
+                    result.errors.append(OfferImportError(row=line_no, error=_error_message(exc)))
+                continue
+            latitude, longitude = geo.geocode(offer.location) or (None, None)
+            values = {
+                **offer.model_dump(), "unit_price_base": offer.unit_price * rates[offer.currency],
+                "latitude": latitude, "longitude": longitude,
+                "producer_id": producer_id, "created_at": now, "updated_at": now, "version": 1,
+            }
+            if offer.sku:
+                superseded = by_sku.get(offer.sku)
+                if superseded is not None:
+                    result.rejected += 1
+                    if len(result.errors) < MAX_REPORTED_ERRORS:
+                        result.errors.append(OfferImportError(
+                            row=superseded[0], error=f"duplicate sku {offer.sku}, superseded by row {line_no}"
+                        ))
+                by_sku[offer.sku] = (line_no, values)
+            else:
+                without_sku.append(values)
+        valid = [values for _, values in by_sku.values()] + without_sku
+        if valid:
+            offer_ids = _upsert(session, valid)
+            session.commit()
+            fx.repair_offers(session, offer_ids)
+            read_cache.invalidate_offers(offer_ids)
+            result.imported += len(valid)
+
+
+def _export_stmt(producer_id: int):
+    table = Offer.__table__
+    return (
+        select(*(table.c[c] for c in EXPORT_COLUMNS))
+        .where(table.c.producer_id == producer_id)
+        .order_by(table.c.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+def _encode(rows: Iterable, fmt: str, header: bool) -> bytes:
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf)
+        if header:
+            writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow([v.isoformat() if isinstance(v, datetime) else v for v in row])
+    else:
+        for row in rows:
+            buf.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, ensure_ascii=False))
+            buf.write("\n")
+    return buf.getvalue().encode()
+
+
+def _export_sync(producer_id: int, fmt: str) -> Iterator[bytes]:
+    # The request's session is closed before the body is streamed, so use a dedicated connection.
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(_export_stmt(producer_id))
+        header = True
+        for batch in result.partitions():
+            yield _encode(batch, fmt, header)
+            header = False
+        if header and fmt == "csv":
+            yield _encode([], fmt, header)
+
+
+async def _export_async(producer_id: int, fmt: str):
+    async with async_engine.connect() as conn:
+        result = await conn.stream(_export_stmt(producer_id))
+        header = True
+        async for batch in result.partitions():
+            yield _encode(batch, fmt, header)
+            header = False
+        if header and fmt == "csv":
+            yield _encode([], fmt, header)
+
+
+def export_offers(producer_id: int, fmt: str):
+    """Iterator of encoded chunks, read from a server-side cursor EXPORT_BATCH_SIZE rows at a time."""
+    return _export_async(producer_id, fmt) if DB_ASYNC else _export_sync(producer_id, fmt)
@@ -0,0 +1,36 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(key: Any, row_id: int) -> str:
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([key, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: Callable[[Any], Any] = datetime.fromisoformat) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return key_type(key), int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Validation error: invalid cursor")
+
+
+def keyset_after(key_col, id_col, cursor: Optional[str], key_type=datetime.fromisoformat, descending: bool = True):
+    """WHERE clause selecting rows after the cursor in (key, id) order."""
+    if not cursor:
+        return None
+    key, row_id = decode_cursor(cursor, key_type)
+    if descending:
+        return or_(key_col < key, and_(key_col == key, id_col < row_id))
+    return or_(key_col > key, and_(key_col == key, id_col > row_id))
@@ -0,0 +1,250 @@
+"""Per-client rate limiting and admission control, as one ASGI middleware.
+
+Every request spends tokens from its client's bucket: the JWT subject when a
+valid bearer token is sent, else the client IP. Buckets refill at
+RATE_LIMIT_PER_SECOND up to RATE_LIMIT_BURST; expensive routes cost more than
+one token (RATE_LIMIT_COSTS). A client out of tokens gets 429 with Retry-After
+before any handler work is done.
+
+Admitted requests then take one of ADMISSION_MAX_CONCURRENT slots. When all
+are busy up to ADMISSION_QUEUE requests wait, at most
+ADMISSION_QUEUE_TIMEOUT_MS; anything beyond is shed with 503 + Retry-After at
+once, so an overload turns into fast rejections instead of a growing backlog
+that drags every request's latency up. The slots are per worker process.
+
+Both parts are opt-in: per-client limits stay off until RATE_LIMIT_PER_SECOND
+is set (clients behind one NAT or proxy share an IP bucket, so pick the rate
+with that in mind), admission control until ADMISSION_MAX_CONCURRENT is. Size
+the latter to DB_POOL_SIZE + DB_MAX_OVERFLOW, the connections (and sync
+threads) one worker can use, so it only sheds load that could not be served.
+
+Buckets live in this process by default (RATE_LIMIT_URL=memory), so each
+uvicorn worker enforces its own budget; with RATE_LIMIT_URL=redis://... all
+workers draw from shared buckets. The Redis backend needs the ``redis``
+package, which is not a hard dependency.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+import settings
+from auth import decode_principal
+
+RATE_LIMIT_URL = settings.get("RATE_LIMIT_URL", "memory")
+# Tokens per second and bucket size per client; 0 tokens per second (the default) disables the per-client limit.
+RATE_LIMIT_PER_SECOND = settings.get_float("RATE_LIMIT_PER_SECOND", 0)
+RATE_LIMIT_BURST = settings.get_float("RATE_LIMIT_BURST", 60)
+RATE_LIMIT_MAX_CLIENTS = settings.get_int("RATE_LIMIT_MAX_CLIENTS", 100000)
+# "METHOD /path=tokens" pairs for routes costing more than one token.
+RATE_LIMIT_COSTS = settings.get(
+    "RATE_LIMIT_COSTS",
+    "POST /api/auth/login=5,POST /api/auth/register=5,POST /api/orders/batch=3,POST /api/orders/match=3,"
+    "POST /api/producer/offers/import=20,GET /api/producer/offers/export=20",
+)
+# Requests served at once per worker, requests allowed to wait for a slot and for how long; 0 slots (the default) disables.
+ADMISSION_MAX_CONCURRENT = settings.get_int("ADMISSION_MAX_CONCURRENT", 0)
+ADMISSION_QUEUE = settings.get_int("ADMISSION_QUEUE", ADMISSION_MAX_CONCURRENT)
+ADMISSION_QUEUE_TIMEOUT_MS = settings.get_float("ADMISSION_QUEUE_TIMEOUT_MS", 250)
+ADMISSION_RETRY_AFTER = settings.get("ADMISSION_RETRY_AFTER", "1")
+
+# Never limited: probes and scrapes must work during an overload.
+EXEMPT_PATHS = ("/api/health", "/api/metrics")
+# Long-lived streams would hold a slot for their whole life; they are only rate limited.
+UNSLOTTED_PATHS = ("/api/events",)
+
+
+def parse_costs(spec: str) -> Dict[Tuple[str, str], float]:
+    costs = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, tokens = item.rpartition("=")
+        method, _, path = route.strip().partition(" ")
+        costs[(method.upper(), path.strip())] = float(tokens)
+    return costs
+
+
+COSTS = parse_costs(RATE_LIMIT_COSTS)
+
+
+class MemoryBuckets:
+    """Token buckets in this process, least recently seen clients evicted beyond ``maxsize``."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, monotonic time]
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Spend ``cost`` tokens; returns 0 when allowed, else seconds until they would be available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                while len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# KEYS[1] bucket; ARGV cost, rate, burst. Uses the server clock so workers on
+# different hosts agree; the bucket expires once it would be full again.
+_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or burst
+if state[2] then tokens = math.min(burst, tokens + (now - tonumber(state[2])) * rate) end
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Same interface as MemoryBuckets, shared by every worker through Redis (one atomic script per request)."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio
+
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[cost, rate, burst]))
+
+    def __len__(self) -> int:
+        return -1  # not tracked locally
+
+
+def make_buckets(url: Optional[str]):
+    """``memory`` (or empty) for per-process buckets, ``redis://...`` for buckets shared by all workers."""
+    if not url or url == "memory":
+        return MemoryBuckets(RATE_LIMIT_MAX_CLIENTS)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBuckets(url)
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+backend = make_buckets(RATE_LIMIT_URL) if RATE_LIMIT_PER_SECOND > 0 else None
+ENABLED = backend is not None or ADMISSION_MAX_CONCURRENT > 0
+
+_stats = {"limited": 0, "shed": 0, "queued": 0}
+_active = 0
+_waiting = 0
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def stats() -> dict:
+    return {
+        **_stats, "active": _active, "waiting": _waiting, "clients": len(backend) if backend is not None else 0,
+        "backend": type(backend).__name__ if backend is not None else None,
+    }
+
+
+def client_key(scope) -> str:
+    """``user:<id>`` for a valid bearer token, else ``ip:<address>``."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    return f"user:{decode_principal(token).id}"
+                except HTTPException:  # invalid or expired: the route itself answers 401
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status: int, detail: str, retry_after: str) -> None:
+    body = f'{{"detail":"{detail}"}}'.encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _acquire_slot() -> bool:
+    """Take an admission slot, waiting in the short queue if there is room in it; False means shed."""
+    global _slots, _active, _waiting
+    if _slots is None:
+        _slots = asyncio.Semaphore(ADMISSION_MAX_CONCURRENT)
+    if not _slots.locked():
+        await _slots.acquire()
+    else:
+        if _waiting >= ADMISSION_QUEUE:
+            return False
+        _waiting += 1
+        _stats["queued"] += 1
+        try:
+            await asyncio.wait_for(_slots.acquire(), ADMISSION_QUEUE_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            _waiting -= 1
+    _active += 1
+    return True
+
+
+def _release_slot() -> None:
+    global _active
+    _active -= 1
+    _slots.release()
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware: rejected requests never reach routing, dependencies or the database."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if backend is not None:
+            # Capped at the bucket size, or the route could never be called.
+            cost = min(COSTS.get((scope["method"], path), 1.0), RATE_LIMIT_BURST)
+            wait = await backend.take(client_key(scope), cost, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+            if wait > 0:
+                _stats["limited"] += 1
+                await _reject(send, 429, "Too many requests", str(math.ceil(wait)))
+                return
+
+        if ADMISSION_MAX_CONCURRENT <= 0 or path.startswith(UNSLOTTED_PATHS):
+            await self.app(scope, receive, send)
+            return
+        if not await _acquire_slot():
+            _stats["shed"] += 1
+            await _reject(send, 503, "Service busy, retry later", ADMISSION_RETRY_AFTER)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _release_slot()
@@ -0,0 +1,123 @@
+"""Response cache for the public offer reads (GET /api/offers, /api/offers/facets, /api/offers/{id}).
+
+Bodies are cached serialized, together with their ETag, so a hit costs one
+lookup and no query or JSON encoding; a matching If-None-Match gets a 304.
+
+Offer pages are keyed by their normalized query string plus a generation
+number; any offer write bumps the generation, which retires every cached page
+at once. Single offers are keyed by id and dropped individually. With the
+default in-process backend each worker has its own cache and only sees its
+own invalidations, so run more than one worker with READ_CACHE_URL=redis://...
+or keep READ_CACHE_TTL_SECONDS short.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import Counter
+from typing import Callable, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+import fast_json
+import settings
+from cache import make_cache
+
+READ_CACHE_URL = settings.get("READ_CACHE_URL", "memory")
+READ_CACHE_SIZE = settings.get_int("READ_CACHE_SIZE", 2048)
+READ_CACHE_TTL_SECONDS = settings.get_float("READ_CACHE_TTL_SECONDS", 60)
+# Browsers keep the body but revalidate every time, so clients never show stale offers.
+CACHE_CONTROL = "no-cache"
+
+backend = make_cache(READ_CACHE_URL, maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL_SECONDS, prefix="offers:")
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counts_lock:
+        _counts[name] += 1
+
+
+def metrics() -> dict:
+    with _counts_lock:
+        counts = dict(_counts)
+    lookups = counts.get("hits", 0) + counts.get("misses", 0)
+    return {
+        "backend": type(backend).__name__,
+        "entries": len(backend),
+        "hits": counts.get("hits", 0),
+        "misses": counts.get("misses", 0),
+        "not_modified": counts.get("not_modified", 0),
+        "invalidations": counts.get("invalidations", 0),
+        "hit_ratio": round(counts.get("hits", 0) / lookups, 4) if lookups else None,
+    }
+
+
+def list_key(request: Request) -> str:
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if v != "")
+    return f"list:{backend.get_counter('list')}:{request.url.path}:{json.dumps(params, separators=(',', ':'))}"
+
+
+def item_key(offer_id: int) -> str:
+    return f"item:{offer_id}"
+
+
+def list_etag(body: str) -> str:
+    return f'W/"{hashlib.sha1(body.encode()).hexdigest()[:20]}"'
+
+
+def item_etag(offer) -> str:
+    return f'W/"{offer.id}-{offer.version}-{offer.updated_at.timestamp():.6f}"'
+
+
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?"[^"]*"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: ``*``, or any listed entity-tag equal to ``etag`` under weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == opaque for tag in _ENTITY_TAG_RE.findall(if_none_match))
+
+
+def _respond(request: Request, etag: str, body: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        _count("not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached(request: Request, key: str, build: Callable[[], Tuple[object, Callable[[str], str]]]) -> Response:
+    """Serve ``key`` from the cache, or call ``build`` -> (payload, etag_fn) and store the result.
+
+    Errors raised by ``build`` (404, 400, ...) propagate and are not cached.
+    """
+    hit = backend.get(key)
+    if hit is not None:
+        _count("hits")
+        etag, body = hit
+        return _respond(request, etag, body)
+    _count("misses")
+    generation = backend.get_counter("list")
+    payload, etag_fn = build()
+    body = fast_json.dumps(payload).decode()
+    etag = etag_fn(body)
+    # A write committed while we were querying may already have invalidated this
+    # entry; storing what we read would bring the old data back until the TTL.
+    if backend.get_counter("list") == generation:
+        backend.set(key, (etag, body))
+    return _respond(request, etag, body)
+
+
+def invalidate_offers(offer_ids: Iterable[int] = ()) -> None:
+    """Call after committing offer writes: drops those offers and every cached page."""
+    for offer_id in offer_ids:
+        backend.delete(item_key(offer_id))
+    backend.incr("list")
+    _count("invalidations")
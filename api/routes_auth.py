@@ -1,19 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel import Session, select
 
-from auth import hash_password, verify_password, create_access_token, get_current_user
-from database import get_session
+from auth import create_user_token, get_current_user, hash_password_offloaded, verify_password_offloaded
+from database import DBRoute, get_session
 from models import User, UserRole
 from schemas import RegisterRequest, LoginRequest, TokenResponse, UserPublic
 
-router = APIRouter(prefix="/api/auth", tags=["auth"])
+router = APIRouter(prefix="/api/auth", tags=["auth"], route_class=DBRoute)
 
 @router.post("/register", status_code=201)
 def register(body: RegisterRequest, session: Session = Depends(get_session)):
     exists = session.exec(select(User).where(User.email == body.email)).first()
     if exists:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = User(email=body.email, password_hash=hash_password(body.password), role=body.role)
+    user = User(email=body.email, password_hash=hash_password_offloaded(body.password), role=body.role)
     session.add(user)
     session.commit()
     session.refresh(user)
@@ -22,11 +22,20 @@ def register(body: RegisterRequest, session: Session = Depends(get_session)):
 @router.post("/login", response_model=TokenResponse)
 def login(body: LoginRequest, session: Session = Depends(get_session)):
     user = session.exec(select(User).where(User.email == body.email)).first()
-    if not user or not verify_password(body.password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    token = create_access_token({"sub": user.id})
+    valid, new_hash = verify_password_offloaded(body.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    if new_hash:
+        # Hash settings changed since this password was stored; upgrade it transparently.
+        user.password_hash = new_hash
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+    token = create_user_token(user)
     return TokenResponse(access_token=token, user=UserPublic(id=user.id, email=user.email, role=user.role, created_at=user.created_at))
 
 @router.get("/me", response_model=UserPublic)
-def me(user: User = Depends(get_current_user)):
-    return UserPublic(id=user.id, email=user.email, role=user.role, created_at=user.created_at)
+def me(user: UserPublic = Depends(get_current_user)):
+    return user
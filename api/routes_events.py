@@ -0,0 +1,72 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+
+import events
+import fast_json
+from auth import EVENTS_TICKET, EVENTS_TICKET_SECONDS, CurrentPrincipal, create_events_ticket, decode_principal, get_current_principal
+from database import DBRoute
+from schemas import EventsTicket
+
+router = APIRouter(prefix="/api", tags=["events"], route_class=DBRoute)
+
+
+def _format(event: events.Event) -> str:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {fast_json.dumps(event.data).decode()}\n\n"
+
+
+@router.post("/events/ticket", response_model=EventsTicket)
+def events_ticket(user: CurrentPrincipal = Depends(get_current_principal)):
+    """Ticket for ?ticket= on GET /api/events, so the access token never goes into a URL."""
+    return EventsTicket(ticket=create_events_ticket(user), expires_in=EVENTS_TICKET_SECONDS)
+
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    producer_id: Optional[int] = None,
+    category: Optional[str] = None,
+    types: Optional[str] = Query(None, description="Comma-separated event types, e.g. offer.created,order.placed"),
+    ticket: Optional[str] = Query(
+        None, description="From POST /api/events/ticket, for EventSource, which cannot send an Authorization header"
+    ),
+):
+    """Server-sent events: offer.created, offer.updated, offer.stock, offers.imported and, for
+    the authenticated producer or buyer involved, order.placed."""
+    header = request.headers.get("authorization", "")
+    if ticket:
+        user_id = decode_principal(ticket, EVENTS_TICKET).id
+    elif header.lower().startswith("bearer "):
+        user_id = decode_principal(header[7:]).id
+    else:
+        user_id = None
+    sub = events.bus.subscribe(
+        user_id=user_id,
+        producer_id=producer_id,
+        category=category,
+        types={t.strip() for t in types.split(",") if t.strip()} if types else None,
+    )
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), events.EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies from closing an idle connection.
+                    yield ": ping\n\n"
+                    continue
+                yield _format(event)
+                if event.type == "overflow":
+                    return
+        finally:
+            events.bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
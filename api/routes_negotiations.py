@@ -0,0 +1,73 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session, col, select
+
+import fast_json
+import negotiations
+from auth import CurrentPrincipal, get_current_principal, require_role
+from database import DBRoute, get_read_session, get_session
+from models import AutoResponder, Negotiation, NegotiationStatus, UserRole
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, keyset_after
+from schemas import AutoResponderConfig, AutoResponderPublic, BidCreate, NegotiationCreate, NegotiationDetail, NegotiationPage, NegotiationPublic
+
+router = APIRouter(prefix="/api/negotiations", tags=["negotiations"], route_class=DBRoute)
+
+@router.post("", response_model=NegotiationPublic)
+def open_negotiation(body: NegotiationCreate, user: CurrentPrincipal = Depends(require_role(UserRole.BUYER)), session: Session = Depends(get_session)):
+    return negotiations.open_negotiation(session, user.id, body)
+
+@router.get("/mine", response_model=NegotiationPage)
+def my_negotiations(
+    status: Optional[List[NegotiationStatus]] = Query(None),
+    offer_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: CurrentPrincipal = Depends(get_current_principal),
+    session: Session = Depends(get_read_session),
+):
+    """The caller's negotiations (as buyer or as producer), most recently active first."""
+    party = Negotiation.producer_id if user.role == UserRole.PRODUCER else Negotiation.buyer_id
+    stmt = select(*(getattr(Negotiation, name) for name in negotiations.COLUMNS)).where(party == user.id)
+    if status:
+        stmt = stmt.where(col(Negotiation.status).in_(status))
+    if offer_id is not None:
+        stmt = stmt.where(Negotiation.offer_id == offer_id)
+    after = keyset_after(col(Negotiation.updated_at), col(Negotiation.id), cursor)
+    if after is not None:
+        stmt = stmt.where(after)
+    rows = session.exec(stmt.order_by(col(Negotiation.updated_at).desc(), col(Negotiation.id).desc()).limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1].updated_at, rows[limit - 1].id) if len(rows) > limit else None
+    return fast_json.respond({"items": fast_json.row_dicts(rows[:limit], negotiations.COLUMNS), "next_cursor": next_cursor})
+
+@router.get("/auto-responder", response_model=Optional[AutoResponderPublic])
+def get_auto_responder(user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)), session: Session = Depends(get_read_session)):
+    return session.get(AutoResponder, user.id)
+
+@router.put("/auto-responder", response_model=AutoResponderPublic)
+def set_auto_responder(body: AutoResponderConfig, user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)), session: Session = Depends(get_session)):
+    """Create or replace the caller's auto-responder; it answers bids from the next tick on."""
+    responder = session.get(AutoResponder, user.id) or AutoResponder(producer_id=user.id)
+    for k, v in body.model_dump().items():
+        setattr(responder, k, v)
+    responder.updated_at = datetime.utcnow()
+    session.add(responder)
+    session.commit()
+    session.refresh(responder)
+    return responder
+
+@router.get("/{negotiation_id}", response_model=NegotiationDetail)
+def get_negotiation(negotiation_id: int, user: CurrentPrincipal = Depends(get_current_principal), session: Session = Depends(get_read_session)):
+    negotiation = session.get(Negotiation, negotiation_id)
+    if not negotiation or user.id not in (negotiation.buyer_id, negotiation.producer_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    return NegotiationDetail(**negotiation.model_dump(), bids=negotiations.bids_for(session, negotiation_id))
+
+@router.post("/{negotiation_id}/counter", response_model=NegotiationPublic)
+def counter_negotiation(negotiation_id: int, body: BidCreate, user: CurrentPrincipal = Depends(get_current_principal), session: Session = Depends(get_session)):
+    return negotiations.counter(session, negotiation_id, user, body)
+
+@router.post("/{negotiation_id}/accept", response_model=NegotiationPublic)
+def accept_negotiation(negotiation_id: int, user: CurrentPrincipal = Depends(get_current_principal), session: Session = Depends(get_session)):
+    return negotiations.accept(session, negotiation_id, user)
@@ -1,77 +1,329 @@
+import math
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select, col
 
-from auth import require_role, require_offer_owner, get_current_user
-from database import get_session
-from models import Offer, UserRole, User
-from schemas import OfferCreate, OfferPublic, OfferUpdate
+from auth import CurrentPrincipal, require_role, require_offer_owner
+import events
+import facets
+import fast_json
+import fx
+import geo
+import offer_io
+import read_cache
+import search
+from database import DBRoute, get_read_session, get_session
+from inventory import commit_offer_update, sku_conflict
+from models import Offer, UserRole
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, keyset_after
+from schemas import OfferCreate, OfferFacets, OfferImportResult, OfferPage, OfferPublic, OfferUpdate
+
+router = APIRouter(prefix="/api", tags=["offers"], route_class=DBRoute)
+
+
+def _publish_offer(event_type: str, offer: Offer) -> None:
+    data = OfferPublic.model_validate(offer).model_dump(mode="json")
+    events.publish(event_type, data, producer_id=offer.producer_id, category=offer.product_category)
 
-router = APIRouter(prefix="/api", tags=["offers"])
 
 @router.post("/offers", response_model=OfferPublic)
-def create_offer(body: OfferCreate, session: Session = Depends(get_session), user: User = Depends(require_role(UserRole.PRODUCER))):
+def create_offer(body: OfferCreate, session: Session = Depends(get_session), user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER))):
     # Minimal required fields are enforced by schema
     offer = Offer(
         producer_id=user.id,
         **body.model_dump(),
+        unit_price_base=fx.to_base(session, body.unit_price, body.currency),
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow(),
     )
     session.add(offer)
-    session.commit()
+    try:
+        # The index hooks flush, so a duplicate SKU can surface there as well as at commit.
+        geo.index_offer(session, offer)
+        search.index_offer(session, offer)
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        if body.sku is None:
+            raise
+        raise sku_conflict(body.sku)
+    fx.repair_offers(session, [offer.id])
     session.refresh(offer)
+    read_cache.invalidate_offers()
+    _publish_offer(events.OFFER_CREATED, offer)
     return offer
 
-@router.get("/offers", response_model=List[OfferPublic])
+# Columns a client may ask for via ?fields=; id is always returned.
+OFFER_COLUMNS = list(OfferPublic.model_fields)
+OFFER_FIELDS = set(OFFER_COLUMNS)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in OFFER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Validation error: unknown fields: {', '.join(unknown)}")
+    return ["id"] + [f for f in dict.fromkeys(requested) if f != "id"]
+
+
+@router.get("/offers", response_model=OfferPage)
 def list_offers(
+    request: Request,
     q: Optional[str] = None,
     category: Optional[str] = None,
-    min_price: Optional[float] = Query(None, ge=0),
-    max_price: Optional[float] = Query(None, ge=0),
+    min_price: Optional[float] = Query(None, ge=0, description="In the display currency"),
+    max_price: Optional[float] = Query(None, ge=0, description="In the display currency"),
     location: Optional[str] = None,
+    near: Optional[str] = Query(None, description='"lat,lon" or a town name; requires radius_km'),
+    radius_km: Optional[float] = Query(None, gt=0, le=geo.MAX_RADIUS_KM),
     active: Optional[bool] = True,
-    session: Session = Depends(get_session),
+    sort: Optional[Literal["relevance", "newest", "price_asc", "price_desc", "distance"]] = Query(
+        None,
+        description="Defaults to relevance when q is given, else distance when near is given, else newest; "
+        "prices compare in the base currency",
+    ),
+    currency: Optional[str] = Query(None, description=f"Display currency; defaults to {fx.FX_BASE_CURRENCY}"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated list of offer fields to return"),
+    session: Session = Depends(get_read_session),
 ):
-    stmt = select(Offer)
-    if active is not None:
-        stmt = stmt.where(Offer.active == active)
-    if q:
-        like = f"%{q}%"
-        stmt = stmt.where((Offer.product_name.ilike(like)) | (Offer.description.ilike(like)))
+    def build():
+        page = _query_offers(
+            session, q, category, min_price, max_price, location, near, radius_km, active, sort, currency, limit, cursor, fields
+        )
+        return page, read_cache.list_etag
+
+    return read_cache.cached(request, read_cache.list_key(request), build)
+
+
+def _parse_near(near, radius_km):
+    if (near is None) != (radius_km is None):
+        raise HTTPException(status_code=400, detail="Validation error: near and radius_km must be given together")
+    return geo.parse_near(near) if near else None
+
+
+def _offer_filters(category, min_price, max_price, location, display_rate) -> list:
+    """WHERE clauses for the listing filters other than active, q and near."""
+    filters = []
     if category:
-        stmt = stmt.where(Offer.product_category == category)
+        filters.append(Offer.product_category == category)
+    # Filters are given in the display currency and compared in the base currency.
     if min_price is not None:
-        stmt = stmt.where(col(Offer.unit_price) >= min_price)
+        filters.append(col(Offer.unit_price_base) >= min_price * (display_rate or 1.0))
     if max_price is not None:
-        stmt = stmt.where(col(Offer.unit_price) <= max_price)
+        filters.append(col(Offer.unit_price_base) <= max_price * (display_rate or 1.0))
     if location:
-        stmt = stmt.where(Offer.location == location)
-    return session.exec(stmt.order_by(Offer.created_at.desc())).all()
+        filters.append(Offer.location == location)
+    return filters
+
+
+def _query_offers(session, q, category, min_price, max_price, location, near, radius_km, active, sort, currency, limit, cursor, fields):
+    projection = _parse_fields(fields)
+    display_rate = fx.rate(session, currency) if currency else None
+    if sort == "distance" and near is None:
+        raise HTTPException(status_code=400, detail="Validation error: sort=distance requires near")
+    point = _parse_near(near, radius_km)
+    hits = search.match(session, q) if q else None
+    ranked = hits is not None and sort in (None, "relevance")
+    by_price = sort in ("price_asc", "price_desc")
+    by_distance = point is not None and (sort == "distance" or (sort is None and hits is None))
+
+    # Plain columns rather than Offer entities: rows are only serialized, so ORM
+    # hydration would be wasted. created_at and unit_price_base are needed for
+    # the next cursor and display prices even when not requested.
+    names = projection or OFFER_COLUMNS
+    entities = [getattr(Offer, name) for name in dict.fromkeys(names + ["created_at", "unit_price_base"])]
+    if ranked:
+        entities.append(hits.c.rank)
+    filters = _offer_filters(category, min_price, max_price, location, display_rate)
+    geo_hits = None
+    if point is not None:
+        if by_distance and hits is None:
+            # Only the smallest ring around the point that holds the page is read.
+            radius_km = geo.page_radius(session, *point, radius_km, active, cursor, limit, filters)
+        if by_distance and hits is None and not filters:
+            # Nothing but the spatial index filters: pick the page from it alone,
+            # so only the offers returned are read from the offer table.
+            geo_hits = geo.within(session, *point, radius_km, active)
+            after = keyset_after(geo_hits.c.distance2, geo_hits.c.offer_id, cursor, key_type=float, descending=False)
+            page = select(geo_hits.c.offer_id, geo_hits.c.distance2)
+            if after is not None:
+                page = page.where(after)
+            geo_hits = page.order_by(geo_hits.c.distance2, geo_hits.c.offer_id).limit(limit + 1).subquery("geo_page")
+            distance2 = geo_hits.c.distance2
+        elif by_distance or hits is not None or not geo.dense(session, *point, radius_km, active):
+            geo_hits = geo.within(session, *point, radius_km, active)
+            distance2 = geo_hits.c.distance2
+        else:
+            # Most offers are in range: walking the sort order's index and
+            # testing distance per row beats reading every offer in the radius.
+            distance2 = geo.distance2(*point).label("distance2")
+            filters.append(distance2 <= radius_km * radius_km)
+        entities.append(distance2)
+    stmt = select(*entities)
+    if hits is not None:
+        stmt = stmt.join(hits, hits.c.offer_id == Offer.id)
+    if geo_hits is not None:
+        stmt = stmt.join(geo_hits, geo_hits.c.offer_id == Offer.id)
+    if active is not None:
+        stmt = stmt.where(Offer.active == active)
+    if filters:
+        stmt = stmt.where(*filters)
+
+    if ranked:
+        after = keyset_after(hits.c.rank, col(Offer.id), cursor, key_type=float, descending=False)
+        order = (hits.c.rank, col(Offer.id))
+    elif by_distance:
+        after = keyset_after(distance2, col(Offer.id), cursor, key_type=float, descending=False)
+        order = (distance2, col(Offer.id))
+    elif by_price:
+        # Offers in a currency without a rate have no base price and cannot be ranked by it.
+        stmt = stmt.where(col(Offer.unit_price_base).is_not(None))
+        descending = sort == "price_desc"
+        after = keyset_after(col(Offer.unit_price_base), col(Offer.id), cursor, key_type=float, descending=descending)
+        order = (
+            (col(Offer.unit_price_base).desc(), col(Offer.id).desc()) if descending
+            else (col(Offer.unit_price_base), col(Offer.id))
+        )
+    else:
+        after = keyset_after(col(Offer.created_at), col(Offer.id), cursor)
+        order = (col(Offer.created_at).desc(), col(Offer.id).desc())
+    if after is not None:
+        stmt = stmt.where(after)
+
+    # Fetch one extra row to learn whether another page exists.
+    rows = session.exec(stmt.order_by(*order).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        key = (
+            last.rank if ranked else last.distance2 if by_distance
+            else last.unit_price_base if by_price else last.created_at
+        )
+        next_cursor = encode_cursor(key, last.id)
+    items = fast_json.row_dicts(rows, names)
+    if point is not None:
+        for item, row in zip(items, rows):
+            item["distance_km"] = round(math.sqrt(row.distance2), 1)
+    if currency:
+        for item, row in zip(items, rows):
+            item["display_price"] = fx.from_base(row.unit_price_base, display_rate)
+            item["display_currency"] = currency
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/offers/facets", response_model=OfferFacets)
+def offer_facets(
+    request: Request,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0, description="In the display currency"),
+    max_price: Optional[float] = Query(None, ge=0, description="In the display currency"),
+    location: Optional[str] = None,
+    near: Optional[str] = Query(None, description='"lat,lon" or a town name; requires radius_km'),
+    radius_km: Optional[float] = Query(None, gt=0, le=geo.MAX_RADIUS_KM),
+    active: Optional[bool] = True,
+    currency: Optional[str] = Query(None, description=f"Display currency; defaults to {fx.FX_BASE_CURRENCY}"),
+    session: Session = Depends(get_read_session),
+):
+    """Category, location, currency and price-bucket counts for the same filters as GET /api/offers."""
+    def build():
+        page = _count_facets(session, q, category, min_price, max_price, location, near, radius_km, active, currency)
+        return page, read_cache.list_etag
+
+    return read_cache.cached(request, read_cache.list_key(request), build)
+
+
+def _count_facets(session, q, category, min_price, max_price, location, near, radius_km, active, currency):
+    display_rate = fx.rate(session, currency) if currency else 1.0
+    point = _parse_near(near, radius_km)
+    min_base = None if min_price is None else min_price * display_rate
+    max_base = None if max_price is None else max_price * display_rate
+    joins = []
+    hits = search.match(session, q) if q else None
+    if hits is not None:
+        joins.append(hits)
+    if point is not None:
+        joins.append(geo.within(session, *point, radius_km, active))
+    if joins:
+        rows = facets.from_offers(session, active, min_base, max_base, joins)
+    else:
+        rows = facets.from_summary(session, active, min_base, max_base)
+    counts = facets.fold(rows, category, location)
+    edges = facets.PRICE_EDGES + (None,)
+    counts["price_buckets"] = [
+        {"min": fx.from_base(edges[i], display_rate), "max": fx.from_base(edges[i + 1], display_rate), "count": n}
+        for i, n in enumerate(counts["price_buckets"])
+    ]
+    counts["display_currency"] = currency or fx.FX_BASE_CURRENCY
+    return counts
 
 @router.get("/offers/{offer_id}", response_model=OfferPublic)
-def get_offer(offer_id: int, session: Session = Depends(get_session)):
-    offer = session.get(Offer, offer_id)
-    if not offer:
-        raise HTTPException(status_code=404, detail="Not found")
-    return offer
+def get_offer(offer_id: int, request: Request, session: Session = Depends(get_read_session)):
+    def build():
+        offer = session.get(Offer, offer_id)
+        if not offer:
+            raise HTTPException(status_code=404, detail="Not found")
+        etag = read_cache.item_etag(offer)
+        return OfferPublic.model_validate(offer).model_dump(), lambda body: etag
+
+    return read_cache.cached(request, read_cache.item_key(offer_id), build)
 
 @router.patch("/offers/{offer_id}", response_model=OfferPublic)
-def update_offer(offer_id: int, body: OfferUpdate, session: Session = Depends(get_session), _user=Depends(require_offer_owner)):
-    offer = session.get(Offer, offer_id)
-    if not offer:
-        raise HTTPException(status_code=404, detail="Not found")
-    update_data = body.model_dump(exclude_unset=True)
-    for k, v in update_data.items():
-        setattr(offer, k, v)
-    offer.updated_at = datetime.utcnow()
-    session.add(offer)
-    session.commit()
-    session.refresh(offer)
+def update_offer(offer_id: int, body: OfferUpdate, session: Session = Depends(get_session), offer: Offer = Depends(require_offer_owner)):
+    changes = body.model_dump(exclude_unset=True)
+    if "unit_price" in changes or "currency" in changes:
+        changes["unit_price_base"] = fx.to_base(
+            session, changes.get("unit_price", offer.unit_price), changes.get("currency", offer.currency)
+        )
+    offer = commit_offer_update(session, offer, changes)
+    if "unit_price_base" in changes and fx.repair_offers(session, [offer_id]):
+        session.refresh(offer)
+    read_cache.invalidate_offers([offer_id])
+    _publish_offer(events.OFFER_UPDATED, offer)
     return offer
 
 @router.get("/producer/my-offers", response_model=List[OfferPublic])
-def my_offers(user: User = Depends(require_role(UserRole.PRODUCER)), session: Session = Depends(get_session)):
-    return session.exec(select(Offer).where(Offer.producer_id == user.id).order_by(Offer.created_at.desc())).all()
+def my_offers(user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)), session: Session = Depends(get_read_session)):
+    stmt = (
+        select(*(getattr(Offer, name) for name in OFFER_COLUMNS))
+        .where(Offer.producer_id == user.id)
+        .order_by(Offer.created_at.desc(), Offer.id.desc())
+    )
+    return fast_json.respond(fast_json.row_dicts(session.exec(stmt), OFFER_COLUMNS))
+
+def _resolve_format(fmt: Optional[str], content_type: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    if content_type and ("ndjson" in content_type or "jsonl" in content_type):
+        return "ndjson"
+    return "csv"
+
+@router.post("/producer/offers/import", response_model=OfferImportResult)
+def import_offers(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Defaults from the file's content type"),
+    user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)),
+    session: Session = Depends(get_session),
+):
+    # UploadFile spools to disk past 1 MB; rows are read from it chunk by chunk.
+    return offer_io.import_offers(session, user.id, file.file, _resolve_format(format, file.content_type))
+
+@router.get("/producer/offers/export")
+def export_offers(
+    format: Literal["csv", "ndjson"] = "csv",
+    user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)),
+):
+    return StreamingResponse(
+        offer_io.export_offers(user.id, format),
+        media_type=offer_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="offers.{format}"'},
+    )
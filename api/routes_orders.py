@@ -1,32 +1,207 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
 
-from auth import require_role, get_current_user
-from database import get_session
-from models import Offer, Order, User, UserRole
-from schemas import OrderCreate, OrderPublic
+import events
+import fast_json
+import matching
+import read_cache
+from auth import CurrentPrincipal, require_role
+from database import DBRoute, get_read_session, get_session, note_write
+from inventory import reserve, reserve_many
+from models import Offer, Order, OrderStatus, User, UserRole
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, keyset_after
+from schemas import (
+    MatchCreate, MatchResult, OfferPublic, OrderBatchCreate, OrderBatchItemResult, OrderBatchResult, OrderCreate, OrderPage,
+    OrderPublic, UserPublic,
+)
 
-router = APIRouter(prefix="/api", tags=["orders"])
+router = APIRouter(prefix="/api", tags=["orders"], route_class=DBRoute)
+
+ORDER_COLUMNS = list(OrderPublic.model_fields)
+OFFER_COLUMNS = list(OfferPublic.model_fields)
+USER_COLUMNS = list(UserPublic.model_fields)
+
+def _publish_orders(orders: List[OrderPublic], stock: Dict[int, tuple]) -> None:
+    """``stock`` maps offer id to (remaining quantity, producer_id, product_category)."""
+    for order in orders:
+        producer_id = stock[order.offer_id][1]
+        events.publish(events.ORDER_PLACED, order.model_dump(mode="json"), producer_id=producer_id, buyer_id=order.buyer_id)
+    for offer_id, (quantity, producer_id, category) in stock.items():
+        events.publish(events.OFFER_STOCK, {"id": offer_id, "quantity": quantity}, producer_id=producer_id, category=category)
 
 @router.post("/orders", response_model=OrderPublic)
-def place_order(body: OrderCreate, user: User = Depends(require_role(UserRole.BUYER)), session: Session = Depends(get_session)):
-    offer = session.get(Offer, body.offer_id)
-    if not offer or not offer.active:
-        raise HTTPException(status_code=404, detail="Not found")
-    if body.quantity > offer.quantity:
-        raise HTTPException(status_code=400, detail="Validation error: quantity exceeds available offer quantity")
+def place_order(body: OrderCreate, user: CurrentPrincipal = Depends(require_role(UserRole.BUYER)), session: Session = Depends(get_session)):
+    reserved = reserve(session, body.offer_id, body.quantity)
     order = Order(
         buyer_id=user.id,
-        offer_id=offer.id,
+        offer_id=body.offer_id,
         quantity=body.quantity,
-        unit_price_snapshot=offer.unit_price,
+        unit_price_snapshot=reserved.unit_price,
     )
     session.add(order)
     session.commit()
     session.refresh(order)
+    read_cache.invalidate_offers([body.offer_id])
+    _publish_orders([OrderPublic.model_validate(order)], {body.offer_id: tuple(reserved[1:])})
     return order
 
-@router.get("/orders/mine", response_model=List[OrderPublic])
-def my_orders(user: User = Depends(require_role(UserRole.BUYER)), session: Session = Depends(get_session)):
-    return session.query(Order).where(Order.buyer_id == user.id).order_by(Order.created_at.desc()).all()
+@router.post("/orders/batch", response_model=OrderBatchResult)
+def place_orders_batch(body: OrderBatchCreate, user: CurrentPrincipal = Depends(require_role(UserRole.BUYER)), session: Session = Depends(get_session)):
+    offer_ids = {item.offer_id for item in body.items}
+    offers = {o.id: o for o in session.exec(select(Offer).where(col(Offer.id).in_(offer_ids))).all()}
+
+    # Validate every line against the loaded stock, consuming it in line order.
+    available = {offer_id: offer.quantity for offer_id, offer in offers.items() if offer.active}
+    wanted: Dict[int, int] = {}
+    errors: Dict[int, str] = {}
+    for index, item in enumerate(body.items):
+        if item.offer_id not in available:
+            errors[index] = "Not found"
+        elif item.quantity > available[item.offer_id]:
+            errors[index] = "Validation error: quantity exceeds available offer quantity"
+        else:
+            available[item.offer_id] -= item.quantity
+            wanted[item.offer_id] = wanted.get(item.offer_id, 0) + item.quantity
+    if errors and body.mode == "all_or_nothing":
+        raise HTTPException(status_code=400, detail=[{"index": i, "error": e} for i, e in sorted(errors.items())])
+
+    prices = {index: offers[item.offer_id].unit_price for index, item in enumerate(body.items) if index not in errors}
+    # The loaded rows still hold the pre-reservation quantities.
+    stock = {
+        offer_id: (offers[offer_id].quantity - quantity, offers[offer_id].producer_id, offers[offer_id].product_category)
+        for offer_id, quantity in wanted.items()
+    }
+    if wanted and not reserve_many(session, wanted, offers):
+        # Another transaction touched one of the offers since we loaded them:
+        # start over and reserve line by line.
+        session.rollback()
+        prices, stock = {}, {}
+        for index, item in enumerate(body.items):
+            if index in errors:
+                continue
+            try:
+                reserved = reserve(session, item.offer_id, item.quantity)
+                prices[index] = reserved.unit_price
+                stock[item.offer_id] = tuple(reserved[1:])
+            except HTTPException as exc:
+                if body.mode == "all_or_nothing":
+                    raise HTTPException(status_code=exc.status_code, detail=[{"index": index, "error": exc.detail}])
+                errors[index] = exc.detail
+
+    now = datetime.utcnow()
+    placed = [
+        (index, {
+            "buyer_id": user.id,
+            "offer_id": item.offer_id,
+            "quantity": item.quantity,
+            "unit_price_snapshot": prices[index],
+            "status": OrderStatus.PLACED,
+            "created_at": now,
+        })
+        for index, item in enumerate(body.items)
+        if index not in errors
+    ]
+    results = [OrderBatchItemResult(index=index, error=error) for index, error in errors.items()]
+    if placed:
+        table = Order.__table__
+        # One multi-row INSERT; sort_by_parameter_order returns the ids in the
+        # order of the parameter rows, which is not guaranteed otherwise.
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        ids = session.connection().execute(stmt, [row for _, row in placed]).scalars().all()
+        results += [
+            OrderBatchItemResult(index=index, order=OrderPublic(id=order_id, **row))
+            for (index, row), order_id in zip(placed, ids)
+        ]
+    session.commit()
+    if placed:
+        read_cache.invalidate_offers(stock)
+        _publish_orders([r.order for r in results if r.order is not None], stock)
+    results.sort(key=lambda r: r.index)
+    return OrderBatchResult(placed=len(placed), rejected=len(errors), items=results)
+
+@router.post("/orders/match", response_model=MatchResult)
+async def match_order(request: Request, body: MatchCreate, user: CurrentPrincipal = Depends(require_role(UserRole.BUYER))):
+    """Fill a demand across the cheapest matching offers, oldest first at equal prices."""
+    result = await matching.submit(user.id, body)
+    # The matcher writes on its own session, so get_session cannot mark this client.
+    note_write(request)
+    return result
+
+def _parse_expand(expand: Optional[str], allowed: Set[str]) -> Set[str]:
+    if not expand:
+        return set()
+    requested = {e.strip() for e in expand.split(",") if e.strip()}
+    unknown = sorted(requested - allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Validation error: unknown expand: {', '.join(unknown)}")
+    return requested
+
+def _order_page(session: Session, stmt, expand: Set[str], party: str, limit: int, cursor: Optional[str]) -> dict:
+    """One page of orders, newest first, with the requested related rows joined in.
+
+    ``stmt`` selects the order columns already joined to offer; ``party`` names
+    the other side of the order (producer or buyer), which expands to its user.
+    Everything comes from one joined statement, so the query count does not
+    grow with the page size.
+    """
+    if "offer" in expand:
+        stmt = stmt.add_columns(*(getattr(Offer, name) for name in OFFER_COLUMNS))
+    if party in expand:
+        stmt = stmt.join(Offer.producer if party == "producer" else Order.buyer)
+        stmt = stmt.add_columns(*(getattr(User, name) for name in USER_COLUMNS))
+    after = keyset_after(col(Order.created_at), col(Order.id), cursor)
+    if after is not None:
+        stmt = stmt.where(after)
+    rows = session.exec(stmt.order_by(col(Order.created_at).desc(), col(Order.id).desc()).limit(limit + 1)).all()
+
+    items = []
+    for row in rows[:limit]:
+        item = dict(zip(ORDER_COLUMNS, row))
+        rest = row[len(ORDER_COLUMNS):]
+        if "offer" in expand:
+            item["offer"] = dict(zip(OFFER_COLUMNS, rest))
+            rest = rest[len(OFFER_COLUMNS):]
+        if party in expand:
+            item[party] = dict(zip(USER_COLUMNS, rest))
+        items.append(item)
+    # By position: the joined offer and user have their own id and created_at.
+    next_cursor = encode_cursor(items[-1]["created_at"], items[-1]["id"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/orders/mine", response_model=OrderPage)
+def my_orders(
+    expand: Optional[str] = Query(None, description="Comma-separated: offer, producer"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: CurrentPrincipal = Depends(require_role(UserRole.BUYER)),
+    session: Session = Depends(get_read_session),
+):
+    """The caller's orders, newest first."""
+    expanded = _parse_expand(expand, {"offer", "producer"})
+    stmt = select(*(getattr(Order, name) for name in ORDER_COLUMNS)).where(Order.buyer_id == user.id)
+    if expanded:
+        stmt = stmt.join(Order.offer)
+    return fast_json.respond(_order_page(session, stmt, expanded, "producer", limit, cursor))
+
+@router.get("/producer/orders", response_model=OrderPage)
+def producer_orders(
+    expand: Optional[str] = Query(None, description="Comma-separated: offer, buyer"),
+    offer_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: CurrentPrincipal = Depends(require_role(UserRole.PRODUCER)),
+    session: Session = Depends(get_read_session),
+):
+    """Orders placed on the caller's offers, newest first."""
+    expanded = _parse_expand(expand, {"offer", "buyer"})
+    stmt = (
+        select(*(getattr(Order, name) for name in ORDER_COLUMNS))
+        .join(Order.offer)
+        .where(Offer.producer_id == user.id)
+    )
+    if offer_id is not None:
+        stmt = stmt.where(Order.offer_id == offer_id)
+    return fast_json.respond(_order_page(session, stmt, expanded, "buyer", limit, cursor))
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import func
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request, Response
+from sqlmodel import Session
 
-from database import get_session
-from models import Offer, User, UserRole
+import read_cache
+import stats
+from database import DBRoute, get_read_session
 from schemas import StatsOverview
 
 
-router = APIRouter(prefix="/api/stats", tags=["stats"])
+router = APIRouter(prefix="/api/stats", tags=["stats"], route_class=DBRoute)
 
 
 @router.get("/overview", response_model=StatsOverview)
-def get_overview_stats(session: Session = Depends(get_session)):
-    active_offers = session.exec(select(func.count(Offer.id)).where(Offer.active == True)).one()
-    producers = session.exec(select(func.count(User.id)).where(User.role == UserRole.PRODUCER)).one()
-    buyers = session.exec(select(func.count(User.id)).where(User.role == UserRole.BUYER)).one()
-
-    return StatsOverview(active_offers=active_offers, producers=producers, buyers=buyers)
+def get_overview_stats(request: Request, response: Response, session: Session = Depends(get_read_session)):
+    overview, etag = stats.get_overview(session)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(stats.STATS_TTL_SECONDS)}, "
+                         f"stale-while-revalidate={int(stats.STATS_STALE_SECONDS)}",
+    }
+    if read_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return overview
@@ -1,7 +1,7 @@
-from typing import Optional, List
+from typing import List, Literal, Optional
 from datetime import datetime
-from sqlmodel import SQLModel
-from models import UserRole, OrderStatus
+from sqlmodel import Field, SQLModel
+from models import NegotiationStatus, UserRole, OrderStatus
 
 # Auth
 class RegisterRequest(SQLModel):
@@ -18,6 +18,10 @@ class TokenResponse(SQLModel):
     token_type: str = "bearer"
     user: "UserPublic"
 
+class EventsTicket(SQLModel):
+    ticket: str
+    expires_in: int
+
 class UserPublic(SQLModel):
     id: int
     email: str
@@ -25,10 +29,18 @@ class UserPublic(SQLModel):
     created_at: datetime
 
 
+class CategoryCount(SQLModel):
+    category: str
+    active_offers: int
+
 class StatsOverview(SQLModel):
     active_offers: int
     producers: int
     buyers: int
+    orders: int = 0
+    ordered_quantity: int = 0
+    order_value: float = 0.0
+    categories: List[CategoryCount] = []
 
 # Offer
 class OfferBase(SQLModel):
@@ -61,13 +73,54 @@ class OfferUpdate(SQLModel):
 class OfferPublic(OfferBase):
     id: int
     producer_id: int
+    unit_price_base: Optional[float] = None  # unit_price in the base currency
+    latitude: Optional[float] = None  # geocoded from location
+    longitude: Optional[float] = None
     created_at: datetime
     updated_at: datetime
 
+class OfferImportError(SQLModel):
+    row: int
+    error: str
+
+class OfferImportResult(SQLModel):
+    processed: int
+    imported: int
+    rejected: int
+    errors: List[OfferImportError]
+
+class OfferListItem(OfferPublic):
+    # Set when the listing is requested with ?currency=.
+    display_price: Optional[float] = None
+    display_currency: Optional[str] = None
+    distance_km: Optional[float] = None  # set when the listing is requested with ?near=
+
+class OfferPage(SQLModel):
+    items: List[OfferListItem]
+    next_cursor: Optional[str] = None
+
+class FacetValue(SQLModel):
+    value: str
+    count: int
+
+class PriceBucket(SQLModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class OfferFacets(SQLModel):
+    # Each facet is counted with every filter except its own.
+    total: int
+    categories: List[FacetValue]
+    locations: List[FacetValue]
+    currencies: List[FacetValue]
+    price_buckets: List[PriceBucket]  # bounds in display_currency
+    display_currency: str
+
 # Order
 class OrderCreate(SQLModel):
     offer_id: int
-    quantity: int
+    quantity: int = Field(gt=0)
 
 class OrderPublic(SQLModel):
     id: int
@@ -77,3 +130,98 @@ class OrderPublic(SQLModel):
     unit_price_snapshot: float
     status: OrderStatus
     created_at: datetime
+
+class OrderDetail(OrderPublic):
+    # Set when requested with ?expand=.
+    offer: Optional[OfferPublic] = None
+    producer: Optional[UserPublic] = None  # GET /api/orders/mine
+    buyer: Optional[UserPublic] = None  # GET /api/producer/orders
+
+class OrderPage(SQLModel):
+    items: List[OrderDetail]
+    next_cursor: Optional[str] = None
+
+class OrderBatchCreate(SQLModel):
+    items: List[OrderCreate] = Field(min_length=1, max_length=500)
+    # all_or_nothing: any invalid line rejects the whole batch (400).
+    # partial: valid lines are placed, invalid ones are reported per item.
+    mode: Literal["all_or_nothing", "partial"] = "all_or_nothing"
+
+class OrderBatchItemResult(SQLModel):
+    index: int
+    order: Optional[OrderPublic] = None
+    error: Optional[str] = None
+
+class OrderBatchResult(SQLModel):
+    placed: int
+    rejected: int
+    items: List[OrderBatchItemResult]
+
+class MatchCreate(SQLModel):
+    product_category: str
+    product_name: Optional[str] = None  # prefix, case-insensitive; any product of the category when omitted
+    quantity: int = Field(gt=0)
+    max_price: float = Field(gt=0)
+    currency: str = "PLN"
+    location: Optional[str] = None
+    # fill_or_kill: place nothing unless the whole quantity can be filled.
+    # partial: place whatever fills within max_price.
+    mode: Literal["fill_or_kill", "partial"] = "fill_or_kill"
+
+class MatchResult(SQLModel):
+    filled: int
+    remaining: int
+    average_price: Optional[float] = None
+    orders: List[OrderPublic]
+
+# Negotiation
+class NegotiationCreate(SQLModel):
+    offer_id: int
+    quantity: int = Field(gt=0)
+    unit_price: float = Field(gt=0)
+
+class BidCreate(SQLModel):
+    unit_price: float = Field(gt=0)
+    quantity: Optional[int] = Field(default=None, gt=0)  # unchanged when omitted
+
+class BidPublic(SQLModel):
+    id: int
+    author_id: int
+    author_role: UserRole
+    quantity: int
+    unit_price: float
+    created_at: datetime
+
+class NegotiationPublic(SQLModel):
+    id: int
+    offer_id: int
+    buyer_id: int
+    producer_id: int
+    status: NegotiationStatus
+    quantity: int
+    unit_price: float
+    last_bid_by: UserRole
+    order_id: Optional[int] = None
+    expires_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
+class NegotiationDetail(NegotiationPublic):
+    bids: List[BidPublic]
+
+class NegotiationPage(SQLModel):
+    items: List[NegotiationPublic]
+    next_cursor: Optional[str] = None
+
+class AutoResponderConfig(SQLModel):
+    enabled: bool = True
+    reserve_ratio: float = Field(default=0.9, gt=0, le=1)
+    concession_exponent: float = Field(default=1.0, gt=0)
+    max_rounds: int = Field(default=3, ge=1, le=50)
+    volume_threshold: Optional[int] = Field(default=None, gt=0)
+    volume_discount: float = Field(default=0.0, ge=0, lt=1)
+    repeat_buyer_discount: float = Field(default=0.0, ge=0, lt=1)
+
+class AutoResponderPublic(AutoResponderConfig):
+    producer_id: int
+    updated_at: datetime
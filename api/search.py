@@ -0,0 +1,136 @@
+"""Full-text search over offers.
+
+A shadow index keyed by offer id is kept next to the ``offer`` table: an FTS5
+virtual table on SQLite, a tsvector column with a GIN index on Postgres.
+Indexed text and queries are both folded (lower-case, diacritics stripped), so
+"Pręt" and "pret" match the same offers.
+"""
+import re
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import Float, Integer, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session
+
+from models import Offer
+
+SEARCH_COLUMNS = ("product_name", "description", "sku", "product_category")
+# bm25 / ts_rank weights, in SEARCH_COLUMNS order.
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0, 2.0)
+PG_WEIGHTS = ("A", "D", "B", "C")
+
+REBUILD_BATCH_SIZE = 1000
+MAX_QUERY_TERMS = 8
+
+# Letters NFKD does not decompose into base letter + combining mark.
+_EXTRA_FOLDS = str.maketrans({"ł": "l", "Ł": "L", "đ": "d", "Đ": "D", "ø": "o", "Ø": "O", "ß": "ss"})
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value.translate(_EXTRA_FOLDS))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def query_terms(q: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(q))[:MAX_QUERY_TERMS]
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def ensure_index(engine: Engine) -> None:
+    """Create the shadow index if needed and backfill it when it is empty."""
+    with engine.begin() as conn:
+        if _dialect(conn) == "postgresql":
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS offer_search ("
+                " offer_id INTEGER PRIMARY KEY REFERENCES offer (id) ON DELETE CASCADE,"
+                " document tsvector NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_offer_search_document ON offer_search USING GIN (document)"
+            ))
+            indexed = conn.execute(text("SELECT count(*) FROM offer_search")).scalar_one()
+        else:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS offer_fts USING fts5({', '.join(SEARCH_COLUMNS)})"
+            ))
+            indexed = conn.execute(text("SELECT count(*) FROM offer_fts")).scalar_one()
+        if not indexed:
+            rebuild_index(conn)
+
+
+def rebuild_index(conn: Connection, last_id: int = 0) -> None:
+    """(Re)index every offer with an id above ``last_id``."""
+    while True:
+        rows = conn.execute(
+            text(
+                f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM offer WHERE id > :last ORDER BY id LIMIT :n"
+            ),
+            {"last": last_id, "n": REBUILD_BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        index_rows(conn, [dict(row._mapping) for row in rows])
+        last_id = rows[-1].id
+
+
+def index_offer(session: Session, offer: Offer) -> None:
+    """Upsert one offer into the search index; call before the session commits."""
+    if offer.id is None:
+        session.flush()
+    index_rows(session.connection(), [{"id": offer.id, **{c: getattr(offer, c) for c in SEARCH_COLUMNS}}])
+
+
+def index_rows(conn: Connection, rows: List[dict]) -> None:
+    """Upsert index entries for raw offer rows (id plus SEARCH_COLUMNS)."""
+    if not rows:
+        return
+    params = [{"id": row["id"], **{c: fold(row[c]) for c in SEARCH_COLUMNS}} for row in rows]
+    if _dialect(conn) == "postgresql":
+        document = " || ".join(
+            f"setweight(to_tsvector('simple', :{c}), '{w}')" for c, w in zip(SEARCH_COLUMNS, PG_WEIGHTS)
+        )
+        conn.execute(
+            text(
+                f"INSERT INTO offer_search (offer_id, document) VALUES (:id, {document}) "
+                "ON CONFLICT (offer_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            params,
+        )
+    else:
+        conn.execute(
+            text(
+                f"INSERT OR REPLACE INTO offer_fts (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"
+            ),
+            params,
+        )
+
+
+def match(session: Session, q: str):
+    """Subquery of (offer_id, rank) for offers matching every term of ``q`` as a prefix.
+
+    Lower rank means a better match. Returns None when ``q`` has no searchable terms.
+    """
+    terms = query_terms(q)
+    if not terms:
+        return None
+    if _dialect(session.get_bind()) == "postgresql":
+        weights = "'{0.1, 0.2, 0.4, 1.0}'"
+        stmt = text(
+            f"SELECT offer_id, -ts_rank({weights}, document, to_tsquery('simple', :terms)) AS rank "
+            "FROM offer_search WHERE document @@ to_tsquery('simple', :terms)"
+        ).bindparams(terms=" & ".join(f"{t}:*" for t in terms))
+    else:
+        weights = ", ".join(str(w) for w in SQLITE_WEIGHTS)
+        stmt = text(
+            f"SELECT rowid AS offer_id, bm25(offer_fts, {weights}) AS rank "
+            "FROM offer_fts WHERE offer_fts MATCH :terms"
+        ).bindparams(terms=" ".join(f'"{t}"*' for t in terms))
+    return stmt.columns(offer_id=Integer, rank=Float).subquery("search_hits")
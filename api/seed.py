@@ -1,11 +1,18 @@
 # seed.py
 # Minimal, idempotent seeding for demo users/offers/orders.
-# Uses bcrypt_sha256 via auth.hash_password (no 72B limit).
+# Uses bcrypt_sha256 via hashing.hash_password (no 72B limit).
+# python seed.py --offers 100000 also bulk-inserts a synthetic catalog (bench/data.py).
+
+import argparse
 
 from sqlmodel import Session, select
-from database import engine, create_db_and_tables
+from database import engine
 from models import User, Offer, Order, UserRole
-from auth import hash_password
+from hashing import hash_password
+from search import index_offer
+import fx
+import geo
+import migrate
 
 
 def ensure_user(session: Session, email: str, password: str, role: UserRole) -> User:
@@ -30,13 +37,15 @@ def ensure_offer(session: Session, **kwargs) -> Offer:
     """Create a fresh offer (caller ensures duplicates are not created)."""
     offer = Offer(**kwargs)
     session.add(offer)
+    geo.index_offer(session, offer)
+    index_offer(session, offer)
     session.commit()
     session.refresh(offer)
     return offer
 
 
 def run() -> None:
-    create_db_and_tables()
+    migrate.upgrade(engine)
     with Session(engine) as s:
         # Demo users
         producer = ensure_user(s, "producer@example.com", "Passw0rd!", UserRole.PRODUCER)
@@ -326,6 +335,9 @@ def run() -> None:
             for offer_data in offers_seed_data:
                 ensure_offer(s, **offer_data)
 
+    # Offers above are created without a base-currency price; fill it in.
+    fx.load_rates()
+
     print(
         "Seed done.\nLogins:\n"
         "  producer@example.com / Passw0rd!\n"
@@ -333,5 +345,23 @@ def run() -> None:
     )
 
 
+def synthetic(offers: int, producers: int, buyers: int, orders: int) -> None:
+    """Bulk-add a synthetic catalog on top of the demo data (see bench/data.py)."""
+    from bench.data import populate
+
+    ids = populate(engine, offers, producers=producers, buyers=buyers, orders=orders,
+                   password_hash=hash_password("Passw0rd!"))
+    print(f"Added {offers} offers, {producers} producers, {buyers} buyers, {orders} orders: {ids['offers']}")
+    print("Synthetic logins: bench@example.com, producer<n>@example.com, buyer<n>@example.com / Passw0rd!")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed demo users, offers and orders.")
+    parser.add_argument("--offers", type=int, default=0, help="also bulk-insert this many synthetic offers")
+    parser.add_argument("--producers", type=int, default=10)
+    parser.add_argument("--buyers", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=0)
+    args = parser.parse_args()
     run()
+    if args.offers:
+        synthetic(args.offers, args.producers, args.buyers, args.orders)
@@ -0,0 +1,39 @@
+"""Process settings: environment variables, with api/.env filling in the unset ones.
+
+The .env file is parsed once, on the first lookup, whichever module asks
+first, and is never copied into os.environ. Modules keep reading their
+settings into constants at import time through the typed getters below.
+"""
+import functools
+import os
+from typing import Dict, Optional
+
+from dotenv import dotenv_values
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+TRUE = ("1", "true", "yes")
+
+
+@functools.lru_cache(maxsize=None)
+def _dotenv() -> Dict[str, Optional[str]]:
+    return dotenv_values(ENV_FILE) if os.path.exists(ENV_FILE) else {}
+
+
+def get(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.environ.get(name)
+    if value is None:
+        value = _dotenv().get(name)
+    return default if value is None else value
+
+
+def get_int(name: str, default: int) -> int:
+    return int(get(name, str(default)))
+
+
+def get_float(name: str, default: float) -> float:
+    return float(get(name, str(default)))
+
+
+def get_bool(name: str, default: bool) -> bool:
+    value = get(name)
+    return default if value is None else value.lower() in TRUE
@@ -0,0 +1,97 @@
+"""Marketplace statistics: a handful of grouped aggregates, cached in-process.
+
+The snapshot is served from memory for STATS_TTL_SECONDS. After that, for up
+to STATS_STALE_SECONDS more, the stale snapshot is still returned while a
+single background thread recomputes it; only a cold or very old cache makes a
+request wait for the queries.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+import settings
+from database import engine
+from models import Offer, Order, User, UserRole
+from schemas import CategoryCount, StatsOverview
+
+STATS_TTL_SECONDS = settings.get_float("STATS_TTL_SECONDS", 30)
+STATS_STALE_SECONDS = settings.get_float("STATS_STALE_SECONDS", 300)
+STATS_TOP_CATEGORIES = settings.get_int("STATS_TOP_CATEGORIES", 20)
+
+_lock = threading.Lock()
+_snapshot: Optional[Tuple[float, StatsOverview, str]] = None  # (computed_at, stats, etag)
+_refreshing = False
+
+
+def compute_overview(session: Session) -> StatsOverview:
+    """Three grouped queries in place of one COUNT(*) per figure."""
+    roles = dict(session.exec(select(User.role, func.count()).group_by(User.role)).all())
+    # Covered by ix_offer_active_category_created, so this never reads the offer rows.
+    categories = session.exec(
+        select(Offer.product_category, func.count())
+        .where(Offer.active == True)
+        .group_by(Offer.product_category)
+    ).all()
+    orders, ordered_quantity, order_value = session.exec(
+        select(
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.quantity), 0),
+            func.coalesce(func.sum(Order.quantity * Order.unit_price_snapshot), 0.0),
+        )
+    ).one()
+
+    categories = sorted(categories, key=lambda c: (-c[1], c[0]))
+    return StatsOverview(
+        active_offers=sum(count for _, count in categories),
+        producers=roles.get(UserRole.PRODUCER, 0),
+        buyers=roles.get(UserRole.BUYER, 0),
+        orders=orders,
+        ordered_quantity=ordered_quantity,
+        order_value=round(order_value, 2),
+        categories=[CategoryCount(category=name, active_offers=count) for name, count in categories[:STATS_TOP_CATEGORIES]],
+    )
+
+
+def _etag(stats: StatsOverview) -> str:
+    digest = hashlib.sha1(json.dumps(stats.model_dump(), sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _store(stats: StatsOverview) -> Tuple[StatsOverview, str]:
+    global _snapshot
+    etag = _etag(stats)
+    with _lock:
+        _snapshot = (time.monotonic(), stats, etag)
+    return stats, etag
+
+
+def _refresh_in_background() -> None:
+    global _refreshing
+    try:
+        with Session(engine) as session:
+            _store(compute_overview(session))
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def get_overview(session: Session) -> Tuple[StatsOverview, str]:
+    """Returns (stats, etag), recomputing synchronously only when there is nothing usable cached."""
+    global _refreshing
+    with _lock:
+        snapshot = _snapshot
+        age = time.monotonic() - snapshot[0] if snapshot else None
+        if age is not None and age < STATS_TTL_SECONDS:
+            return snapshot[1], snapshot[2]
+        if age is not None and age < STATS_TTL_SECONDS + STATS_STALE_SECONDS:
+            if not _refreshing:
+                _refreshing = True
+                threading.Thread(target=_refresh_in_background, daemon=True).start()
+            return snapshot[1], snapshot[2]
+    return _store(compute_overview(session))
+
@@ -0,0 +1,45 @@
+"""Tests run from api/ (``python -m pytest -q``) against a fresh, migrated SQLite database.
+
+Settings are read at import time, so the environment is set before any app module loads.
+"""
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+_DB_DIR = tempfile.mkdtemp(prefix="api-tests-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ["AGENT_TICK_SECONDS"] = "0"
+os.environ["FX_RATES_FILE"] = os.path.join(API_DIR, "fx_rates.json")
+
+import pytest
+from sqlmodel import Session
+
+
+@pytest.fixture(scope="session")
+def engine():
+    import fx
+    import migrate
+    from database import engine
+
+    migrate.upgrade(engine)
+    fx.load_rates()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def producer_id(session) -> int:
+    from models import User, UserRole
+
+    user = User(email=f"producer{os.urandom(4).hex()}@example.com", password_hash="-", role=UserRole.PRODUCER)
+    session.add(user)
+    session.commit()
+    return user.id
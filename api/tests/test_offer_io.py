@@ -0,0 +1,29 @@
+import io
+
+from sqlmodel import select
+
+import offer_io
+from models import Offer
+
+HEADER = "product_name,product_category,quantity,unit_of_measure,unit_price,currency,location,sku\n"
+
+
+def _import(session, producer_id, body: str):
+    return offer_io.import_offers(session, producer_id, io.BytesIO((HEADER + body).encode()), "csv")
+
+
+def test_duplicate_sku_in_one_chunk_rejects_the_superseded_row(session, producer_id):
+    result = _import(session, producer_id, (
+        "First,Agricultural,1,kg,2,PLN,Kraków,DUP\n"
+        "Broken,Agricultural,many,kg,2,PLN,Kraków,OTHER\n"
+        "Second,Agricultural,2,kg,2,PLN,Kraków,DUP\n"
+        "Plain,Agricultural,3,kg,2,PLN,Kraków,\n"
+    ))
+
+    assert (result.processed, result.imported, result.rejected) == (4, 2, 2)
+    assert result.processed == result.imported + result.rejected
+    errors = {e.row: e.error for e in result.errors}
+    assert errors[2] == "duplicate sku DUP, superseded by row 4"
+    assert errors[3].startswith("quantity")
+    names = session.exec(select(Offer.product_name).where(Offer.producer_id == producer_id, Offer.sku == "DUP")).all()
+    assert names == ["Second"]
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from read_cache import etag_matches
+
+
+def test_etag_matches_parses_the_entity_tag_list():
+    etag = 'W/"abc"'
+    assert etag_matches('"x", W/"abc" , "y"', etag)
+    assert etag_matches('"abc"', etag)  # weak comparison ignores W/
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"abcd", "xabc"', etag)  # contains the text, but no tag is equal
+    assert not etag_matches('"ab", "c"', 'W/"ab, c"')
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_offer_list_revalidates_with_a_multi_value_if_none_match(engine):
+    from main import app
+
+    with TestClient(app) as client:
+        first = client.get("/api/offers")
+        etag = first.headers["etag"]
+        assert first.status_code == 200
+
+        assert client.get("/api/offers", headers={"If-None-Match": f'"other", {etag}'}).status_code == 304
+        assert client.get("/api/offers", headers={"If-None-Match": "*"}).status_code == 304
+        assert client.get("/api/offers", headers={"If-None-Match": f'"other", {etag[:-2]}"'}).status_code == 200
@@ -1,18 +1,19 @@
 "use client";
 import Link from "next/link";
 import { useEffect, useState } from "react";
-import { apiFetch } from "@/lib/api";
+import { apiFetch, subscribeEvents } from "@/lib/api";
 
 export default function OffersPage() {
   const [offers, setOffers] = useState<any[]>([]);
-  const [stats, setStats] = useState<{ active_offers: number; producers: number; buyers: number } | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [stats, setStats] = useState<{ active_offers: number; producers: number; buyers: number; orders: number } | null>(null);
   const [q, setQ] = useState("");
   const [category, setCategory] = useState("");
   const [min_price, setMin] = useState("");
   const [max_price, setMax] = useState("");
   const [location, setLocation] = useState("");
 
-  async function load() {
+  async function load(cursor?: string) {
     const params = new URLSearchParams();
     if (q) params.set("q", q);
     if (category) params.set("category", category);
@@ -20,18 +21,30 @@ export default function OffersPage() {
     if (max_price) params.set("max_price", max_price);
     if (location) params.set("location", location);
     params.set("active", "true");
-    const data = await apiFetch(`/api/offers?${params.toString()}`);
-    setOffers(data);
+    if (cursor) params.set("cursor", cursor);
+    const data = await apiFetch<{ items: any[]; next_cursor: string | null }>(`/api/offers?${params.toString()}`);
+    setOffers((prev) => (cursor ? [...prev, ...data.items] : data.items));
+    setNextCursor(data.next_cursor);
   }
 
   async function loadStats() {
-    const data = await apiFetch<{ active_offers: number; producers: number; buyers: number }>("/api/stats/overview");
+    const data = await apiFetch<{ active_offers: number; producers: number; buyers: number; orders: number }>("/api/stats/overview");
     setStats(data);
   }
 
   useEffect(() => {
     load();
     loadStats();
+    // Live updates instead of re-fetching: patch changed offers in place.
+    return subscribeEvents(({ type, data }) => {
+      if (type === "offer.updated" || type === "offer.stock") {
+        setOffers((prev) => prev.map((o) => (o.id === data.id ? { ...o, ...data } : o)));
+      } else if (type === "offer.created") {
+        setOffers((prev) => (prev.some((o) => o.id === data.id) ? prev : [data, ...prev]));
+      } else if (type === "overflow" || type === "offers.imported") {
+        load();
+      }
+    }, { types: "offer.created,offer.updated,offer.stock,offers.imported" });
   }, []);
 
   return (
@@ -45,7 +58,7 @@ export default function OffersPage() {
                 Wybierz <span className="headline__gradient">najlepszą ofertę</span> dla swojego biznesu
               </h1>
               <div className="hero__cta">
-                <button onClick={load} className="btn">
+                <button onClick={() => load()} className="btn">
                   Odśwież wyniki
                 </button>
                 <Link href="/offers/new" className="btn btn--ghost">
@@ -72,6 +85,10 @@ export default function OffersPage() {
                     <div className="device__stat-label muted">Konta kupujących</div>
                     <div className="device__stat-value">{stats ? stats.buyers : "..."}</div>
                   </div>
+                  <div className="device__stat">
+                    <div className="device__stat-label muted">Złożone zamówienia</div>
+                    <div className="device__stat-value">{stats ? stats.orders : "..."}</div>
+                  </div>
                 </div>
               </div>
             </div>
@@ -101,7 +118,7 @@ export default function OffersPage() {
               <input placeholder="Lokalizacja" className="input" value={location} onChange={(e) => setLocation(e.target.value)} />
             </div>
             <div className="hero__cta" style={{ marginTop: 16 }}>
-              <button onClick={load} className="btn">
+              <button onClick={() => load()} className="btn">
                 Filtruj oferty
               </button>
               <button
@@ -142,6 +159,11 @@ export default function OffersPage() {
                 </Link>
               ))}
             </div>
+            {nextCursor && (
+              <button onClick={() => load(nextCursor)} className="btn btn--ghost">
+                Załaduj więcej
+              </button>
+            )}
             {!offers.length && <div className="muted">Brak ofert spełniających kryteria.</div>}
           </div>
         </div>
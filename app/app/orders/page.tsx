@@ -4,8 +4,18 @@ import { apiFetch } from "@/lib/api";
 
 export default function OrdersPage() {
   const [orders, setOrders] = useState<any[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+  async function load(cursor?: string) {
+    const params = new URLSearchParams({ expand: "offer,producer" });
+    if (cursor) params.set("cursor", cursor);
+    const data = await apiFetch<{ items: any[]; next_cursor: string | null }>(`/api/orders/mine?${params.toString()}`);
+    setOrders((prev) => (cursor ? [...prev, ...data.items] : data.items));
+    setNextCursor(data.next_cursor);
+  }
+
   useEffect(() => {
-    apiFetch("/api/orders/mine").then(setOrders).catch(() => setOrders([]));
+    load().catch(() => setOrders([]));
   }, []);
   return (
     <section>
@@ -18,13 +28,21 @@ export default function OrdersPage() {
                 <span>Order #{o.id}</span>
                 <span className="pill">{o.status}</span>
               </div>
-              <div className="muted text-sm">Oferta: {o.offer_id}</div>
+              <div className="muted text-sm">Oferta: {o.offer?.product_name ?? o.offer_id}</div>
+              {o.producer && <div className="muted text-sm">Producent: {o.producer.email}</div>}
               <div className="product-card__meta">
                 <span>Ilość: {o.quantity}</span>
-                <span className="product-card__price">{o.unit_price_snapshot}</span>
+                <span className="product-card__price">
+                  {o.unit_price_snapshot} {o.offer?.currency}
+                </span>
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <button onClick={() => load(nextCursor)} className="btn btn--ghost">
+              Załaduj więcej
+            </button>
+          )}
           {!orders.length && <div className="muted">Nie masz jeszcze żadnych zamówień.</div>}
         </div>
       </div>
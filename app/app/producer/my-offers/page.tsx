@@ -1,11 +1,21 @@
 "use client";
 import { useEffect, useState } from "react";
-import { apiFetch } from "@/lib/api";
+import { apiFetch, getUser, subscribeEvents } from "@/lib/api";
 
 export default function MyOffersPage() {
   const [offers, setOffers] = useState<any[]>([]);
   useEffect(() => {
-    apiFetch("/api/producer/my-offers").then(setOffers).catch(() => setOffers([]));
+    const reload = () => apiFetch("/api/producer/my-offers").then(setOffers).catch(() => setOffers([]));
+    reload();
+    const user = getUser();
+    if (!user) return;
+    return subscribeEvents(({ type, data }) => {
+      if (type === "offer.updated" || type === "offer.stock") {
+        setOffers((prev) => prev.map((o) => (o.id === data.id ? { ...o, ...data } : o)));
+      } else if (type !== "order.placed") {
+        reload();
+      }
+    }, { producer_id: String(user.id) });
   }, []);
 
   async function toggle(offer: any) {
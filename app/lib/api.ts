@@ -12,7 +12,13 @@ export async function apiFetch<T>(path: string, opts: RequestInit = {}): Promise
   };
   const token = getToken();
   if (token) headers["Authorization"] = `Bearer ${token}`;
-  const res = await fetch(`${API_BASE}${path}`, { ...opts, headers, cache: "no-store" });
+  // GETs revalidate with If-None-Match, so unchanged offers come back as a bodiless 304.
+  const method = (opts.method || "GET").toUpperCase();
+  const res = await fetch(`${API_BASE}${path}`, {
+    cache: method === "GET" ? "no-cache" : "no-store",
+    ...opts,
+    headers,
+  });
   if (!res.ok) {
     const msg = await res.text();
     throw new Error(msg || `HTTP ${res.status}`);
@@ -31,3 +37,47 @@ export function getUser(): { id: number; email: string; role: "PRODUCER" | "BUYE
   const raw = localStorage.getItem("user");
   return raw ? JSON.parse(raw) : null;
 }
+
+export type ServerEvent = { type: string; data: any };
+
+// Server-sent offer/order changes (GET /api/events); returns a function that closes the stream.
+// Signed-in streams authenticate with a short-lived ticket, never the access token, since it ends up
+// in the URL. The ticket expires quickly, so reconnects fetch a new one instead of reusing the old URL.
+export function subscribeEvents(
+  onEvent: (event: ServerEvent) => void,
+  filters: Record<string, string> = {},
+): () => void {
+  const types = filters.types ? filters.types.split(",") : ["offer.created", "offer.updated", "offer.stock", "offers.imported", "order.placed"];
+  let source: EventSource | null = null;
+  let retry: ReturnType<typeof setTimeout> | undefined;
+  let closed = false;
+  const reconnect = () => {
+    if (!closed) retry = setTimeout(open, 3000);
+  };
+  const open = async () => {
+    const params = new URLSearchParams(filters);
+    if (getToken()) {
+      try {
+        const { ticket } = await apiFetch<{ ticket: string }>("/api/events/ticket", { method: "POST" });
+        params.set("ticket", ticket);
+      } catch {
+        return reconnect();
+      }
+    }
+    if (closed) return;
+    source = new EventSource(`${API_BASE}/api/events?${params.toString()}`);
+    for (const type of [...types, "overflow"]) {
+      source.addEventListener(type, (e) => onEvent({ type, data: JSON.parse((e as MessageEvent).data) }));
+    }
+    source.onerror = () => {
+      source?.close();
+      reconnect();
+    };
+  };
+  open();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    source?.close();
+  };
+}